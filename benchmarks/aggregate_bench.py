@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the bincount aggregation kernels behind `daily`, `hourly` and
+`daily_hours` against the original lambda groupbys.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/aggregate_bench.py [events ...]
+
+'''
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import transformations as tr
+
+WEEKDAYS = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
+            5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
+
+
+def legacy_daily(df, how):
+    '''Original lambda groupby `daily`'''
+    key = lambda x: x.isoweekday()
+    if how == 'mean':
+        daily = df.resample('D', how='sum').groupby(key).mean()
+    else:
+        daily = df.groupby(key).sum()
+    return daily.rename(WEEKDAYS)
+
+
+def legacy_hourly(df, how):
+    '''Original lambda groupby `hourly`'''
+    key = lambda x: x.hour
+    if how == 'mean':
+        return df.resample('H', how='sum').groupby(key).mean()
+    return df.groupby(key).sum()
+
+
+def legacy_daily_hours(df, how):
+    '''Original lambda groupby `daily_hours`'''
+    keys = [lambda x: x.isoweekday(), lambda x: x.hour]
+    if how == 'mean':
+        weekly = df.resample('H', how='sum').groupby(keys).mean()
+    else:
+        weekly = df.groupby(keys).sum()
+    weekly = weekly.unstack(0)['Events']
+    weekly.index.name = 'Hour'
+    return weekly.rename(columns=WEEKDAYS)
+
+
+def events(count):
+    '''Bursty events: exponential gaps with a daily cycle in the rate'''
+    gaps = np.random.exponential(10, count)
+    gaps *= 1.5 + np.sin(np.cumsum(gaps) * 2 * np.pi / 86400)
+    stamps = pd.Timestamp('1/1/2013').value + \
+        (np.cumsum(gaps) * 10**9).astype(np.int64)
+    return pd.DatetimeIndex(stamps.view('M8[ns]'))
+
+
+def timed(func):
+    '''Seconds taken by func(), and its result'''
+    start = time.time()
+    result = func()
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [1000000, 10000000]
+    cases = [('daily', legacy_daily, tr.daily.frame),
+             ('hourly', legacy_hourly, tr.hourly.frame),
+             ('daily_hours', legacy_daily_hours, tr.daily_hours)]
+    for size in sizes:
+        index = events(size)
+        df = tr.to_frame(index)
+        for name, legacy, kernel in cases:
+            for how in ['sum', 'mean']:
+                old, expected = timed(lambda: legacy(df, how))
+                new, result = timed(lambda: kernel(df=index, how=how))
+                pdtest.assert_frame_equal(result, expected)
+                print('{0:>9} events {1:>12} {2:<5}: legacy {3:.3f}s, '
+                      'bincount {4:.3f}s ({5:.1f}x)'
+                      .format(size, name, how, old, new, old / new))
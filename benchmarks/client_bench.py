@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark `mcflyin.client.Client` against the approach of the example
+client in examples/marty.py: a new connection per call, form-encoded JSON
+lists of timestamp strings, and DataFrames rebuilt from the JSON response.
+
+A Flask server is started in a subprocess. Each size of event list is sent
+through the same four transformations: one call at a time with the example
+approach, one call at a time with the client, and all four at once with
+`Client.map`.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/client_bench.py [sizes...]
+
+'''
+from __future__ import print_function, division
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import requests
+from mcflyin.client import Client
+
+PORT = 5200
+SERVER = 'from mcflyin import application; application.app.run(port={0})'
+CALLS = [('resample', {'freq': {'H': 'Hourly'}}),
+         ('hourly', {'how': 'mean'}),
+         ('daily_hours', {}),
+         ('forward', {'periods': 180})]
+
+
+def start(port):
+    '''Start the Flask server on `port` and wait until it answers'''
+    process = subprocess.Popen([sys.executable, '-c', SERVER.format(port)])
+    url = 'http://127.0.0.1:{0}'.format(port)
+    for _ in range(100):
+        try:
+            requests.post(url + '/daily_hours',
+                          data={'data': json.dumps(['2013-06-16'])})
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('Server did not start')
+
+
+def legacy_frame(response):
+    '''The example client's DataFrame rebuild, kept for comparison'''
+    if len(response) == 1:
+        key = list(response.keys())[0]
+        index = pd.to_datetime(response[key]['time'])
+        return pd.DataFrame({key: response[key]['data']}, index=index)
+    concat = []
+    for day, data in response.items():
+        concat.append(pd.DataFrame({day: data['data']}, index=data['time']))
+    return pd.concat(concat, axis=1)
+
+
+def legacy(url, data, name, params):
+    '''One call the way examples/marty.py makes it'''
+    send = dict((k, json.dumps(v)) for k, v in params.items())
+    send['data'] = json.dumps(data)
+    r = requests.post(url + '/' + name, data=send)
+    r.raise_for_status()
+    return legacy_frame(r.json())
+
+
+def events(size):
+    '''`size` bursty ISO timestamp strings over a few months'''
+    np.random.seed(0)
+    start = pd.Timestamp('6/16/2013').value
+    gaps = np.random.exponential(8e9 * 10**6 / size, size)
+    stamps = start + gaps.cumsum().astype(np.int64)
+    return [x.isoformat() for x in pd.DatetimeIndex(stamps.view('M8[ns]'))]
+
+
+def best(func, repeat=3):
+    '''Best wall time of `repeat` calls of `func`'''
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(sizes):
+    process, url = start(PORT)
+    client = Client(url)
+    try:
+        print('{0:>10} {1:>10} {2:>10} {3:>10}'.format(
+            'events', 'example', 'client', 'map'))
+        for size in sizes:
+            data = events(size)
+            example = best(lambda: [legacy(url, data, name, params)
+                                    for name, params in CALLS])
+            serial = best(lambda: [client.transform(name, data, **params)
+                                   for name, params in CALLS])
+            parallel = best(lambda: client.map(data, CALLS))
+            print('{0:>10} {1:>9.3f}s {2:>9.3f}s {3:>9.3f}s'.format(
+                size, example, serial, parallel))
+    finally:
+        client.close()
+        process.kill()
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [1000, 100000, 1000000])
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+'''
+Profile the cold import of the mcflyin entry points. Each target is
+imported in a fresh interpreter that times the first import of every
+module, and the total, module count and slowest modules are reported.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/import_profile.py
+$PYTHONPATH=. python benchmarks/import_profile.py mcflyin.application --top 20
+
+'''
+from __future__ import print_function
+import argparse
+import json
+import subprocess
+import sys
+
+TARGETS = ['mcflyin', 'mcflyin.transformations', 'mcflyin.application',
+           'mcflyin.asyncapp']
+
+#: Run in the child interpreter: wrap __import__ to record the inclusive
+#: time of the first import of each module, then import the target
+CHILD = '''
+import json, sys, time
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+timings = {}
+original = builtins.__import__
+
+def timed_import(name, *args, **kwargs):
+    before = set(sys.modules)
+    start = time.time()
+    module = original(name, *args, **kwargs)
+    elapsed = time.time() - start
+    for loaded in set(sys.modules) - before:
+        # Python 2 implicit relative imports load package.name for name
+        if sys.modules[loaded] is not None and \
+                (loaded == name or loaded.endswith('.' + name)):
+            timings.setdefault(loaded, elapsed)
+    return module
+
+count = len([m for m in sys.modules.values() if m])
+builtins.__import__ = timed_import
+start = time.time()
+__import__(sys.argv[1])
+total = time.time() - start
+builtins.__import__ = original
+json.dump({'total': total,
+           'modules': len([m for m in sys.modules.values() if m]) - count,
+           'timings': timings,
+           'heavy': sorted(m for m in ('flask', 'requests', 'tornado',
+                                       'statsmodels', 'scipy')
+                           if m in sys.modules)}, sys.stdout)
+'''
+
+
+def profile(target):
+    '''Import `target` in a fresh interpreter and return its timings'''
+    output = subprocess.check_output([sys.executable, '-c', CHILD, target])
+    return json.loads(output.decode('utf-8'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('targets', nargs='*', default=TARGETS)
+    parser.add_argument('--top', type=int, default=10,
+                        help='Slowest modules to list per target')
+    args = parser.parse_args(argv)
+    for target in args.targets:
+        result = profile(target)
+        print('{0}: {1:.3f}s, {2} modules, heavy: {3}'.format(
+            target, result['total'], result['modules'],
+            ', '.join(result['heavy']) or 'none'))
+        slowest = sorted(result['timings'].items(), key=lambda x: -x[1])
+        for name, elapsed in slowest[:args.top]:
+            print('    {0:8.3f}s  {1}'.format(elapsed, name))
+
+if __name__ == '__main__':
+    main()
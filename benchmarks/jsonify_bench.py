@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the bulk `to_dict` serializer against the original per-element
+`jsonify` loop.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/jsonify_bench.py
+
+'''
+from __future__ import print_function
+import json
+import timeit
+import numpy as np
+import pandas as pd
+from mcflyin import transformations as tr
+
+
+def legacy_jsonify(df):
+    '''The original per-element serializer, kept for comparison'''
+    jsonified = {}
+    for name, column in df.iteritems():
+        jsonified[name] = {'time': [], 'data': []}
+        for stamp, value in column.iteritems():
+            jsonified[name]['time'].append(tr._typeit(stamp))
+            jsonified[name]['data'].append(tr._typeit(value))
+    return jsonified
+
+
+def frame(points):
+    '''Minutely frame of `points` rows with some missing values'''
+    rng = pd.date_range('1/1/2013', periods=points, freq='T')
+    values = np.random.poisson(5, points).astype(float)
+    values[::17] = np.nan
+    return pd.DataFrame({'Events': values}, index=rng)
+
+
+if __name__ == '__main__':
+    for points in [10000, 100000, 1000000]:
+        df = frame(points)
+        assert legacy_jsonify(df) == tr.to_dict(df)
+        number = 3
+        legacy = timeit.timeit(lambda: json.dumps(legacy_jsonify(df)),
+                               number=number) / number
+        bulk = timeit.timeit(lambda: json.dumps(tr.to_dict(df)),
+                             number=number) / number
+        epoch = timeit.timeit(
+            lambda: json.dumps(tr.to_dict(df, time_format='epoch')),
+            number=number) / number
+        print('{0:>8} points: legacy {1:.3f}s, bulk iso {2:.3f}s '
+              '({3:.1f}x), bulk epoch {4:.3f}s ({5:.1f}x)'
+              .format(points, legacy, bulk, legacy / bulk, epoch,
+                      legacy / epoch))
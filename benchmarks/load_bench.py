@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+Load test the Flask server against the Tornado server in `asyncapp`.
+
+Each server is started in a subprocess, then hit with many concurrent small
+/hourly requests while a few huge /resample uploads are in flight. Reports
+small request throughput and latency percentiles for each.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/load_bench.py [small requests] [concurrency]
+
+'''
+from __future__ import print_function, division
+import json
+import subprocess
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+import requests
+
+SERVERS = {
+    'flask': 'from mcflyin import application; '
+             'application.app.run(port={0})',
+    'tornado': 'from mcflyin import asyncapp; asyncapp.run(port={0})',
+}
+
+
+def start(name, port):
+    '''Start server `name` on `port` and wait until it answers'''
+    process = subprocess.Popen([sys.executable, '-c',
+                                SERVERS[name].format(port)])
+    url = 'http://127.0.0.1:{0}'.format(port)
+    for _ in range(100):
+        try:
+            requests.post(url + '/daily_hours',
+                          data={'data': json.dumps(['2013-06-16'])})
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(name + ' did not start')
+
+
+def small(url, data):
+    '''Time one small form-encoded request'''
+    start = time.time()
+    r = requests.post(url + '/hourly', data={'data': data,
+                                             'how': json.dumps('sum')})
+    r.raise_for_status()
+    return time.time() - start
+
+
+def huge(url, body):
+    '''Time one large binary upload'''
+    start = time.time()
+    r = requests.post(url + '/resample?freq={"T": "Minutely"}', data=body,
+                      headers={'Content-Type': 'application/octet-stream',
+                               'Accept': 'application/x-npz'})
+    r.raise_for_status()
+    return time.time() - start
+
+
+def load(url, count, concurrency):
+    '''Run `count` small requests alongside 4 huge ones'''
+    np.random.seed(0)
+    rng = pd.date_range('6/16/2013', periods=100, freq='7T')
+    data = json.dumps([x.isoformat() for x in rng])
+    stamps = pd.Timestamp('1/1/2013').value // 10**6 + \
+        np.sort(np.random.randint(0, 365 * 86400000, 2000000))
+    body = stamps.astype('<i8').tostring()
+
+    pool = ThreadPool(concurrency + 4)
+    start = time.time()
+    big = [pool.apply_async(huge, (url, body)) for _ in range(4)]
+    latencies = pool.map(lambda _: small(url, data), range(count))
+    elapsed = time.time() - start
+    big = [x.get() for x in big]
+    pool.close()
+    return elapsed, np.array(latencies), big
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    for port, name in enumerate(sorted(SERVERS), 5100):
+        process, url = start(name, port)
+        try:
+            elapsed, latencies, big = load(url, count, concurrency)
+        finally:
+            process.terminate()
+        print('{0:>8}: {1:.0f} small req/s, p50 {2:.3f}s, p99 {3:.3f}s, '
+              'huge uploads {4:.2f}s max'.format(
+                  name, count / elapsed, np.percentile(latencies, 50),
+                  np.percentile(latencies, 99), max(big)))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark rolling statistics for a 1h/24h/7d set of windows over a year of
+minutes: the engine over one resample, against the Pandas rolling
+functions, with and without a resample per window as separate
+`/rolling_sum` requests need.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/rolling_bench.py
+
+'''
+from __future__ import print_function
+import timeit
+import numpy as np
+import pandas as pd
+from mcflyin import rolling
+from mcflyin import transformations as tr
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    start = pd.Timestamp('1/1/2013').value
+    index = pd.DatetimeIndex(np.sort(
+        start + np.random.randint(0, 365 * tr.DAY, 2000000)).view('M8[ns]'))
+    df = tr.to_frame(index)
+    minutes = df.resample('T', how='sum')
+    windows = [60, 1440, 10080]
+    for how in rolling.STATISTICS:
+        func = getattr(pd, 'rolling_' + how)
+        requests = timeit.timeit(
+            lambda: [func(df.resample('T', how='sum'), x, min_periods=1)
+                     for x in windows], number=3) / 3
+        legacy = timeit.timeit(
+            lambda: [func(minutes, x, min_periods=1) for x in windows],
+            number=3) / 3
+        engine = timeit.timeit(
+            lambda: rolling.rolling(minutes, windows, how), number=3) / 3
+        print('{0:>5}: resample per window {1:.3f}s, pandas {2:.3f}s, '
+              'engine {3:.3f}s'.format(how, requests, legacy, engine))
+    every = timeit.timeit(lambda: tr.rolling_stats.frame(
+        df=index, freq={'T': 'Minutely'}, windows=windows,
+        how=rolling.STATISTICS), number=3) / 3
+    print('all statistics and windows from one resample: {0:.3f}s'
+          .format(every))
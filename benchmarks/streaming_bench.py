@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark time to first byte and total time of the streamed JSON encoder
+against one `json.dumps` of the whole result.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/streaming_bench.py
+
+'''
+from __future__ import print_function
+import json
+import time
+import numpy as np
+import pandas as pd
+from mcflyin import streaming
+from mcflyin import transformations as tr
+
+
+if __name__ == '__main__':
+    for points in [100000, 525600, 2000000]:
+        rng = pd.date_range('1/1/2013', periods=points, freq='T')
+        values = np.random.poisson(5, points).astype(float)
+        df = pd.DataFrame({'Minutely': values}, index=rng)
+
+        start = time.time()
+        body = json.dumps(tr.jsonified(df), separators=(',', ':'))
+        whole = time.time() - start
+
+        for encoding in [None, 'gzip']:
+            start = time.time()
+            chunks = streaming.iter_json(df)
+            if encoding is not None:
+                chunks = streaming.compress(chunks, encoding)
+            first = next(chunks)
+            ttfb = time.time() - start
+            size = len(first) + sum(len(x) for x in chunks)
+            total = time.time() - start
+            print('{0:>8} points, {1:>8}: dumps {2:.3f}s ({3:.1f}MB), '
+                  'streamed first chunk {4:.4f}s, total {5:.3f}s ({6:.1f}MB)'
+                  .format(points, encoding or 'identity', whole,
+                          len(body) / 2.0**20, ttfb, total, size / 2.0**20))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark suite for the McFlyin transformations and endpoints.
+
+Generates bursty synthetic event streams, times every stage of a request
+separately in process (JSON decode, `to_index`, each transformation,
+`jsonified`, `json.dumps`), then times each endpoint end to end through
+the Flask test client. Results are written as JSON and, given a baseline
+file from an earlier run, compared stage by stage.
+
+With mcflyin installed, or from the repository root:
+
+$PYTHONPATH=. python benchmarks/suite.py --sizes 10000 1000000 \
+    --output bench.json --baseline previous.json --max-slowdown 1.25
+
+Streams above --max-json events are only timed from binary uploads, as
+their JSON payloads would not fit in memory.
+
+'''
+from __future__ import print_function, division
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import numpy as np
+import pandas as pd
+from mcflyin import application
+from mcflyin import transformations as tr
+
+TRANSFORMATIONS = [
+    ('resample', {'freq': {'H': 'Hourly'}}),
+    ('rolling_sum', {'freq': {'H': 'Hourly'}, 'window': 24}),
+    ('rolling_stats', {'freq': {'H': 'Hourly'}, 'windows': ['24H', '7D'],
+                       'how': ['mean', 'max']}),
+    ('combined_resample', {'freq': [{'H': 'Hourly'}, {'D': 'Daily'},
+                                    {'W': 'Weekly'}]}),
+    ('daily', {'how': 'mean'}),
+    ('hourly', {'how': 'mean'}),
+    ('daily_hours', {'how': 'sum'}),
+    ('forward', {'periods': 180}),
+]
+
+
+def bursty(events, days=90, seed=0):
+    '''Sorted epoch milliseconds of `events` events over `days` days.
+
+    Hourly rates follow a diurnal and weekly cycle, scaled by lognormal
+    bursts, and events fall uniformly within their hour.
+
+    '''
+    rng = np.random.RandomState(seed)
+    hours = np.arange(days * 24)
+    diurnal = 1 + 0.8 * np.sin((hours % 24 - 9) * np.pi / 12)
+    weekly = np.where((hours // 24 + 3) % 7 >= 5, 0.4, 1.0)
+    rates = diurnal * weekly * rng.lognormal(0, 1, len(hours))
+    counts = rng.multinomial(events, rates / rates.sum())
+    start = pd.Timestamp('2013-01-01').value // 10**6
+    stamps = np.repeat(hours, counts) * 3600000 + start
+    return np.sort(stamps + rng.randint(0, 3600000, events))
+
+
+def best(func, repeat):
+    '''Best wall time of `repeat` calls of `func`'''
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def in_process(epoch, repeat, with_json):
+    '''Time each stage of a request in process'''
+    timings = {}
+    if with_json:
+        payload = json.dumps(tr.format_times(tr.to_index(epoch)))
+        timings['json_decode'] = best(lambda: json.loads(payload), repeat)
+        data = json.loads(payload)
+        timings['to_index_iso'] = best(lambda: tr.to_index(data), repeat)
+    timings['to_index_epoch'] = best(lambda: tr.to_index(epoch), repeat)
+    index = tr.to_index(epoch)
+    for name, params in TRANSFORMATIONS:
+        func = tr.OPERATIONS[name]
+        timings[name] = best(lambda: func(df=index, **params), repeat)
+        result = func(df=index, **params)
+        timings[name + '.jsonified'] = best(lambda: tr.jsonified(result),
+                                            repeat)
+        jsonified = tr.jsonified(result)
+        timings[name + '.dumps'] = best(
+            lambda: json.dumps(jsonified, separators=(',', ':')), repeat)
+    return timings
+
+
+def endpoints(epoch, repeat, with_json):
+    '''Time each endpoint through the Flask test client, with the results
+    cache cleared before every request'''
+    client = application.app.test_client()
+    body = epoch.astype('<i8').tostring()
+    payload = json.dumps(epoch.tolist()) if with_json else None
+    timings = {}
+
+    def post(name, params, binary):
+        application.results.clear()
+        values = dict((k, json.dumps(v)) for k, v in params.items())
+        if binary:
+            rv = client.post('/' + name, query_string=values, data=body,
+                             content_type='application/octet-stream')
+        else:
+            values['data'] = payload
+            rv = client.post('/' + name, data=values)
+        assert rv.status_code == 200, (name, rv.status_code)
+
+    for name, params in TRANSFORMATIONS:
+        timings['octet /' + name] = best(lambda: post(name, params, True),
+                                         repeat)
+        if with_json:
+            timings['json /' + name] = best(
+                lambda: post(name, params, False), repeat)
+    return timings
+
+
+def compare(results, baseline=None):
+    '''Print every timing, with its baseline and speedup when `baseline`
+    has the same stage.
+
+    Returns
+    -------
+    Worst slowdown against the baseline, 1.0 without one
+
+    '''
+    worst = 1.0
+    for size, sections in sorted(results.items(), key=lambda x: int(x[0])):
+        for section, timings in sorted(sections.items()):
+            previous = (baseline or {}).get(size, {}).get(section, {})
+            for stage, seconds in sorted(timings.items()):
+                line = '{0:>9} {1:<10} {2:<30} {3:8.4f}s'.format(
+                    size, section, stage, seconds)
+                if stage in previous:
+                    line += ' baseline {0:8.4f}s {1:6.2f}x'.format(
+                        previous[stage], previous[stage] / seconds)
+                    worst = max(worst, seconds / previous[stage])
+                print(line)
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 1000000, 10000000, 50000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-json', type=int, default=1000000)
+    parser.add_argument('--executor', default='inline',
+                        choices=['inline', 'thread', 'process'])
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--max-slowdown', type=float, default=None,
+                        help='exit with status 1 if any stage is this many '
+                             'times slower than the baseline')
+    args = parser.parse_args(argv)
+
+    application.executor = application.Executor(kind=args.executor)
+    results = {}
+    for size in args.sizes:
+        epoch = bursty(size)
+        with_json = size <= args.max_json
+        results[str(size)] = {
+            'stages': in_process(epoch, args.repeat, with_json),
+            'endpoints': endpoints(epoch, args.repeat, with_json)}
+        print('{0} events done'.format(size), file=sys.stderr)
+
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'numpy': np.__version__, 'pandas': pd.__version__,
+                       'executor': args.executor, 'repeat': args.repeat},
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    worst = compare(results, baseline)
+    if args.max_slowdown is not None and worst > args.max_slowdown:
+        print('Slowest stage is {0:.2f}x the baseline'.format(worst),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
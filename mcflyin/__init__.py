@@ -1,2 +1,40 @@
 # -*- coding: utf-8 -*-
-import application
+'''
+McFlyin: a timeseries transformation API built on Pandas and Flask.
+
+Submodules are imported on first attribute access, so `import mcflyin` and
+`import mcflyin.transformations` do not pull in Flask, requests or the
+rest of the web stack. `mcflyin.application` still works without an
+explicit import.
+
+'''
+import importlib
+import sys
+import types
+
+SUBMODULES = ('application', 'asyncapp', 'cache', 'client', 'eventlog',
+              'executor', 'formats', 'github', 'ingest', 'metrics', 'pyramid',
+              'rolling', 'series', 'sketch', 'store', 'streaming',
+              'transformations')
+
+
+class _LazyPackage(types.ModuleType):
+    '''Package module that imports its submodules on first access'''
+
+    def __getattr__(self, name):
+        if name in SUBMODULES:
+            return importlib.import_module(self.__name__ + '.' + name)
+        raise AttributeError("'module' object has no attribute '{0}'"
+                             .format(name))
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(SUBMODULES))
+
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(dict((k, v) for k, v in globals().items()
+                              if k not in ('__doc__', '__name__')))
+#: Python 2 clears the globals of a module once it is freed, so the
+#: original module object is kept alive alongside its replacement
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
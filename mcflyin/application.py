@@ -5,11 +5,57 @@ McFlyin App: A RESTish API for transforming time series data
 
 '''
 import json
-import pandas as pd
-import numpy as np
-from flask import Flask, Response, request
-import requests
+import numbers
+import os
+import tempfile
+from flask import Flask, Response, abort, g, request
 import transformations as tr
+import formats
+from store import DatasetStore
+from pyramid import PyramidStore
+from eventlog import EventLog
+from cache import FileCache, MemoryCache, memoize
+import series
+import sketch
+import ingest
+import metrics
+import streaming
+from executor import Busy, Executor, Timeout
+from github import GithubFetcher, RateLimited, Unavailable
+
+
+def setting(name, default=None, cast=str):
+    '''Configuration value `name`, read from the MCFLYIN_<NAME> environment
+    variable and converted with `cast`, or `default` if it is unset'''
+    value = os.environ.get('MCFLYIN_' + name.upper(), '')
+    return default if value == '' else cast(value)
+
+
+def make_cache():
+    '''Results cache configured by the MCFLYIN_CACHE settings: a
+    MemoryCache, or a FileCache that worker processes share'''
+    limits = {'max_items': setting('cache_items', 256, int),
+              'max_bytes': setting('cache_bytes', 64 * 2**20, int),
+              'ttl': setting('cache_ttl', 300, float)}
+    backend = setting('cache', 'memory')
+    if backend == 'memory':
+        return MemoryCache(**limits)
+    elif backend == 'file':
+        return FileCache(setting('cache_dir', os.path.join(
+            tempfile.gettempdir(), 'mcflyin-cache')), **limits)
+    raise ValueError('MCFLYIN_CACHE must be memory or file')
+
+
+def make_datasets(on_evict=None):
+    '''Dataset store configured by the MCFLYIN_DATASET settings: a memory
+    budget, and a directory evicted datasets spill to, or are discarded if
+    unset'''
+    return DatasetStore(max_bytes=setting('dataset_bytes', 256 * 2**20, int),
+                        spill_dir=setting('dataset_spill'),
+                        on_evict=on_evict)
+
+
+fetcher = GithubFetcher(max_feeds=setting('github_feeds', 1000, int))
 
 
 @tr.jsonify
@@ -23,117 +69,578 @@ def get_github(user='public'):
 
     Returns
     -------
-    Pandas DataFrame of event timestamps
+    Pandas DataFrame of the timestamps of the most recent events, up to
+    `fetcher.max_events`
 
     '''
+    df = tr.to_frame(fetcher.fetch(user))
+    return df.rename(columns={'Events': 'Event'})
+
+app = Flask(__name__)
+app.wsgi_app = streaming.InflateRequests(app.wsgi_app)
+max_buckets = setting('max_buckets', tr.MAX_BUCKETS, int)
+pyramids = PyramidStore(os.path.join(tempfile.gettempdir(),
+                                     'mcflyin-pyramids'), max_buckets)
+datasets = make_datasets(on_evict=pyramids.delete)
+logs = EventLog(setting('event_log', os.path.join(tempfile.gettempdir(),
+                                                   'mcflyin-events')))
+results = make_cache()
+streams = {}
+executor = Executor(kind=setting('executor', 'process'),
+                    workers=setting('workers', None, int),
+                    max_pending=setting('max_pending', 64, int),
+                    timeout=setting('timeout', 60, float))
+
+
+def json_response(payload):
+    '''Serialize a jsonified payload into a JSON Response'''
+    return Response(json.dumps(payload, separators=(',', ':')), status=200,
+                    mimetype='application/json')
+
+
+def decode_param(values, name, default=None):
+    '''JSON-decode parameter `name` from a mapping of request values'''
+    if name not in values:
+        return default
+    return json.loads(values[name])
 
-    if user == 'public':
-        uri = 'https://api.github.com/events'
+
+def param(name, default=None):
+    '''JSON-decode a request parameter from the form or query string'''
+    return decode_param(request.values, name, default)
+
+
+def int_param(name):
+    '''Required integer request parameter `name`. Aborts with 400 if it is
+    missing or not an integer.'''
+    try:
+        value = param(name)
+    except ValueError:
+        abort(400)
+    if isinstance(value, bool) or not isinstance(value, numbers.Integral):
+        abort(400)
+    return value
+
+
+def read_events(values, mimetype=None, body=None):
+    '''Read the events of a request.
+
+    Events come from a stored `dataset` ID, the JSON `data` value, or the
+    raw `body` for any of the binary `formats.REQUEST_TYPES` or streamable
+    `ingest.STREAM_TYPES`.
+
+    Parameters
+    ----------
+    values: mapping
+        Form and query string values
+    mimetype: string, default None
+        Request body mimetype
+    body: bytes, default None
+        Raw request body
+
+    Events outside of optional `start` and `end` times (end exclusive) are
+    dropped by binary search before any transformation, after sorting the
+    events unless `presorted` is true. See `transformations.prune`.
+
+    Returns
+    -------
+    Tuple of the events, as a DatetimeIndex or Keyed, and the dataset key
+    or None. Raises KeyError for unknown datasets,
+    formats.UnsupportedFormat for undecodable bodies, and ValueError for
+    invalid bounds.
+
+    '''
+    unit = decode_param(values, 'unit', 'ms')
+    if 'dataset' in values:
+        events, dataset_key = datasets.get(values['dataset']), \
+            values['dataset']
     else:
-        uri = 'https://api.github.com/users/{0}/events'.format(user)
-    response = requests.get(uri)
+        fmt = decode_param(values, 'format')
+        if mimetype in ingest.STREAM_TYPES:
+            events = ingest.decode(body, mimetype, fmt=fmt, unit=unit)
+        elif mimetype in formats.REQUEST_TYPES:
+            events = tr.to_index(formats.decode(body, mimetype), fmt=fmt,
+                                 unit=unit)
+        else:
+            data = json.loads(values['data'])
+            if tr.is_keyed(data):
+                events = tr.to_keyed(data, fmt=fmt, unit=unit)
+            else:
+                events = tr.to_index(data, fmt=fmt, unit=unit)
+        dataset_key = None
+    bounds = [decode_param(values, x) for x in ('start', 'end')]
+    if bounds == [None, None]:
+        return events, dataset_key
+    start, end = [None if x is None else tr.to_index([x], unit=unit)[0]
+                  for x in bounds]
+    events = tr.prune(events, start, end,
+                      presorted=decode_param(values, 'presorted'))
+    if dataset_key is not None:
+        dataset_key = json.dumps([dataset_key] + bounds)
+    return events, dataset_key
 
-    timestamps = []
-    for event in response.json:
-        timestamps.append(event['created_at'])
 
-    index = pd.to_datetime(timestamps)
-    ones = np.ones(len(index))
-    df = pd.DataFrame({'Event': ones}, index=index)
-    return df
+def parse_data():
+    '''Parse the events of the current request, see `read_events`'''
+    try:
+        with metrics.stage('parse'):
+            events, g.dataset_key = read_events(
+                request.values, request.mimetype, request.get_data())
+    except KeyError:
+        abort(404)
+    except formats.UnsupportedFormat:
+        abort(415)
+    except ValueError:
+        abort(400)
+    return events
+
+
+def transform(name, df, dataset_key=None, **params):
+    '''Run transformations.OPERATIONS[name] on the executor, through the
+    results cache'''
+    def run(df=None, **params):
+        return executor.run(name, df, **params)
+    cached = memoize(results, name=name)(run)
+    with metrics.stage('transform'):
+        return cached(df=df, dataset_key=dataset_key, **params)
+
+
+def stream_ingest(mimetype, values):
+    '''`ingest.Ingest` of a body in one of the `ingest.STREAM_TYPES`, with
+    the format, unit, bounds and `approximate` mode of the request values.
+    Raises ValueError for invalid bounds.'''
+    unit = decode_param(values, 'unit', 'ms')
+    start, end = [None if x is None else tr.to_index([x], unit=unit)[0]
+                  for x in (decode_param(values, 'start'),
+                            decode_param(values, 'end'))]
+    return ingest.Ingest(mimetype, fmt=decode_param(values, 'format'),
+                         unit=unit,
+                         approximate=decode_param(values, 'approximate',
+                                                  False),
+                         start=start, end=end, max_buckets=max_buckets)
+
+
+def stream_result(name, stream, **params):
+    '''Answer `name` from the EventSeries or Sketch of a streamed body.
+    Raises ValueError for bodies without events.'''
+    if not stream.events:
+        raise ValueError('No events')
+    return getattr(stream, name)(**params)
+
+
+def stream_transform(name, stream, mimetype, values, **params):
+    '''Transform a file-like `stream` in one of the `ingest.STREAM_TYPES`.
+
+    The body is read in chunks into running counts, or a `sketch.Sketch`
+    with a true `approximate` value, and `name` is answered from those, in
+    memory bounded by the span of the events.
+
+    Parameters
+    ----------
+    name: string
+        Operation name
+    stream: file-like
+        Request body
+    mimetype: string
+        Request body mimetype
+    values: mapping
+        Form and query string values
+    params:
+        Transformation parameters
+
+    Returns
+    -------
+    The transformation result. Raises ValueError for invalid bodies,
+    bounds or parameters, and for bodies without events.
+
+    '''
+    reader = stream_ingest(mimetype, values)
+    with metrics.stage('ingest'):
+        for chunk in iter(lambda: stream.read(ingest.CHUNK_SIZE), b''):
+            reader.feed(chunk)
+        stream = reader.close()
+    return stream_result(name, stream, **params)
+
+
+def request_transform(name, **params):
+    '''Transform the events of the current request.
+
+    Bodies in one of the `ingest.STREAM_TYPES` are answered by
+    `stream_transform`. Other requests are parsed whole and run through
+    `transform`.
+
+    With a true `approximate` parameter, resample, hourly, daily and
+    daily_hours are estimated from a fixed-size `sketch.Sketch` instead,
+    with bounds. Only streamed bodies are sketched without holding their
+    events; other bodies are buffered and parsed whole before they are
+    sketched. Either way the events may span at most `max_buckets`
+    minutes.
+
+    '''
+    approximate = param('approximate', False)
+    if approximate and name not in sketch.OPERATIONS:
+        abort(400)
+    if request.mimetype not in ingest.STREAM_TYPES:
+        df = parse_data()
+        if not approximate:
+            return transform(name, df, g.dataset_key, **params)
+        try:
+            stream = sketch.Sketch(max_buckets=max_buckets)
+            stream.append(df)
+            with metrics.stage('transform'):
+                return getattr(stream, name)(**params)
+        except (TypeError, ValueError):
+            abort(400)
+    try:
+        return stream_transform(name, request.stream, request.mimetype,
+                                request.values, **params)
+    except (TypeError, ValueError):
+        abort(400)
 
-app = Flask(__name__)
+
+@app.before_request
+def begin_metrics():
+    '''Start timing the stages of the request'''
+    metrics.begin()
+
+
+@app.after_request
+def end_metrics(response):
+    '''Report the request stages in a Server-Timing header'''
+    if metrics.enabled:
+        size = None if response.is_streamed else response.content_length
+        stages, rss_growth = metrics.end(request.endpoint or 'unknown',
+                                         request.content_length, size)
+        if stages:
+            response.headers['Server-Timing'] = metrics.server_timing(
+                stages, rss_growth)
+    return response
+
+
+@app.errorhandler(Busy)
+def busy(error):
+    '''Too many transformations are already pending'''
+    return Response(str(error), status=503, mimetype='text/plain')
+
+
+@app.errorhandler(RateLimited)
+def rate_limited(error):
+    '''The GitHub rate limit is exhausted'''
+    return Response(str(error), status=503, mimetype='text/plain')
+
+
+@app.errorhandler(Unavailable)
+def unavailable(error):
+    '''A GitHub request failed, with no cached events to serve'''
+    return Response(str(error), status=502, mimetype='text/plain')
+
+
+@app.errorhandler(Timeout)
+def timeout(error):
+    '''A transformation took longer than the executor timeout'''
+    return Response('Transformation timed out', status=504,
+                    mimetype='text/plain')
+
+
+def render(result, mimetype, time_format='iso'):
+    '''Encode a transformation result as `mimetype`.
+
+    Per-series results of keyed input, a dict of DataFrames, are encoded
+    as JSON only; other mimetypes raise formats.UnsupportedFormat.
+
+    Returns
+    -------
+    Encoded body
+
+    '''
+    if mimetype == formats.JSON:
+        jsonified = tr.jsonified(result, time_format=time_format)
+        with metrics.stage('dumps'):
+            return json.dumps(jsonified, separators=(',', ':'))
+    if isinstance(result, dict):
+        raise formats.UnsupportedFormat('Keyed results are JSON only')
+    with metrics.stage('encode'):
+        return formats.encode(result, mimetype)
+
+
+def streamed(result, time_format='iso'):
+    '''Chunked JSON Response encoding `result` as it is sent, compressed
+    with the best encoding in the Accept-Encoding header'''
+    try:
+        chunks = streaming.iter_json(result, time_format=time_format)
+    except ValueError:
+        abort(400)
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = streaming.negotiate(request.accept_encodings)
+    if encoding is not None:
+        chunks = streaming.compress(chunks, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(chunks, status=200, mimetype=formats.JSON,
+                    headers=headers)
+
+
+def respond(df):
+    '''Encode a result in the format named by the Accept header. JSON is
+    streamed if the `stream` parameter is true.'''
+    mimetype = formats.negotiate(request.accept_mimetypes)
+    if mimetype == formats.JSON and param('stream', False):
+        return streamed(df, param('time_format', 'iso'))
+    try:
+        body = render(df, mimetype, param('time_format', 'iso'))
+    except formats.UnsupportedFormat:
+        abort(406)
+    return Response(body, status=200, mimetype=mimetype)
+
+
+@app.route('/datasets', methods=['POST'])
+def upload():
+    '''Store the posted timestamps and return their dataset ID'''
+    if request.method == 'POST':
+        index = parse_data()
+        if isinstance(index, tr.Keyed):
+            abort(400)
+        return json_response({'id': datasets.put(index),
+                              'events': len(index)})
+
+
+@app.route('/datasets/<dataset_id>', methods=['GET', 'DELETE'])
+def dataset(dataset_id):
+    '''Describe or delete a stored dataset'''
+    if dataset_id not in datasets:
+        abort(404)
+    if request.method == 'DELETE':
+        datasets.delete(dataset_id)
+        pyramids.delete(dataset_id)
+        return json_response({'id': dataset_id})
+    index = datasets.get(dataset_id)
+    return json_response({'id': dataset_id, 'events': len(index)})
+
+
+@app.route('/datasets/<dataset_id>/counts', methods=['GET', 'POST'])
+def counts(dataset_id):
+    '''Return the event counts of a stored dataset at one `level` of its
+    rollup pyramid, between optional `start` and `end` times'''
+    if dataset_id not in datasets:
+        abort(404)
+    unit = param('unit', 'ms')
+    bounds = [param(x) for x in ('start', 'end')]
+    try:
+        start, end = [None if x is None else tr.to_index([x], unit=unit)[0]
+                      for x in bounds]
+        pyramid = pyramids.get(dataset_id, datasets.get(dataset_id))
+        df = pyramid.query(param('level', 'hour'), start, end,
+                           window=param('window'))
+    except (TypeError, ValueError):
+        abort(400)
+    return respond(df)
 
 
 @app.route('/github/<username>', methods=['GET'])
 def github(username):
-    '''Return the last 30 github event timestamps'''
+    '''Return the most recent github event timestamps, up to
+    `fetcher.max_events` (one poll of 3 pages of 100 by default)'''
     if request.method == 'GET':
-        resp = Response(json.dumps(get_github(username)), status=200,
-                        mimetype='application/json')
-        return resp
+        return json_response(get_github(username))
 
 
 @app.route('/resample', methods=['POST'])
 def resample():
-    '''Return a JSON of resampled event data'''
+    '''Return resampled event data'''
+    if request.method == 'POST':
+        freq = param('freq')
+        return respond(request_transform('resample', freq=freq))
+
+
+@app.route('/combined_resample', methods=['POST'])
+def combined_resample():
+    '''Return event data resampled to several frequencies, and combined on
+    the finest'''
     if request.method == 'POST':
-        data = json.loads(request.form['data'])
-        freq = json.loads(request.form['freq'])
-        df = tr.to_df(data)
-        json_return = tr.resample(df=df, freq=freq)
-        resp = Response(json.dumps(json_return), status=200,
-                        mimetype='application/json')
-        return resp
+        freq = param('freq')
+        fill = param('fill', 'pad')
+        try:
+            result = request_transform('combined_resample', freq=freq,
+                                       fill=fill)
+        except (TypeError, ValueError):
+            abort(400)
+        return respond(result)
 
 
 @app.route('/rolling_sum', methods=['POST'])
 def rolling_sum():
-    '''Return a JSON of rolling summed event data'''
+    '''Return rolling summed event data'''
     if request.method == 'POST':
-        data = json.loads(request.form['data'])
-        freq = json.loads(request.form['freq'])
-        window = int(request.form['window'])
-        df = tr.to_df(data)
-        json_return = tr.rolling_sum(df=df, window=window, freq=freq)
-        resp = Response(json.dumps(json_return), status=200,
-                        mimetype='application/json')
-        return resp
+        freq = param('freq')
+        window = int_param('window')
+        try:
+            result = request_transform('rolling_sum', window=window,
+                                       freq=freq)
+        except (TypeError, ValueError):
+            abort(400)
+        return respond(result)
+
+
+@app.route('/rolling_stats', methods=['POST'])
+def rolling_stats():
+    '''Return rolling statistics of event data for several windows'''
+    if request.method == 'POST':
+        freq = param('freq')
+        windows = param('windows')
+        how = param('how', 'sum')
+        try:
+            result = request_transform('rolling_stats', freq=freq,
+                                       windows=windows, how=how)
+        except (TypeError, ValueError):
+            abort(400)
+        return respond(result)
 
 
 @app.route('/daily', methods=['POST'])
 def daily():
-    '''Return a JSON of daily summed event data'''
+    '''Return daily summed event data'''
     if request.method == 'POST':
-        data = json.loads(request.form['data'])
-        how = json.loads(request.form['how'])
-        df = tr.to_df(data)
-        json_return = tr.daily(df=df, how=how)
-        resp = Response(json.dumps(json_return), status=200,
-                        mimetype='application/json')
-        return resp
+        how = param('how')
+        return respond(request_transform('daily', how=how))
 
 
 @app.route('/hourly', methods=['POST'])
 def hourly():
-    '''Return a JSON of hourly summed data'''
+    '''Return hourly summed data'''
     if request.method == 'POST':
-        data = json.loads(request.form['data'])
-        how = json.loads(request.form['how'])
-        df = tr.to_df(data)
-        json_return = tr.hourly(df=df, how=how)
-        resp = Response(json.dumps(json_return), status=200,
-                        mimetype='application/json')
-        return resp
+        how = param('how')
+        return respond(request_transform('hourly', how=how))
 
 
 @app.route('/daily_hours', methods=['POST'])
 def daily_hours():
-    '''Return a JSON of weekly event data by hour'''
+    '''Return weekly event data by hour'''
     if request.method == 'POST':
-        data = json.loads(request.form['data'])
-        df = tr.to_df(data)
-        json_return = tr.daily_hours(df=df, to_json=True)
-        resp = Response(json.dumps(json_return), status=200,
-                        mimetype='application/json')
-        return resp
+        return respond(request_transform('daily_hours'))
 
 
 @app.route('/forward', methods=['POST'])
 def forward():
-    '''Return a JSON of a given number of hourly events'''
+    '''Return a given number of hourly events'''
+    if request.method == 'POST':
+        periods = int_param('periods')
+        try:
+            result = request_transform('forward', periods=periods)
+        except (TypeError, ValueError):
+            abort(400)
+        return respond(result)
+
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    '''Return a JSON list with the result of each requested operation'''
     if request.method == 'POST':
-        data = json.loads(request.form['data'])
-        periods = json.loads(request.form['periods'])
-        df = tr.to_df(data)
-        json_return = tr.forward(df=df, periods=periods)
-        resp = Response(json.dumps(json_return), status=200,
-                        mimetype='application/json')
-        return resp
+        operations = param('operations')
+        try:
+            frames = request_transform('batch', operations=operations)
+        except (TypeError, ValueError):
+            abort(400)
+        time_format = param('time_format', 'iso')
+        return json_response([tr.jsonified(x, time_format=time_format)
+                              for x in frames])
+
+
+@app.route('/series/<name>', methods=['POST'])
+def append(name):
+    '''Append the posted timestamps to the named series'''
+    if request.method == 'POST':
+        index = parse_data()
+        if isinstance(index, tr.Keyed):
+            abort(400)
+        stream = streams.setdefault(name, series.EventSeries(max_buckets))
+        try:
+            stream.append(index)
+        except ValueError:
+            abort(400)
+        return json_response({'name': name, 'events': stream.events})
+
+
+@app.route('/series/<name>/<operation>', methods=['GET', 'POST'])
+def series_operation(name, operation):
+    '''Return a transformation of the named series, answered from its
+    running aggregates'''
+    if name not in streams or operation not in series.OPERATIONS:
+        abort(404)
+    params = dict((key, param(key))
+                  for key in ('freq', 'how', 'periods', 'window', 'windows',
+                              'fill')
+                  if key in request.values)
+    try:
+        df = getattr(streams[name], operation)(**params)
+    except (TypeError, ValueError):
+        abort(400)
+    return respond(df)
+
+
+@app.route('/logs/<name>', methods=['POST', 'DELETE'])
+def log_events(name):
+    '''Append the posted timestamps to the named on-disk event log, or
+    delete it'''
+    try:
+        if request.method == 'DELETE':
+            logs.delete(name)
+            return json_response({'name': name, 'deleted': True})
+        index = parse_data()
+        if isinstance(index, tr.Keyed):
+            abort(400)
+        written = logs.append(name, index)
+    except KeyError:
+        abort(404)
+    except ValueError:
+        abort(400)
+    return json_response({'name': name, 'events': written})
+
+
+@app.route('/logs/<name>/<operation>', methods=['GET', 'POST'])
+def log_operation(name, operation):
+    '''Return a transformation of the events of the named log between
+    optional `start` and `end` times, read from the mapped partitions'''
+    if name not in logs or operation not in tr.OPERATIONS:
+        abort(404)
+    unit = param('unit', 'ms')
+    params = dict((key, param(key))
+                  for key in ('freq', 'how', 'periods', 'window', 'windows',
+                              'fill')
+                  if key in request.values)
+    try:
+        start, end = [None if x is None else tr.to_index([x], unit=unit)[0]
+                      for x in (param('start'), param('end'))]
+        df = logs.query(name, operation, start, end, **params)
+    except (TypeError, ValueError):
+        abort(400)
+    return respond(df)
+
+
+@app.route('/cache', methods=['GET', 'DELETE'])
+def cache_stats():
+    '''Return the results cache hit and miss counters, or clear it'''
+    if request.method == 'DELETE':
+        results.clear()
+    return json_response(results.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    '''Return stage, request and response size histograms in the
+    Prometheus text format'''
+    stats = results.stats()
+    counters = {'mcflyin_cache_hits_total': stats['hits'],
+                'mcflyin_cache_misses_total': stats['misses']}
+    gauges = {'mcflyin_cache_size': stats['size'],
+              'mcflyin_cache_bytes': stats['bytes'],
+              'mcflyin_datasets': len(datasets),
+              'mcflyin_datasets_memory_bytes': datasets.nbytes}
+    return Response(metrics.render(gauges, counters), status=200,
+                    mimetype='text/plain; version=0.0.4')
 
 
 def run():
-    '''Run the McFlyin API'''
+    '''Run the McFlyin API, with the executor workers started up front'''
+    executor.start()
     app.run()
 
 if __name__ == '__main__':
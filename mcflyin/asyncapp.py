@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+'''
+Async App
+---------
+
+Evented serving mode for the McFlyin API, built on Tornado. Tornado runs on
+its own IOLoop under Python 2.7 and on the asyncio event loop under
+Python 3.
+
+The transformation routes match `application`. Bodies in one of the
+`ingest.STREAM_TYPES` are parsed a chunk at a time as they arrive, into
+running counts, and never held whole. Other request bodies are read into
+memory without parsing on the event loop. Parsing, transformation and
+encoding run on a thread pool, and the transformations themselves on the
+shared `application.executor`. Thousands of small requests and a few huge
+ones can then share one process. The GitHub route shares the cached
+`application.fetcher`.
+
+The stateful routes, /datasets, /series, /logs, /cache and /metrics, are
+served by the Flask `application.app` itself, called on the same thread
+pool, so they share its stores and answer exactly as the Flask server does.
+
+Run with:
+
+$python -m mcflyin.asyncapp
+
+'''
+import json
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from tornado import gen, httputil, ioloop, web
+from tornado.wsgi import WSGIContainer
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+import application as api
+import formats
+import ingest
+import metrics
+import sketch
+import streaming
+import transformations as tr
+
+PARAMETERS = {'resample': ['freq'], 'combined_resample': ['freq', 'fill'],
+              'rolling_sum': ['freq', 'window'],
+              'rolling_stats': ['freq', 'windows', 'how'],
+              'daily': ['how'], 'hourly': ['how'], 'daily_hours': [],
+              'forward': ['periods'], 'batch': ['operations']}
+
+#: Routes served by the Flask app
+WSGI_ROUTES = [r'/datasets(?:/.*)?', r'/series/.+', r'/logs/.+', r'/cache',
+               r'/metrics']
+
+offload = ThreadPoolExecutor(max_workers=16)
+
+
+def request_values(query_arguments, content_type, body):
+    '''Merge query string and form-encoded body arguments into a dict of
+    unicode strings'''
+    arguments = dict((k, list(v)) for k, v in query_arguments.items())
+    if content_type.split(';')[0].strip() not in formats.REQUEST_TYPES:
+        httputil.parse_body_arguments(content_type, body, arguments, {})
+    return dict((k, v[-1].decode('utf-8')) for k, v in arguments.items())
+
+
+def handle(operation, query_arguments, content_type, body, accept,
+           stream=None, accept_encoding=''):
+    '''Parse, transform and encode one request, off the event loop.
+
+    Parameters
+    ----------
+    stream: EventSeries or Sketch, default None
+        Events of a body in one of the `ingest.STREAM_TYPES`, already
+        parsed as it arrived. Such bodies are otherwise read from `body`.
+    accept_encoding: string, default ''
+        Accept-Encoding header, for JSON streamed with `stream=true`
+
+    Returns
+    -------
+    Tuple of response mimetype, body and a dict of extra headers. With a
+    true `stream` parameter, JSON bodies are an iterator of chunks, encoded
+    and compressed as they are consumed, as `application.streamed`. The
+    headers carry Server-Timing when `metrics` are enabled. Raises
+    tornado.web.HTTPError with the status code the Flask app would
+    answer.
+
+    '''
+    metrics.begin()
+    request_size = len(body) if stream is None else None
+    try:
+        mimetype, response, headers = _respond(
+            operation, query_arguments, content_type, body, accept, stream,
+            accept_encoding)
+    except web.HTTPError:
+        metrics.end(operation, request_size)
+        raise
+    streamed = not isinstance(response, (bytes, tr.string_types))
+    stages, rss_growth = metrics.end(operation, request_size,
+                                     None if streamed else len(response))
+    if stages:
+        headers['Server-Timing'] = metrics.server_timing(stages, rss_growth)
+    return mimetype, response, headers
+
+
+def _respond(operation, query_arguments, content_type, body, accept, stream,
+             accept_encoding):
+    '''Transform and encode one request, see `handle`'''
+    values = request_values(query_arguments, content_type, body)
+    mimetype = content_type.split(';')[0].strip()
+    params = dict((k, api.decode_param(values, k))
+                  for k in PARAMETERS[operation] if k in values)
+    approximate = api.decode_param(values, 'approximate', False)
+    if approximate and operation not in sketch.OPERATIONS:
+        raise web.HTTPError(400)
+    if mimetype in ingest.STREAM_TYPES:
+        events = None
+    else:
+        try:
+            events, dataset_key = api.read_events(values, mimetype, body)
+        except KeyError:
+            raise web.HTTPError(404)
+        except formats.UnsupportedFormat:
+            raise web.HTTPError(415)
+        except ValueError:
+            raise web.HTTPError(400)
+    try:
+        if stream is not None:
+            result = api.stream_result(operation, stream, **params)
+        elif events is None:
+            result = api.stream_transform(operation, BytesIO(body), mimetype,
+                                          values, **params)
+        elif approximate:
+            result = sketch.Sketch(max_buckets=api.max_buckets)
+            result.append(events)
+            result = getattr(result, operation)(**params)
+        else:
+            result = api.transform(operation, events, dataset_key, **params)
+    except api.Busy:
+        raise web.HTTPError(503)
+    except api.Timeout:
+        raise web.HTTPError(504)
+    except (TypeError, ValueError):
+        raise web.HTTPError(400)
+
+    time_format = api.decode_param(values, 'time_format', 'iso')
+    if operation == 'batch':
+        return formats.JSON, json.dumps(
+            [tr.jsonified(x, time_format=time_format) for x in result],
+            separators=(',', ':')), {}
+    response_type = formats.negotiate(parse_accept_header(accept,
+                                                          MIMEAccept))
+    if response_type == formats.JSON and \
+            api.decode_param(values, 'stream', False):
+        try:
+            chunks = streaming.iter_json(result, time_format=time_format)
+        except ValueError:
+            raise web.HTTPError(400)
+        headers = {'Vary': 'Accept-Encoding'}
+        encoding = streaming.negotiate(parse_accept_header(accept_encoding))
+        if encoding is not None:
+            chunks = streaming.compress(chunks, encoding)
+            headers['Content-Encoding'] = encoding
+        return response_type, chunks, headers
+    try:
+        return response_type, api.render(result, response_type,
+                                         time_format), {}
+    except formats.UnsupportedFormat:
+        raise web.HTTPError(406)
+
+
+@web.stream_request_body
+class TransformHandler(web.RequestHandler):
+    '''POST handler for one transformation route.
+
+    Bodies in one of the `ingest.STREAM_TYPES` are fed to an
+    `ingest.Ingest` a chunk at a time on the thread pool, and the next
+    chunk is not read until the last one is parsed. Other bodies are
+    collected and parsed whole.
+
+    '''
+
+    def initialize(self, operation):
+        self.operation = operation
+
+    def prepare(self):
+        self.chunks = []
+        self.ingest = None
+        self.error = None
+        content_type = self.request.headers.get('Content-Type', '')
+        if content_type.split(';')[0].strip() in ingest.STREAM_TYPES:
+            values = request_values(self.request.query_arguments,
+                                    content_type, b'')
+            try:
+                self.ingest = api.stream_ingest(
+                    content_type.split(';')[0].strip(), values)
+            except (TypeError, ValueError):
+                raise web.HTTPError(400)
+
+    @gen.coroutine
+    def data_received(self, chunk):
+        if self.ingest is None:
+            self.chunks.append(chunk)
+        elif self.error is None:
+            try:
+                yield offload.submit(self.ingest.feed, chunk)
+            except (TypeError, ValueError) as error:
+                self.error = error
+
+    @gen.coroutine
+    def post(self):
+        headers = self.request.headers
+        stream = None
+        if self.ingest is not None:
+            if self.error is None:
+                try:
+                    stream = yield offload.submit(self.ingest.close)
+                except (TypeError, ValueError) as error:
+                    self.error = error
+            if self.error is not None:
+                raise web.HTTPError(400)
+        mimetype, body, extra = yield offload.submit(
+            handle, self.operation, self.request.query_arguments,
+            headers.get('Content-Type', ''), b''.join(self.chunks),
+            headers.get('Accept', ''), stream,
+            headers.get('Accept-Encoding', ''))
+        self.set_header('Content-Type', mimetype)
+        for name, value in extra.items():
+            self.set_header(name, value)
+        if isinstance(body, (bytes, tr.string_types)):
+            self.write(body)
+            return
+        while True:
+            chunk = yield offload.submit(next, body, None)
+            if chunk is None:
+                break
+            self.write(chunk)
+            yield self.flush()
+
+
+class GithubHandler(web.RequestHandler):
+    '''Return the GitHub event timestamps of a user, from the shared
+    `application.fetcher`'''
+
+    @gen.coroutine
+    def get(self, user):
+        try:
+            df = yield offload.submit(api.get_github.frame, user)
+        except api.RateLimited:
+            raise web.HTTPError(503)
+        except api.Unavailable:
+            raise web.HTTPError(502)
+        self.set_header('Content-Type', formats.JSON)
+        self.write(json.dumps(tr.to_dict(df), separators=(',', ':')))
+
+
+def call_wsgi(environ):
+    '''Call the Flask app with a WSGI `environ`, off the event loop.
+
+    Returns
+    -------
+    Tuple of the status line, list of headers and body
+
+    '''
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+        return lambda data: None
+
+    response = api.app(environ, start_response)
+    try:
+        body = b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return started['status'], started['headers'], body
+
+
+@web.stream_request_body
+class WSGIHandler(web.RequestHandler):
+    '''Serve a request with the Flask `application.app`'''
+
+    def prepare(self):
+        self.chunks = []
+
+    def data_received(self, chunk):
+        self.chunks.append(chunk)
+
+    @gen.coroutine
+    def _serve(self, *args):
+        self.request.body = b''.join(self.chunks)
+        environ = WSGIContainer.environ(self.request)
+        environ['CONTENT_LENGTH'] = str(len(self.request.body))
+        environ['wsgi.multithread'] = True
+        status, headers, body = yield offload.submit(call_wsgi, environ)
+        code, reason = status.split(' ', 1)
+        self.set_status(int(code), reason)
+        self.clear_header('Content-Type')
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'transfer-encoding'):
+                self.add_header(name, value)
+        self.write(body)
+
+    get = post = delete = _serve
+
+
+def make_app():
+    '''Tornado Application with the McFlyin routes'''
+    routes = [(r'/' + name, TransformHandler, {'operation': name})
+              for name in PARAMETERS]
+    routes.append((r'/github/([^/]+)', GithubHandler))
+    routes.extend((route, WSGIHandler) for route in WSGI_ROUTES)
+    return web.Application(routes)
+
+
+def run(port=5000, address='127.0.0.1', max_body_size=2**31):
+    '''Run the McFlyin API on the Tornado event loop, with the executor
+    workers started before the server and its threads'''
+    api.executor.start()
+    make_app().listen(port, address, max_body_size=max_body_size,
+                      decompress_request=True)
+    ioloop.IOLoop.current().start()
+
+if __name__ == '__main__':
+    run()
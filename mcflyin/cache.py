@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+'''
+Cache
+-----
+
+Memoization of transformation results, keyed by the content of the events
+and the transformation parameters.
+
+Two backends share the `Cache` interface: `MemoryCache` for a single
+process, and `FileCache` for sharing results between workers through a
+common directory. Both are bounded by entries and by bytes, and are safe
+to use from concurrent threads.
+
+'''
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import transformations as tr
+
+MISSING = object()
+
+
+def events_key(df):
+    '''Content hash of the events in a DataFrame, DatetimeIndex or Keyed'''
+    if isinstance(df, tr.Keyed):
+        digest = hashlib.sha1(np.ascontiguousarray(df.index.asi8))
+        digest.update(np.ascontiguousarray(df.codes))
+        digest.update(json.dumps(df.labels).encode('utf-8'))
+        return digest.hexdigest()
+    index = df if isinstance(df, pd.DatetimeIndex) else df.index
+    return hashlib.sha1(np.ascontiguousarray(index.asi8)).hexdigest()
+
+
+def result_key(name, dataset_key, params):
+    '''Cache key for transformation `name` of a dataset with `params`'''
+    spec = json.dumps([name, dataset_key, params], sort_keys=True)
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()
+
+
+def result_nbytes(value):
+    '''Approximate memory footprint in bytes of a transformation result: a
+    DataFrame, or a dict or list of them'''
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    elif isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    elif isinstance(value, dict):
+        return sum(result_nbytes(x) for x in value.values())
+    elif isinstance(value, (list, tuple)):
+        return sum(result_nbytes(x) for x in value)
+    return sys.getsizeof(value)
+
+
+class Cache(object):
+    '''Base class for result caches.
+
+    Subclasses implement `_get`, `_set`, `__len__` and `clear`, which are
+    called with the lock held; `get` and `set` keep the hit and miss
+    counters.
+
+    Parameters
+    ----------
+    max_items: int, default 1024
+        Maximum number of cached results
+    ttl: float, default None
+        Seconds a result stays valid. Results never expire if None.
+    max_bytes: int, default None
+        Maximum total size of the cached results. Unbounded if None.
+
+    '''
+
+    def __init__(self, max_items=1024, ttl=None, max_bytes=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''Return the cached value for `key`, or `default`'''
+        with self._lock:
+            value = self._get(key)
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        '''Cache `value` under `key`'''
+        with self._lock:
+            self._set(key, value)
+
+    def stats(self):
+        '''Dict of hit and miss counters, and the number and total bytes of
+        cached results'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self), 'bytes': self.nbytes}
+
+    def _over(self, items, nbytes):
+        '''Whether `items` results of `nbytes` exceed the bounds'''
+        return items > self.max_items or \
+            (self.max_bytes is not None and nbytes > self.max_bytes)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+
+class MemoryCache(Cache):
+    '''In-process LRU result cache. Results larger than `max_bytes` on their
+    own are not cached.'''
+
+    def __init__(self, max_items=1024, ttl=None, max_bytes=None):
+        super(MemoryCache, self).__init__(max_items=max_items, ttl=ttl,
+                                          max_bytes=max_bytes)
+        self.nbytes = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _get(self, key):
+        if key not in self._items:
+            return MISSING
+        stored_at, value, nbytes = self._items.pop(key)
+        if self._expired(stored_at):
+            self.nbytes -= nbytes
+            return MISSING
+        self._items[key] = (stored_at, value, nbytes)
+        return value
+
+    def _set(self, key, value):
+        if key in self._items:
+            self.nbytes -= self._items.pop(key)[2]
+        nbytes = result_nbytes(value)
+        if self._over(1, nbytes):
+            return
+        self._items[key] = (time.time(), value, nbytes)
+        self.nbytes += nbytes
+        while self._over(len(self._items), self.nbytes):
+            self.nbytes -= self._items.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+class FileCache(Cache):
+    '''Result cache of pickle files in a directory shared by workers.
+
+    Files are written atomically, expire by modification time, and the
+    oldest are removed once there are more than `max_items` or they take
+    more than `max_bytes` on disk.
+
+    '''
+
+    def __init__(self, directory, max_items=1024, ttl=None, max_bytes=None):
+        super(FileCache, self).__init__(max_items=max_items, ttl=ttl,
+                                        max_bytes=max_bytes)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        return len(self._paths())
+
+    @property
+    def nbytes(self):
+        '''Total size of the cached result files'''
+        return sum(size for _, size, _ in self._files())
+
+    def _paths(self):
+        return [os.path.join(self.directory, x)
+                for x in os.listdir(self.directory) if x.endswith('.pkl')]
+
+    def _files(self):
+        '''List of (modification time, size, path) of the result files that
+        still exist'''
+        files = []
+        for path in self._paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return MISSING
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return MISSING
+
+    def _set(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        if self._over(1, os.path.getsize(tmp)):
+            os.remove(tmp)
+            return
+        os.rename(tmp, self._path(key))
+        files = sorted(self._files())
+        items, nbytes = len(files), sum(x[1] for x in files)
+        for _, size, path in files:
+            if not self._over(items, nbytes):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            items, nbytes = items - 1, nbytes - size
+
+    def clear(self):
+        with self._lock:
+            for path in self._paths():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def memoize(cache, name=None):
+    '''Decorate a transformation to cache its results in `cache`.
+
+    The decorated function takes the events as `df`, and an optional
+    `dataset_key` to skip hashing events whose content hash is known.
+
+    Example
+    -------
+    >>>resample = memoize(MemoryCache(ttl=60))(transformations.resample)
+    >>>resample(df=index, freq={'H': 'Hourly'})
+
+    '''
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(df=None, dataset_key=None, **kwargs):
+            if dataset_key is None:
+                dataset_key = events_key(df)
+            key = result_key(label, dataset_key, kwargs)
+            result = cache.get(key, MISSING)
+            if result is MISSING:
+                result = func(df=df, **kwargs)
+                cache.set(key, result)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+'''
+Client
+------
+
+Python client for the McFlyin API.
+
+Requests go through one connection-pooled session. Events are sent as a
+gzip-compressed body of little-endian int64 epoch nanoseconds, and results
+come back as .npz arrays that load straight into DataFrames, so neither
+side loops over events in Python. Several transformations of the same
+events are encoded once and sent in parallel.
+
+Example
+-------
+>>>client = Client('http://127.0.0.1:5000')
+>>>client.resample(data=mylist, freq={'H': 'Hourly'})
+>>>hourly, weekly = client.map(mylist, [('hourly', {'how': 'mean'}),
+...                                     ('daily_hours', {})])
+
+'''
+import json
+import threading
+import zlib
+from multiprocessing.pool import ThreadPool
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import urlencode
+import formats
+import transformations as tr
+
+URL = 'http://127.0.0.1:5000'
+#: Operations whose results are dicts of DataFrames, sent as JSON only
+DICT_RESULTS = ('combined_resample',)
+
+
+class Body(object):
+    '''Encoded events, ready to be sent with any number of requests'''
+
+    def __init__(self, data, headers, params):
+        self.data = data
+        self.headers = headers
+        self.params = params
+
+
+def _times(times):
+    '''Index of a jsonified `time` list: datetimes where they parse'''
+    if len(times) and isinstance(times[0], (str, type(u''))):
+        try:
+            return tr.to_index(times)
+        except ValueError:
+            pass
+    return times
+
+
+def _ordered(df):
+    '''Weekday columns of `df` in weekday order'''
+    if len(df.columns) and set(df.columns) <= set(tr.WEEKDAYS):
+        return df[[x for x in tr.WEEKDAYS if x in df.columns]]
+    return df
+
+
+def from_json(payload):
+    '''DataFrame of a jsonified result, or dict of DataFrames of a keyed or
+    combined result'''
+    if not all(isinstance(x, dict) and 'time' in x
+               for x in payload.values()):
+        return dict((k, from_json(v)) for k, v in payload.items())
+    columns = dict((name, pd.Series(x['data'], index=_times(x['time'])))
+                   for name, x in payload.items())
+    return _ordered(pd.DataFrame(columns))
+
+
+class Client(object):
+    '''Connection-pooled client for the McFlyin API.
+
+    Parameters
+    ----------
+    url: string, default 'http://127.0.0.1:5000'
+        Base URL of the API
+    workers: int, default 8
+        Pooled connections, and parallel requests in `map`
+    timeout: float, default None
+        Seconds to wait for each response
+    compress: int, default 1
+        gzip level of request bodies, or None to send them uncompressed
+    response_type: string, default formats.NPZ
+        Mimetype to ask for DataFrame results in
+
+    '''
+
+    def __init__(self, url=URL, workers=8, timeout=None, compress=1,
+                 response_type=formats.NPZ):
+        self.url = url.rstrip('/')
+        self.workers = workers
+        self.timeout = timeout
+        self.compress = compress
+        self.response_type = response_type
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def pool(self):
+        '''Thread pool for parallel requests, started on first use'''
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def _gzip(self, data):
+        compressor = zlib.compressobj(self.compress, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def encode(self, data=None, dataset=None, fmt=None, unit='ms'):
+        '''Encode events once for any number of requests.
+
+        Parameters
+        ----------
+        data: list, array, DatetimeIndex or dict, default None
+            Timestamps as accepted by `transformations.to_index`, or keyed
+            timestamps as accepted by `transformations.to_keyed`
+        dataset: string, default None
+            ID of a dataset stored with `upload`, instead of `data`
+        fmt: string, default None
+            strftime format of timestamp strings
+        unit: string, default 'ms'
+            Epoch unit of integer timestamps
+
+        Returns
+        -------
+        Body
+
+        '''
+        if dataset is not None:
+            return Body(None, {}, {'dataset': dataset})
+        headers = {}
+        if tr.is_keyed(data):
+            body = urlencode({'data': json.dumps(data)}).encode('ascii')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            params = {'unit': json.dumps(unit)}
+            if fmt is not None:
+                params['format'] = json.dumps(fmt)
+        else:
+            stamps = tr.to_index(data, fmt=fmt, unit=unit).asi8
+            body = stamps.astype('<i8').tostring()
+            headers['Content-Type'] = formats.OCTET
+            params = {'unit': json.dumps('ns')}
+        if self.compress is not None:
+            body = self._gzip(body)
+            headers['Content-Encoding'] = 'gzip'
+        return Body(body, headers, params)
+
+    def _post(self, path, body, params, accept=None):
+        '''POST `body` to `path` and decode the result'''
+        query = dict(body.params)
+        query.update((k, json.dumps(v)) for k, v in params.items()
+                     if v is not None)
+        headers = dict(body.headers)
+        headers['Accept'] = accept or self.response_type
+        r = self.session.post(self.url + '/' + path, params=query,
+                              data=body.data, headers=headers,
+                              timeout=self.timeout)
+        r.raise_for_status()
+        mimetype = r.headers.get('Content-Type', '').split(';')[0]
+        if mimetype == formats.JSON:
+            return r.json()
+        return _ordered(formats.decode_frame(r.content, mimetype))
+
+    def transform(self, operation, data=None, dataset=None, **params):
+        '''Run transformation `operation` over events.
+
+        Parameters
+        ----------
+        operation: string
+            Route name: resample, rolling_sum, daily, hourly, etc.
+        data, dataset:
+            Events, or a Body from `encode`, or a stored dataset ID
+        params:
+            Transformation parameters
+
+        Returns
+        -------
+        DataFrame, or dict of DataFrames for keyed and combined results
+
+        '''
+        body = data if isinstance(data, Body) else \
+            self.encode(data, dataset=dataset)
+        keyed = body.headers.get('Content-Type') == \
+            'application/x-www-form-urlencoded'
+        if keyed or operation in DICT_RESULTS:
+            return from_json(self._post(operation, body, params,
+                                        accept=formats.JSON))
+        result = self._post(operation, body, params)
+        return from_json(result) if isinstance(result, dict) else result
+
+    def map(self, data, calls, dataset=None):
+        '''Run several transformations of the same events in parallel.
+
+        Parameters
+        ----------
+        data: events, see `encode`
+        calls: list of (operation, params dict) tuples
+        dataset: string, default None
+            ID of a stored dataset, instead of `data`
+
+        Returns
+        -------
+        List of results, in the order of `calls`
+
+        '''
+        body = self.encode(data, dataset=dataset)
+        jobs = [self.pool.apply_async(self.transform, (name, body), params)
+                for name, params in calls]
+        return [job.get() for job in jobs]
+
+    def batch(self, data, operations, dataset=None):
+        '''Run several transformations in one request, see the /batch
+        route. `operations` is a list of dicts with an `op` key.'''
+        body = self.encode(data, dataset=dataset)
+        results = self._post('batch', body, {'operations': operations},
+                             accept=formats.JSON)
+        return [from_json(x) for x in results]
+
+    def upload(self, data):
+        '''Store events on the server and return their dataset ID'''
+        return self._post('datasets', self.encode(data), {},
+                          accept=formats.JSON)['id']
+
+    def resample(self, data=None, freq=None, dataset=None):
+        '''Results of /resample, see `transformations.resample`'''
+        return self.transform('resample', data, dataset, freq=freq)
+
+    def combined_resample(self, data=None, freq=None, fill='pad',
+                          dataset=None):
+        '''Results of /combined_resample, see
+        `transformations.combined_resample`'''
+        return self.transform('combined_resample', data, dataset, freq=freq,
+                              fill=fill)
+
+    def rolling_sum(self, data=None, window=None, freq=None, dataset=None):
+        '''Results of /rolling_sum, see `transformations.rolling_sum`'''
+        return self.transform('rolling_sum', data, dataset, window=window,
+                              freq=freq)
+
+    def daily(self, data=None, how=None, dataset=None):
+        '''Results of /daily, see `transformations.daily`'''
+        return self.transform('daily', data, dataset, how=how)
+
+    def hourly(self, data=None, how=None, dataset=None):
+        '''Results of /hourly, see `transformations.hourly`'''
+        return self.transform('hourly', data, dataset, how=how)
+
+    def daily_hours(self, data=None, dataset=None):
+        '''Results of /daily_hours, see `transformations.daily_hours`'''
+        return self.transform('daily_hours', data, dataset)
+
+    def forward(self, data=None, periods=180, dataset=None):
+        '''Results of /forward, see `transformations.forward`'''
+        return self.transform('forward', data, dataset, periods=periods)
+
+    def close(self):
+        '''Stop the thread pool and close pooled connections'''
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        self.session.close()
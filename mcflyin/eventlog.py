@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+'''
+Event Log
+---------
+
+Append-only on-disk store of event timestamps, so historical series are
+kept server-side instead of being resent with every request.
+
+Each series is a directory of partition files, one per day or month, named
+by the partition (2014-01.i64 or 2014-01-05.i64). A partition file holds
+the sorted little-endian int64 nanosecond epochs of its events and nothing
+else. Appends in time order are written to the end of the file. Late events
+are merged into their partition, which is then rewritten. Reads memory-map
+the partitions and slice them with a binary search, and the transformations
+run directly on the mapped buffers. The log's own configuration is kept
+beside the series as eventlog.json, so that name is reserved.
+
+'''
+import json
+import os
+import re
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import transformations as tr
+
+PARTITIONS = {'day': 'M8[D]', 'month': 'M8[M]'}
+DTYPE = np.dtype('<i8')
+SUFFIX = '.i64'
+NAME = re.compile(r'^[\w-][\w.-]*$')
+CONFIG = 'eventlog.json'
+
+
+def _partition_codes(stamps, partition):
+    '''Partition codes (days or months since the epoch) of int64 nanosecond
+    `stamps`'''
+    return stamps.view('M8[ns]').astype(PARTITIONS[partition]) \
+        .astype(np.int64)
+
+
+def _partition_start(code, partition):
+    '''int64 nanosecond start of partition `code`'''
+    return np.array([code]).astype(PARTITIONS[partition]) \
+        .astype('M8[ns]').astype(np.int64)[0]
+
+
+def _valid(name):
+    '''Whether `name` is a series name: a single path component, other
+    than the config file'''
+    return NAME.match(name) is not None and name != CONFIG
+
+
+def _timestamp(value):
+    '''int64 nanoseconds of a Timestamp, string or int64, or None'''
+    return None if value is None else pd.Timestamp(value).value
+
+
+class EventLog(object):
+    '''Event series persisted as partitioned int64 files in `directory`.
+
+    Parameters
+    ----------
+    directory: string
+        Directory holding a subdirectory per series
+    partition: string, default 'month'
+        'day' or 'month' partition files. An existing log keeps the
+        partitioning it was created with.
+
+    Example
+    -------
+    >>>log = EventLog('/var/lib/mcflyin/events', partition='day')
+    >>>log.append('pageviews', index)
+    >>>log.query('pageviews', 'daily_hours', start='2014-01-01',
+    ...          end='2014-02-01', how='mean')
+
+    '''
+
+    def __init__(self, directory, partition='month'):
+        if partition not in PARTITIONS:
+            raise ValueError('partition must be one of: ' +
+                             ', '.join(sorted(PARTITIONS)))
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        config = os.path.join(directory, CONFIG)
+        if os.path.exists(config):
+            with open(config) as f:
+                partition = json.load(f)['partition']
+        else:
+            with open(config, 'w') as f:
+                json.dump({'partition': partition}, f)
+        self.partition = partition
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return _valid(name) and \
+            os.path.isdir(os.path.join(self.directory, name))
+
+    def names(self):
+        '''Sorted names of the stored series'''
+        return sorted(x for x in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, x)))
+
+    def _path(self, name):
+        if not _valid(name):
+            raise ValueError('Invalid series name: {0}'.format(name))
+        return os.path.join(self.directory, name)
+
+    def _partitions(self, name):
+        '''Sorted list of (partition code, file path) of series `name`'''
+        path = self._path(name)
+        if not os.path.isdir(path):
+            raise KeyError(name)
+        unit = PARTITIONS[self.partition]
+        files = [x for x in os.listdir(path) if x.endswith(SUFFIX)]
+        codes = np.array([x[:-len(SUFFIX)] for x in files], dtype=unit)
+        return sorted(zip(codes.astype(np.int64).tolist(),
+                          [os.path.join(path, x) for x in files]))
+
+    def append(self, name, index):
+        '''Add a DatetimeIndex of events to series `name`, creating it if
+        needed.
+
+        Returns
+        -------
+        Number of events written
+
+        '''
+        path = self._path(name)
+        stamps = index.asi8
+        stamps = np.sort(stamps[stamps != tr.NAT])
+        if not len(stamps):
+            return 0
+        codes = _partition_codes(stamps, self.partition)
+        splits = np.flatnonzero(np.diff(codes)) + 1
+        unit = PARTITIONS[self.partition]
+        with self._lock:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for group in np.split(stamps, splits):
+                label = str(np.datetime64(
+                    int(_partition_codes(group[:1], self.partition)[0]),
+                    unit[3]))
+                self._write(os.path.join(path, label + SUFFIX), group)
+        return len(stamps)
+
+    def _write(self, path, stamps):
+        '''Append sorted `stamps` to a partition file, merging them in if
+        they are not all after its last event'''
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size:
+            last = np.memmap(path, dtype=DTYPE, mode='r',
+                             offset=size - DTYPE.itemsize, shape=(1,))[0]
+            if stamps[0] < last:
+                merged = np.concatenate([np.fromfile(path, dtype=DTYPE),
+                                         stamps])
+                merged.sort(kind='mergesort')
+                tmp = path + '.tmp'
+                merged.astype(DTYPE).tofile(tmp)
+                os.rename(tmp, path)
+                return
+        with open(path, 'ab') as f:
+            stamps.astype(DTYPE).tofile(f)
+
+    def delete(self, name):
+        '''Remove series `name` from disk'''
+        path = self._path(name)
+        if not os.path.isdir(path):
+            raise KeyError(name)
+        with self._lock:
+            shutil.rmtree(path)
+
+    def stamps(self, name, start=None, end=None):
+        '''Memory-mapped int64 nanosecond epochs of series `name` in
+        [start, end).
+
+        Returns
+        -------
+        List of read-only array views, one per partition in the range, in
+        time order
+
+        '''
+        start, end = _timestamp(start), _timestamp(end)
+        partitions = self._partitions(name)
+        views = []
+        for i, (code, path) in enumerate(partitions):
+            if end is not None and \
+                    _partition_start(code, self.partition) >= end:
+                break
+            if start is not None and i + 1 < len(partitions) and \
+                    _partition_start(partitions[i + 1][0],
+                                     self.partition) <= start:
+                continue
+            if not os.path.getsize(path):
+                continue
+            mapped = np.memmap(path, dtype=DTYPE, mode='r')
+            low = 0 if start is None else mapped.searchsorted(start)
+            high = len(mapped) if end is None else mapped.searchsorted(end)
+            if high > low:
+                views.append(np.asarray(mapped[low:high]))
+        return views
+
+    def index(self, name, start=None, end=None):
+        '''DatetimeIndex of the events of series `name` in [start, end).
+
+        A range within one partition is served from the mapped buffer
+        without a copy. A range spanning partitions is concatenated.
+
+        '''
+        views = self.stamps(name, start, end)
+        if not views:
+            stamps = np.zeros(0, dtype=np.int64)
+        elif len(views) == 1:
+            stamps = views[0]
+        else:
+            stamps = np.concatenate(views)
+        return pd.DatetimeIndex(stamps.view('M8[ns]'))
+
+    def query(self, name, operation, start=None, end=None, **params):
+        '''Run transformation `operation` over the events of series `name`
+        in [start, end).
+
+        Parameters
+        ----------
+        name: string
+            Series name
+        operation: string
+            One of transformations.OPERATIONS, e.g. resample, daily, hourly
+            or daily_hours
+        start, end: Timestamp, string or int64 nanoseconds, default None
+            Event time range, start inclusive and end exclusive. Unbounded
+            if None.
+        params:
+            Transformation parameters
+
+        Returns
+        -------
+        The transformation's DataFrame, or dict of DataFrames for keyed
+        results
+
+        '''
+        if operation not in tr.OPERATIONS:
+            raise ValueError('Unknown operation: {0}'.format(operation))
+        index = self.index(name, start, end)
+        if not len(index):
+            raise ValueError('No events in range')
+        return tr.OPERATIONS[operation](df=index, **params)
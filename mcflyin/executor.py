@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''
+Executor
+--------
+
+Runs transformations off the request thread, by default in a pool of
+worker processes so CPU-bound pandas work uses every core instead of
+holding the GIL of the serving process.
+
+Event timestamps are handed to worker processes as .npy files in shared
+memory (/dev/shm where available) that the workers memory-map, rather than
+being pickled through the pool's pipes. The Events weights of a weighted
+DataFrame are shared alongside them.
+
+Worker processes import pandas and the transformations on start, and
+`Executor.start` spawns them ahead of the first request, so no request
+pays the import cost of a cold worker.
+
+'''
+import importlib
+import multiprocessing
+import multiprocessing.pool
+import os
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import transformations as tr
+
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+PRELOAD = ('pandas', 'mcflyin.transformations')
+
+
+class Busy(Exception):
+    '''Raised when the executor already has `max_pending` jobs'''
+    pass
+
+
+Timeout = multiprocessing.TimeoutError
+
+
+def transform(name, df, **params):
+    '''Run transformations.OPERATIONS[name], or transformations.batch'''
+    func = tr.batch if name == 'batch' else tr.OPERATIONS[name]
+    return func(df=df, **params)
+
+
+def _share(df, directory):
+    '''Write the events of `df`, and their Events weights if any, to .npy
+    files, returning a picklable spec'''
+    if isinstance(df, tr.Keyed):
+        arrays = [df.index.asi8, df.codes]
+        labels = df.labels
+    else:
+        stamps, weights = tr.events(df)
+        arrays = [stamps] if weights is None else [stamps, weights]
+        labels = None
+    paths = []
+    for array in arrays:
+        fd, path = tempfile.mkstemp(suffix='.npy', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        paths.append(path)
+    return paths, labels
+
+
+def _load(spec):
+    '''Memory-map the events written by `_share`'''
+    paths, labels = spec
+    arrays = [np.load(path, mmap_mode='r') for path in paths]
+    index = pd.DatetimeIndex(arrays[0].view('M8[ns]'))
+    if labels is not None:
+        return tr.Keyed(index, np.asarray(arrays[1]), labels)
+    elif len(arrays) == 2:
+        return pd.DataFrame({'Events': np.asarray(arrays[1])}, index=index)
+    return index
+
+
+def _preload(modules):
+    '''Worker process initializer: import `modules` and warm up pandas with
+    a tiny transformation'''
+    for module in modules:
+        importlib.import_module(module)
+    if modules:
+        tr.hourly.frame(tr.to_index(['2014-01-01T00:00:00']))
+
+
+def _context(start_method, preload):
+    '''Multiprocessing context for `start_method`'''
+    if start_method is None:
+        return multiprocessing
+    if not hasattr(multiprocessing, 'get_context'):
+        if start_method == 'fork':
+            return multiprocessing
+        raise ValueError('Only the fork start method is available before '
+                         'Python 3.4')
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(list(preload))
+    return context
+
+
+def _guarded(func, args, kwargs):
+    '''Call `func`, returning (True, result) or (False, exception). Pool
+    callbacks only fire on success under Python 2, so failures are
+    returned rather than raised.'''
+    try:
+        return True, func(*args, **kwargs)
+    except Exception as error:
+        return False, error
+
+
+def _work(name, spec, params):
+    '''Worker process entry point'''
+    return _guarded(lambda: transform(name, _load(spec), **params), (), {})
+
+
+class Executor(object):
+    '''Configurable executor for transformations.
+
+    Parameters
+    ----------
+    kind: string, default 'process'
+        'process' for a process pool, 'thread' for a thread pool, or
+        'inline' to run on the calling thread
+    workers: int, default None
+        Pool size. Defaults to the number of CPUs.
+    max_pending: int, default None
+        Jobs allowed in flight before `run` raises Busy. Unbounded if None.
+        A job holds its slot until it finishes, even after a timeout.
+    timeout: float, default None
+        Seconds to wait for a job before `run` raises Timeout. A timed out
+        job is abandoned but keeps its worker, its slot and its shared
+        arrays until it finishes. Inline jobs run on the calling thread
+        and have no timeout.
+    shared_dir: string, default /dev/shm
+        Directory for the event arrays handed to worker processes
+    preload: tuple, default ('pandas', 'mcflyin.transformations')
+        Modules each worker process imports when it starts
+    start_method: string, default None
+        Multiprocessing start method: 'fork', 'spawn' or 'forkserver'.
+        Uses the platform default if None.
+
+    Example
+    -------
+    >>>executor = Executor(kind='process', max_pending=64, timeout=30)
+    >>>executor.start()
+    >>>executor.run('daily_hours', index, how='mean')
+
+    '''
+
+    def __init__(self, kind='process', workers=None, max_pending=None,
+                 timeout=None, shared_dir=SHARED_DIR, preload=PRELOAD,
+                 start_method=None):
+        if kind not in ('process', 'thread', 'inline'):
+            raise ValueError('kind must be one of: process, thread, inline')
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.shared_dir = shared_dir
+        self.preload = tuple(preload or ())
+        self._context = _context(start_method, self.preload)
+        self._slots = None if max_pending is None else \
+            threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        '''The worker pool, started on first use'''
+        with self._lock:
+            if self._pool is None:
+                if self.kind == 'process':
+                    self._pool = self._context.Pool(
+                        self.workers, _preload, (self.preload,))
+                else:
+                    self._pool = multiprocessing.pool.ThreadPool(
+                        self.workers)
+            return self._pool
+
+    def start(self):
+        '''Start the worker pool now instead of on the first `run`'''
+        if self.kind != 'inline':
+            self.pool
+        return self
+
+    def run(self, name, df, **params):
+        '''Run transformation `name` over `df` and return its result'''
+        if self._slots is not None and not self._slots.acquire(False):
+            raise Busy('{0} jobs already pending'.format(self.max_pending))
+        if self.kind == 'inline':
+            try:
+                return transform(name, df, **params)
+            finally:
+                self._finish([])
+        paths = []
+        try:
+            if self.kind == 'thread':
+                job = self.pool.apply_async(
+                    _guarded, (transform, (name, df), params),
+                    callback=lambda _: self._finish(paths))
+            else:
+                spec = _share(df, self.shared_dir)
+                paths.extend(spec[0])
+                job = self.pool.apply_async(
+                    _work, (name, spec, params),
+                    callback=lambda _: self._finish(paths))
+        except Exception:
+            self._finish(paths)
+            raise
+        ok, result = job.get(self.timeout)
+        if not ok:
+            raise result
+        return result
+
+    def _finish(self, paths):
+        '''Remove the shared arrays of a finished job and release its
+        slot'''
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if self._slots is not None:
+            self._slots.release()
+
+    def close(self):
+        '''Stop the worker pool'''
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
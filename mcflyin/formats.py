@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+Formats
+-------
+
+Binary request and response encodings for the McFlyin API.
+
+Requests may POST timestamps as a raw body instead of a form-encoded JSON
+string:
+
+    application/octet-stream: little-endian int64 epoch offsets
+    application/x-npy: a NumPy .npy array of epoch offsets or datetime64
+    application/x-msgpack: a msgpack array of epoch offsets or strings
+    application/vnd.apache.arrow.stream: Arrow IPC stream, first column used
+
+Responses are columnar: a `time` array plus one array per result column,
+returned in the format named by the Accept header.
+
+'''
+import io
+import numpy as np
+import pandas as pd
+import transformations as tr
+
+JSON = 'application/json'
+OCTET = 'application/octet-stream'
+NPY = 'application/x-npy'
+NPZ = 'application/x-npz'
+MSGPACK = 'application/x-msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+REQUEST_TYPES = [OCTET, NPY, MSGPACK, ARROW]
+RESPONSE_TYPES = [JSON, NPZ, MSGPACK, ARROW]
+
+
+class UnsupportedFormat(ValueError):
+    '''Raised for unknown mimetypes or missing optional dependencies'''
+    pass
+
+
+def _import(name):
+    '''Import an optional dependency, or raise UnsupportedFormat'''
+    try:
+        return __import__(name)
+    except ImportError:
+        raise UnsupportedFormat('{0} is required for this format'
+                                .format(name))
+
+
+def negotiate(accept_mimetypes):
+    '''Pick the response mimetype from a werkzeug MIMEAccept'''
+    return accept_mimetypes.best_match(RESPONSE_TYPES, default=JSON)
+
+
+def decode(body, mimetype):
+    '''Decode a binary request body into an array of timestamps.
+
+    Parameters
+    ----------
+    body: bytes
+        Raw request body
+    mimetype: string
+        One of REQUEST_TYPES
+
+    Returns
+    -------
+    NumPy array or list, ready for `transformations.to_index`
+
+    '''
+    if mimetype == OCTET:
+        return np.frombuffer(body, dtype='<i8')
+    elif mimetype == NPY:
+        return np.load(io.BytesIO(body), allow_pickle=False)
+    elif mimetype == MSGPACK:
+        msgpack = _import('msgpack')
+        return msgpack.unpackb(body, raw=False)
+    elif mimetype == ARROW:
+        pa = _import('pyarrow')
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        return np.asarray(table.column(0).to_pandas())
+    raise UnsupportedFormat('Cannot decode ' + mimetype)
+
+
+def _index_array(index):
+    '''Index as a NumPy array that needs no pickling'''
+    if index.dtype == object:
+        return np.array([tr._typeit(x) for x in index], dtype=np.unicode_)
+    return np.asarray(index)
+
+
+def encode(df, mimetype):
+    '''Encode a result DataFrame as a columnar binary payload.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+        Transformation result
+    mimetype: string
+        One of RESPONSE_TYPES other than JSON
+
+    Returns
+    -------
+    bytes
+
+    '''
+    if mimetype == NPZ:
+        buf = io.BytesIO()
+        arrays = dict((tr._typeit(name), np.asarray(df[name].values))
+                      for name in df.columns)
+        arrays['time'] = _index_array(df.index)
+        np.savez(buf, **arrays)
+        return buf.getvalue()
+    elif mimetype == MSGPACK:
+        msgpack = _import('msgpack')
+        times = tr.format_times(df.index, time_format='epoch')
+        payload = dict((name, {'time': times,
+                               'data': df[name].values.tolist()})
+                       for name in df.columns)
+        return msgpack.packb(payload, use_bin_type=True)
+    elif mimetype == ARROW:
+        pa = _import('pyarrow')
+        arrays = [pa.array(_index_array(df.index))]
+        arrays.extend(pa.array(df[name].values) for name in df.columns)
+        names = ['time'] + [tr._typeit(name) for name in df.columns]
+        batch = pa.RecordBatch.from_arrays(arrays, names)
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchStreamWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        return sink.getvalue().to_pybytes()
+    raise UnsupportedFormat('Cannot encode ' + mimetype)
+
+
+def decode_frame(body, mimetype, epoch=False):
+    '''Decode a columnar binary response back into a DataFrame.
+
+    msgpack carries datetimes as epoch milliseconds; pass `epoch=True` to
+    convert its index back to datetimes.
+
+    '''
+    if mimetype == NPZ:
+        arrays = np.load(io.BytesIO(body), allow_pickle=False)
+        columns = dict((k, arrays[k]) for k in arrays.files if k != 'time')
+        return pd.DataFrame(columns, index=arrays['time'])
+    elif mimetype == MSGPACK:
+        msgpack = _import('msgpack')
+        payload = msgpack.unpackb(body, raw=False)
+        columns = dict((k, v['data']) for k, v in payload.items())
+        times = list(payload.values())[0]['time']
+        if epoch:
+            times = pd.to_datetime(times, unit='ms')
+        return pd.DataFrame(columns, index=times)
+    elif mimetype == ARROW:
+        pa = _import('pyarrow')
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        return table.to_pandas().set_index('time')
+    raise UnsupportedFormat('Cannot decode ' + mimetype)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+'''
+Github
+------
+
+Fetcher for GitHub event timestamps. One connection-pooled session is
+shared by every request, the pages of a feed are fetched concurrently,
+and each page is requested conditionally with the ETag of its last
+response. Events are merged into a per-feed cache by ID, so only new
+events are parsed, and polls within the X-Poll-Interval or while the rate
+limit is exhausted are answered from the cache, as are polls GitHub fails
+to answer. Each cache keeps only the most recent events, so the public
+firehose does not grow it without limit, and only the most recently
+fetched feeds are cached, so arbitrary usernames do not either.
+
+'''
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+import transformations as tr
+
+API = 'https://api.github.com'
+
+
+class RateLimited(Exception):
+    '''Raised when the rate limit is exhausted and a feed has no cached
+    events to fall back on'''
+    pass
+
+
+class Unavailable(Exception):
+    '''Raised when a GitHub request fails and a feed has no cached events
+    to fall back on'''
+    pass
+
+
+class Feed(object):
+    '''Cached events of one feed: ETags by page, and the IDs and int64
+    nanosecond timestamps of the `max_events` most recent events, sorted by
+    time'''
+
+    def __init__(self, max_events=300):
+        self.max_events = max_events
+        self.etags = {}
+        self.ids = set()
+        self.stamps = np.zeros(0, dtype=np.int64)
+        self.polled = None
+        self.poll_interval = 0
+        self.lock = threading.Lock()
+        self._ids = np.zeros(0, dtype=object)
+
+    def merge(self, events):
+        '''Parse and add the events not seen before, then trim the cache to
+        the most recent `max_events`. Returns how many events were new.'''
+        new = [x for x in events if x['id'] not in self.ids]
+        if not new:
+            return 0
+        stamps = tr.to_index([x['created_at'].rstrip('Z') for x in new]).asi8
+        stamps = np.concatenate([self.stamps, stamps])
+        ids = np.concatenate([self._ids,
+                              np.array([x['id'] for x in new], dtype=object)])
+        keep = np.argsort(stamps, kind='mergesort')[-self.max_events:]
+        self.stamps, self._ids = stamps[keep], ids[keep]
+        self.ids = set(self._ids)
+        return len(new)
+
+    def index(self):
+        '''Sorted DatetimeIndex of the cached event timestamps'''
+        return pd.DatetimeIndex(self.stamps.view('M8[ns]'))
+
+
+class GithubFetcher(object):
+    '''Pooled, cached and concurrent GitHub event fetcher.
+
+    Parameters
+    ----------
+    base_url: string, default https://api.github.com
+        API root, replaced by a local stub in tests
+    pages: int, default 3
+        Pages of events to fetch per feed
+    per_page: int, default 100
+        Events per page
+    workers: int, default 8
+        Concurrent page requests, and connections kept in the pool
+    timeout: float, default 10
+        Seconds to wait for each response
+    token: string, default None
+        OAuth token, for the authenticated rate limit
+    max_events: int, default None
+        Most recent events cached and returned per feed. Defaults to
+        `pages` * `per_page`, one full poll.
+    max_feeds: int, default 1000
+        Feeds cached at once. The least recently fetched are dropped
+        beyond it.
+
+    Example
+    -------
+    >>>fetcher = GithubFetcher(pages=3)
+    >>>index = fetcher.fetch('wrobstory')
+
+    '''
+
+    def __init__(self, base_url=API, pages=3, per_page=100, workers=8,
+                 timeout=10, token=None, max_events=None, max_feeds=1000):
+        self.base_url = base_url.rstrip('/')
+        self.pages = pages
+        self.per_page = per_page
+        self.max_events = max_events or pages * per_page
+        self.timeout = timeout
+        self.token = token
+        self.remaining = None
+        self.reset = None
+        self.workers = workers
+        self.max_feeds = max_feeds
+        self.feeds = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._session = None
+
+    @property
+    def session(self):
+        '''Connection-pooled requests Session, created on first use'''
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.workers,
+                                      pool_maxsize=self.workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    'User-Agent': 'mcflyin',
+                    'Accept': 'application/vnd.github.v3+json'})
+                if self.token is not None:
+                    session.headers['Authorization'] = 'token ' + self.token
+                self._session = session
+            return self._session
+
+    @property
+    def pool(self):
+        '''Thread pool for page requests, started on first use'''
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def _feed(self, user):
+        '''Cached feed of `user`, marked most recently used'''
+        with self._lock:
+            feed = self.feeds.pop(user, None) or Feed(self.max_events)
+            self.feeds[user] = feed
+            while len(self.feeds) > self.max_feeds:
+                self.feeds.popitem(last=False)
+            return feed
+
+    def _url(self, user):
+        if user == 'public':
+            return self.base_url + '/events'
+        return '{0}/users/{1}/events'.format(self.base_url, user)
+
+    def _limit(self, remaining, reset):
+        '''Track the rate limit. Concurrent responses arrive out of order,
+        so within one reset window the lowest remaining count is kept.'''
+        with self._lock:
+            if reset == self.reset:
+                remaining = min(remaining, self.remaining)
+            self.remaining, self.reset = remaining, reset
+
+    def _rate_limited(self):
+        return self.remaining == 0 and self.reset is not None and \
+            time.time() < self.reset
+
+    def _page(self, user, feed, page):
+        '''Fetch one page, conditionally on its last ETag.
+
+        Returns
+        -------
+        List of events, or None if the page is unchanged
+
+        '''
+        headers = {}
+        if page in feed.etags:
+            headers['If-None-Match'] = feed.etags[page]
+        response = self.session.get(
+            self._url(user), headers=headers, timeout=self.timeout,
+            params={'page': page, 'per_page': self.per_page})
+        limit = response.headers
+        if 'X-RateLimit-Remaining' in limit:
+            self._limit(int(limit['X-RateLimit-Remaining']),
+                        int(limit.get('X-RateLimit-Reset', 0)))
+        if 'X-Poll-Interval' in limit:
+            feed.poll_interval = int(limit['X-Poll-Interval'])
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        if 'ETag' in response.headers:
+            feed.etags[page] = response.headers['ETag']
+        return response.json()
+
+    def fetch(self, user='public'):
+        '''Fetch and merge new events of `user`, or the public feed.
+
+        Returns
+        -------
+        DatetimeIndex of the most recent `max_events` events seen in the
+        feed. Raises RateLimited if the rate limit is exhausted, and
+        Unavailable if GitHub fails to answer, before the feed was ever
+        fetched.
+
+        '''
+        feed = self._feed(user)
+        with feed.lock:
+            fresh = feed.polled is not None and \
+                time.time() - feed.polled < feed.poll_interval
+            if fresh or self._rate_limited():
+                if feed.polled is None:
+                    raise RateLimited('GitHub rate limit exhausted until '
+                                      '{0}'.format(self.reset))
+                return feed.index()
+            try:
+                pages = self.pool.map(
+                    lambda page: self._page(user, feed, page),
+                    range(1, self.pages + 1))
+            except IOError as error:
+                # requests exceptions, HTTP error statuses included, are
+                # IOErrors
+                if feed.polled is None:
+                    raise Unavailable('GitHub request failed: '
+                                      '{0}'.format(error))
+                return feed.index()
+            for events in pages:
+                if events:
+                    feed.merge(events)
+            feed.polled = time.time()
+            return feed.index()
+
+    def fetch_many(self, users):
+        '''Fetch several feeds concurrently, returning {user: index}'''
+        pool = ThreadPool(max(min(self.workers, len(users)), 1))
+        try:
+            return dict(zip(users, pool.map(self.fetch, users)))
+        finally:
+            pool.terminate()
+
+    def close(self):
+        '''Stop the page pool and close pooled connections'''
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+'''
+Ingest
+------
+
+Streaming ingestion of event uploads too large to buffer. The body is read
+in chunks, each chunk is parsed into timestamps and folded into the running
+bucket counts of a `series.EventSeries`, so memory is bounded by the span
+of the events, up to `max_buckets` minutes, rather than their number. In approximate mode they are folded
+into a fixed-size `sketch.Sketch` instead.
+
+Two body formats can be streamed:
+
+    application/x-ndjson: one JSON timestamp per line, as accepted by
+        `transformations.to_index`
+    application/x-int64-frames: repeated frames of a little-endian uint32
+        byte length followed by that many bytes of little-endian int64
+        epoch offsets
+
+'''
+import json
+import struct
+import numpy as np
+import pandas as pd
+import formats
+import series
+import sketch
+import transformations as tr
+
+NDJSON = 'application/x-ndjson'
+FRAMES = 'application/x-int64-frames'
+STREAM_TYPES = [NDJSON, FRAMES]
+
+CHUNK_SIZE = 2**20
+
+
+class Ingest(object):
+    '''Incremental parser that folds a streamed body into an EventSeries.
+
+    Parameters
+    ----------
+    mimetype: string
+        One of STREAM_TYPES
+    fmt: string, default None
+        strftime format of NDJSON timestamp strings
+    unit: string, default 'ms'
+        Unit of epoch offsets
+    approximate: boolean, default False
+        Fold the events into a `sketch.Sketch` rather than an EventSeries
+    start, end: Timestamp, default None
+        Drop events outside of [start, end). Unbounded if None.
+    max_buckets: int, default transformations.MAX_BUCKETS
+        Most minutes the events may span, see `series.EventSeries` and
+        `sketch.Sketch`
+
+    Example
+    -------
+    >>>ingest = Ingest('application/x-ndjson')
+    >>>for chunk in chunks:
+    ...    ingest.feed(chunk)
+    >>>ingest.close().daily(how='sum')
+
+    '''
+
+    def __init__(self, mimetype, fmt=None, unit='ms', approximate=False,
+                 start=None, end=None, max_buckets=tr.MAX_BUCKETS):
+        if mimetype not in STREAM_TYPES:
+            raise formats.UnsupportedFormat('Cannot stream ' + mimetype)
+        self.mimetype = mimetype
+        self.fmt = fmt
+        self.unit = unit
+        self.series = sketch.Sketch(max_buckets=max_buckets) \
+            if approximate else series.EventSeries(max_buckets)
+        self.start = None if start is None else pd.Timestamp(start).value
+        self.end = None if end is None else pd.Timestamp(end).value
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        '''Parse the complete records buffered so far, keeping any partial
+        line or frame for the next chunk'''
+        self._buffer.extend(chunk)
+        if self.mimetype == NDJSON:
+            end = self._buffer.rfind(b'\n') + 1
+            if end:
+                self._lines(bytes(self._buffer[:end]))
+                del self._buffer[:end]
+        else:
+            self._frames()
+
+    def close(self):
+        '''Parse what is left of the body and return the EventSeries or
+        Sketch. Raises ValueError on a truncated frame.'''
+        if self.mimetype == NDJSON:
+            self._lines(bytes(self._buffer))
+        elif self._buffer:
+            raise ValueError('Body ends in a truncated frame')
+        del self._buffer[:]
+        return self.series
+
+    def _lines(self, block):
+        '''Fold a block of complete NDJSON lines into the series'''
+        index = parse_lines(block, fmt=self.fmt, unit=self.unit)
+        if index is not None:
+            self._append(index)
+
+    def _frames(self):
+        '''Fold the complete frames in the buffer into the series'''
+        stamps, offset = parse_frames(self._buffer)
+        if offset:
+            del self._buffer[:offset]
+            self._append(tr.to_index(stamps, unit=self.unit))
+
+    def _append(self, index):
+        '''Fold the events of `index` within the bounds into the series'''
+        if self.start is not None or self.end is not None:
+            stamps = index.asi8
+            keep = np.ones(len(stamps), dtype=bool)
+            if self.start is not None:
+                keep &= stamps >= self.start
+            if self.end is not None:
+                keep &= stamps < self.end
+            index = index[keep]
+        self.series.append(index)
+
+
+def parse_lines(block, fmt=None, unit='ms'):
+    '''DatetimeIndex of a block of complete NDJSON lines, or None if it
+    holds no events'''
+    lines = [x for x in block.decode('utf-8').splitlines() if x.strip()]
+    if not lines:
+        return None
+    return tr.to_index(json.loads('[' + ','.join(lines) + ']'), fmt=fmt,
+                       unit=unit)
+
+
+def parse_frames(buffer):
+    '''Epoch offsets of the complete frames at the start of `buffer`.
+
+    Returns
+    -------
+    Tuple of an int64 array and the number of bytes of `buffer` consumed
+
+    '''
+    offset, arrays = 0, []
+    while len(buffer) - offset >= 4:
+        size = struct.unpack_from('<I', buffer, offset)[0]
+        if size % 8:
+            raise ValueError('Frame size is not a multiple of 8 bytes')
+        if len(buffer) - offset - 4 < size:
+            break
+        arrays.append(np.frombuffer(buffer, dtype='<i8', count=size // 8,
+                                    offset=offset + 4).copy())
+        offset += 4 + size
+    if not arrays:
+        return np.zeros(0, dtype=np.int64), offset
+    return np.concatenate(arrays), offset
+
+
+def decode(body, mimetype, fmt=None, unit='ms'):
+    '''DatetimeIndex of a whole body in one of STREAM_TYPES, for routes that
+    keep the events themselves rather than their counts'''
+    if mimetype == NDJSON:
+        index = parse_lines(body, fmt=fmt, unit=unit)
+        return tr.to_index([]) if index is None else index
+    elif mimetype == FRAMES:
+        stamps, offset = parse_frames(body)
+        if offset != len(body):
+            raise ValueError('Body ends in a truncated frame')
+        return tr.to_index(stamps, unit=unit)
+    raise formats.UnsupportedFormat('Cannot stream ' + mimetype)
+
+
+def read(stream, mimetype, fmt=None, unit='ms', chunk_size=CHUNK_SIZE,
+         approximate=False, start=None, end=None,
+         max_buckets=tr.MAX_BUCKETS):
+    '''Read a file-like `stream` in chunks into an EventSeries, or a Sketch
+    if `approximate`, see `Ingest`'''
+    ingest = Ingest(mimetype, fmt=fmt, unit=unit, approximate=approximate,
+                    start=start, end=end, max_buckets=max_buckets)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        ingest.feed(chunk)
+    return ingest.close()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+'''
+Metrics
+-------
+
+Per-request stage timings and aggregated histograms.
+
+Code wraps the stages of a request in `stage(name)`. While metrics are
+enabled, each stage's duration is added to the current request's timings,
+reported in a `Server-Timing` header, and observed into a histogram, which
+is rendered in the Prometheus text format by `render`. While disabled,
+`stage` returns a shared no-op context manager.
+
+Enable with `metrics.enable()`, or by setting MCFLYIN_METRICS=1.
+
+'''
+import functools
+import os
+import resource
+import sys
+import threading
+import time
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0)
+BYTES = tuple(4**x for x in range(4, 16))
+
+#: ru_maxrss is in kilobytes on Linux and bytes on OS X
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+enabled = os.environ.get('MCFLYIN_METRICS', '') not in ('', '0')
+_local = threading.local()
+
+
+class Histogram(object):
+    '''Cumulative histogram of observations, per label value.
+
+    Parameters
+    ----------
+    name: string
+        Metric name
+    help: string
+        Metric description
+    buckets: tuple of floats
+        Upper bounds of the buckets, ascending
+    label: string
+        Name of the label the observations are split by
+
+    '''
+
+    def __init__(self, name, help, buckets, label='stage'):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label):
+        '''Add an observation of `value` under the label value `label`'''
+        with self._lock:
+            counts, total, count = self._series.get(
+                label, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[label] = (counts, total + value, count + 1)
+
+    def render(self):
+        '''Prometheus text format lines'''
+        lines = ['# HELP {0} {1}'.format(self.name, self.help),
+                 '# TYPE {0} histogram'.format(self.name)]
+        with self._lock:
+            for label in sorted(self._series):
+                counts, total, count = self._series[label]
+                tag = '{0}="{1}"'.format(self.label, label)
+                for bound, observed in zip(self.buckets, counts):
+                    lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(
+                        self.name, tag, bound, observed))
+                lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(
+                    self.name, tag, count))
+                lines.append('{0}_sum{{{1}}} {2}'.format(self.name, tag,
+                                                        total))
+                lines.append('{0}_count{{{1}}} {2}'.format(self.name, tag,
+                                                          count))
+        return lines
+
+    def clear(self):
+        '''Drop every observation'''
+        with self._lock:
+            self._series.clear()
+
+
+stage_seconds = Histogram('mcflyin_stage_seconds',
+                          'Duration of request stages', SECONDS)
+request_seconds = Histogram('mcflyin_request_seconds',
+                            'Duration of requests', SECONDS, label='route')
+request_bytes = Histogram('mcflyin_request_bytes', 'Size of request bodies',
+                          BYTES, label='route')
+response_bytes = Histogram('mcflyin_response_bytes',
+                           'Size of response bodies', BYTES, label='route')
+HISTOGRAMS = [stage_seconds, request_seconds, request_bytes, response_bytes]
+
+
+def enable(on=True):
+    '''Turn metrics collection on or off'''
+    global enabled
+    enabled = on
+
+
+class _Noop(object):
+    '''Context manager that does nothing, returned while disabled'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _Noop()
+
+
+class _Stage(object):
+    '''Context manager timing one stage of the current request'''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.time() - self.start
+        stages = getattr(_local, 'stages', None)
+        if stages is not None:
+            stages.append((self.name, seconds))
+        stage_seconds.observe(seconds, self.name)
+        return False
+
+
+def stage(name):
+    '''Time the enclosed block as stage `name`.
+
+    Example
+    -------
+    >>>with metrics.stage('parse'):
+    ...    index = to_index(data)
+
+    '''
+    return _Stage(name) if enabled else _NOOP
+
+
+def timed(name):
+    '''Decorate a function to time its calls as stage `name`'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def peak_rss():
+    '''Peak resident set size of this process, in bytes'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def begin():
+    '''Start collecting the stages of a request on this thread'''
+    if enabled:
+        _local.stages = []
+        _local.start = time.time()
+        _local.rss = peak_rss()
+
+
+def end(route, request_size=None, response_size=None):
+    '''Finish the request begun on this thread and observe its totals.
+
+    Returns
+    -------
+    List of (stage, seconds) tuples, with the request total last, and the
+    growth of the peak RSS during the request in bytes. Empty and 0 when
+    disabled.
+
+    '''
+    stages = getattr(_local, 'stages', None)
+    if not enabled or stages is None:
+        return [], 0
+    _local.stages = None
+    seconds = time.time() - _local.start
+    request_seconds.observe(seconds, route)
+    if request_size is not None:
+        request_bytes.observe(request_size, route)
+    if response_size is not None:
+        response_bytes.observe(response_size, route)
+    return stages + [('total', seconds)], peak_rss() - _local.rss
+
+
+def server_timing(stages, rss_growth=0):
+    '''Server-Timing header value for the stages of a request'''
+    entries = ['{0};dur={1:.3f}'.format(name, seconds * 1000)
+               for name, seconds in stages]
+    if rss_growth:
+        entries.append('rss;desc="peak RSS growth {0} bytes"'
+                       .format(rss_growth))
+    return ', '.join(entries)
+
+
+def render(gauges=None, counters=None):
+    '''Prometheus text format of the histograms, peak RSS and any extra
+    `gauges` and monotonically increasing `counters`, dicts of
+    {name: value}. Counter names should end in _total.'''
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    gauges = dict(gauges or {})
+    gauges['mcflyin_peak_rss_bytes'] = peak_rss()
+    for kind, values in [('counter', counters or {}), ('gauge', gauges)]:
+        for name in sorted(values):
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            lines.append('{0} {1}'.format(name, values[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    '''Reset every histogram'''
+    for histogram in HISTOGRAMS:
+        histogram.clear()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+'''
+Pyramid
+-------
+
+Pre-aggregated event counts of a dataset at minute, hour, day, week and
+month resolution, stored as .npy files and read back memory-mapped, so a
+range query at any resolution slices one level in O(points returned)
+instead of regrouping the raw events.
+
+Bins and labels match `transformations.resample` with the frequencies in
+LEVELS: minutes, hours and days are labelled by their start, weeks by the
+Sunday they end on, and months by their last day.
+
+'''
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import rolling
+import transformations as tr
+
+LEVELS = [('minute', 'T'), ('hour', 'H'), ('day', 'D'), ('week', 'W'),
+          ('month', 'M')]
+FREQS = dict(LEVELS)
+
+
+def _codes(stamps, level):
+    '''Bin codes of int64 nanosecond `stamps` at `level`'''
+    if level == 'minute':
+        return stamps // tr.MINUTE
+    elif level == 'hour':
+        return stamps // tr.HOUR
+    days = stamps // tr.DAY
+    if level == 'day':
+        return days
+    elif level == 'week':
+        return (days + 3) // 7
+    elif level == 'month':
+        return days.view('M8[D]').astype('M8[M]').astype(np.int64)
+    raise ValueError('level must be one of: ' +
+                     ', '.join(name for name, _ in LEVELS))
+
+
+def _labels(codes, level):
+    '''int64 nanosecond labels of bin `codes` at `level`'''
+    if level == 'minute':
+        return codes * tr.MINUTE
+    elif level == 'hour':
+        return codes * tr.HOUR
+    elif level == 'day':
+        return codes * tr.DAY
+    elif level == 'week':
+        return (codes * 7 + 3) * tr.DAY
+    month_ends = (codes + 1).view('M8[M]').astype('M8[D]').astype(np.int64)
+    return (month_ends - 1) * tr.DAY
+
+
+def _rollup(origin, counts, level):
+    '''Roll minute `counts` starting at minute `origin` up to `level`.
+
+    Returns
+    -------
+    Tuple of the first bin code and the counts at `level`
+
+    '''
+    minutes = np.arange(origin, origin + len(counts), dtype=np.int64)
+    codes = _codes(minutes * tr.MINUTE, level)
+    first = codes[0]
+    return first, np.bincount(codes - first, weights=counts).astype(np.int64)
+
+
+class Pyramid(object):
+    '''Rollup pyramid of one dataset in `directory`.
+
+    Parameters
+    ----------
+    directory: string
+        Directory holding one .npy count array per level, and the first bin
+        code of each level in pyramid.json
+
+    Example
+    -------
+    >>>pyramid = Pyramid.build(index, '/tmp/mcflyin/pyramids/abc123')
+    >>>pyramid.query('hour', start='2013-06-17', end='2013-06-18')
+
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'pyramid.json')) as f:
+            self.origins = json.load(f)
+        self.counts = dict((name, np.load(os.path.join(directory,
+                                                       name + '.npy'),
+                                          mmap_mode='r'))
+                           for name, _ in LEVELS)
+
+    @classmethod
+    def build(cls, index, directory, max_buckets=tr.MAX_BUCKETS):
+        '''Count a DatetimeIndex of events into a new pyramid in
+        `directory`.
+
+        The levels are written to a temporary directory that is renamed to
+        `directory` once complete, so files another reader has mapped are
+        never rewritten. If `directory` was built meanwhile, that pyramid
+        is kept and returned. The minute level is dense over the span of
+        the events, so events spanning more than `max_buckets` minutes
+        raise ValueError.
+
+        '''
+        stamps = index.asi8
+        stamps = stamps[stamps != tr.NAT]
+        if not len(stamps):
+            raise ValueError('Cannot build a pyramid without events')
+        codes = _codes(stamps, 'minute')
+        origin = codes.min()
+        tr.check_span(codes.max() - origin + 1, max_buckets)
+        parent = os.path.dirname(os.path.abspath(directory))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        tmp = tempfile.mkdtemp(dir=parent, prefix='.build-')
+        try:
+            counts = np.bincount(codes - origin).astype(np.int64)
+            origins = {'minute': int(origin)}
+            np.save(os.path.join(tmp, 'minute.npy'), counts)
+            for name, _ in LEVELS[1:]:
+                first, rolled = _rollup(origin, counts, name)
+                origins[name] = int(first)
+                np.save(os.path.join(tmp, name + '.npy'), rolled)
+            with open(os.path.join(tmp, 'pyramid.json'), 'w') as f:
+                json.dump(origins, f)
+            os.rename(tmp, directory)
+        except OSError:
+            if not os.path.exists(os.path.join(directory, 'pyramid.json')):
+                raise
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp)
+        return cls(directory)
+
+    def _bounds(self, level, start, end):
+        '''First and last bin codes of `level` with labels in [start, end]'''
+        origin = self.origins[level]
+        low, high = origin, origin + len(self.counts[level]) - 1
+        if start is not None:
+            low = max(low, _codes(np.array([start]), level)[0])
+        if end is not None:
+            high = min(high, _codes(np.array([end]), level)[0])
+        return low, high
+
+    def query(self, level, start=None, end=None, window=None, name=None):
+        '''Event counts at `level` with bin labels between `start` and
+        `end`.
+
+        Parameters
+        ----------
+        level: string
+            One of minute, hour, day, week, month
+        start, end: Timestamp, string or int64 nanoseconds, default None
+            Inclusive range of bin labels. Unbounded if None.
+        window: int, default None
+            Return rolling sums over `window` bins, as
+            `transformations.rolling_sum`
+        name: string, default None
+            Result column name. Defaults to `level`.
+
+        Returns
+        -------
+        DataFrame of counts, with NaN for empty bins
+
+        '''
+        if level not in self.counts:
+            raise ValueError('level must be one of: ' +
+                             ', '.join(x for x, _ in LEVELS))
+        start = None if start is None else pd.Timestamp(start).value
+        end = None if end is None else pd.Timestamp(end).value
+        low, high = self._bounds(level, start, end)
+        origin = self.origins[level]
+        lookback = 0 if window is None else min(window - 1, low - origin)
+        counts = np.asarray(self.counts[level][max(low - lookback - origin,
+                                                   0):
+                                               max(high - origin + 1, 0)],
+                            dtype=float)
+        counts[counts == 0] = np.nan
+        if window is not None:
+            starts = rolling.window_starts(np.arange(len(counts)), window)
+            counts = rolling.aggregate(counts, starts)[lookback:]
+        codes = np.arange(low, low + len(counts), dtype=np.int64)
+        labels = _labels(codes, level)
+        keep = np.ones(len(labels), dtype=bool)
+        if start is not None:
+            keep &= labels >= start
+        if end is not None:
+            keep &= labels <= end
+        return pd.DataFrame({name or level: counts[keep]},
+                            index=pd.DatetimeIndex(labels[keep]
+                                                   .view('M8[ns]')))
+
+
+class PyramidStore(object):
+    '''Pyramids of stored datasets, built on first query.
+
+    Parameters
+    ----------
+    directory: string
+        Directory holding a subdirectory per dataset pyramid
+    max_buckets: int, default transformations.MAX_BUCKETS
+        Most minutes that the events of a dataset may span, see
+        `Pyramid.build`
+
+    '''
+
+    def __init__(self, directory, max_buckets=tr.MAX_BUCKETS):
+        self.directory = directory
+        self.max_buckets = max_buckets
+        self._pyramids = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _dataset_lock(self, dataset_id):
+        '''Lock serializing builds and deletes of `dataset_id`'''
+        with self._lock:
+            return self._locks.setdefault(dataset_id, threading.Lock())
+
+    def get(self, dataset_id, index):
+        '''Pyramid of `dataset_id`, built from `index` if needed. Concurrent
+        first queries of a dataset wait for a single build.'''
+        with self._dataset_lock(dataset_id):
+            if dataset_id not in self._pyramids:
+                path = os.path.join(self.directory, dataset_id)
+                if os.path.exists(os.path.join(path, 'pyramid.json')):
+                    self._pyramids[dataset_id] = Pyramid(path)
+                else:
+                    self._pyramids[dataset_id] = Pyramid.build(
+                        index, path, self.max_buckets)
+            return self._pyramids[dataset_id]
+
+    def delete(self, dataset_id):
+        '''Remove the pyramid of `dataset_id`, if there is one'''
+        with self._dataset_lock(dataset_id):
+            self._pyramids.pop(dataset_id, None)
+            path = os.path.join(self.directory, dataset_id)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+        with self._lock:
+            self._locks.pop(dataset_id, None)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+'''
+Rolling
+-------
+
+Vectorized rolling window statistics over resampled event counts.
+
+Windows are either a number of rows or a time span such as '7D', which
+covers the rows with labels in (t - span, t] and so also works over
+irregular indexes. Sums, means and standard deviations come from prefix
+sums. Minimums and maximums use the van Herk/Gil-Werman block scans for
+fixed-length windows, the vectorized equivalent of a monotonic deque, and a
+sparse table for variable-length windows. Every window is one O(n) or
+O(n log n) pass over the same resampled values.
+
+NaN values are skipped, as by `pd.rolling_sum(min_periods=0)`. Windows
+without any values are NaN, as are standard deviations of fewer than two.
+
+'''
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+STATISTICS = ('sum', 'mean', 'min', 'max', 'std')
+
+
+def window_starts(index, window):
+    '''Position of the first row of the window ending at each row.
+
+    Parameters
+    ----------
+    index: Pandas DatetimeIndex
+    window: int or string
+        Number of rows, or a fixed time span such as '24H' or '7D'
+
+    '''
+    positions = np.arange(len(index))
+    if isinstance(window, (int, np.integer)):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        return np.maximum(positions - window + 1, 0)
+    span = to_offset(window).nanos
+    stamps = index.asi8
+    return np.searchsorted(stamps, stamps - span, side='right')
+
+
+class Windows(object):
+    '''Rolling windows given by the start of the window ending at each
+    row, see `window_starts`. Windows of one fixed length are detected once
+    so they can be computed with slices instead of gathers.'''
+
+    def __init__(self, starts):
+        self._starts = starts
+        self.rows = len(starts)
+        self.length = self.rows - starts[-1] if self.rows else 1
+        self.fixed = np.array_equal(
+            starts, np.maximum(np.arange(self.rows) - self.length + 1, 0))
+
+    @classmethod
+    def over(cls, index, window):
+        '''Windows of `window` over `index`, without building the starts
+        of row count windows'''
+        if not isinstance(window, (int, np.integer)):
+            return cls(window_starts(index, window))
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        windows = cls.__new__(cls)
+        windows._starts = None
+        windows.rows = len(index)
+        windows.length = max(min(window, windows.rows), 1)
+        windows.fixed = True
+        return windows
+
+    @property
+    def starts(self):
+        '''Position of the first row of each window'''
+        if self._starts is None:
+            self._starts = np.maximum(
+                np.arange(self.rows) - self.length + 1, 0)
+        return self._starts
+
+    def sizes(self):
+        '''Number of rows in each window'''
+        if self.fixed:
+            return np.minimum(np.arange(1, self.rows + 1), self.length)
+        return np.arange(1, self.rows + 1) - self.starts
+
+    def totals(self, prefix):
+        '''Totals of a prefix sum, with a leading zero, over each window'''
+        if not self.fixed:
+            return prefix[1:] - prefix[self.starts]
+        totals = prefix[1:].copy()
+        totals[self.length:] -= prefix[1:len(prefix) - self.length]
+        return totals
+
+
+class Column(object):
+    '''Prefix sums of one column of values, shared by every window and
+    statistic computed over it. NaN values are skipped.'''
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(self.values)
+        self.complete = valid.all()
+        self.zeroed = self.values if self.complete else \
+            np.where(valid, self.values, 0)
+        self.sums = _prefix(self.zeroed)
+        self.counts = None if self.complete else \
+            _prefix(valid.view(np.int8))
+        self._squares = None
+
+    @property
+    def squares(self):
+        '''Prefix sums of the squared values'''
+        if self._squares is None:
+            self._squares = _prefix(self.zeroed ** 2)
+        return self._squares
+
+    def filled(self, ufunc):
+        '''Values with NaN replaced by the identity of `ufunc`'''
+        if self.complete:
+            return self.values
+        fill = np.inf if ufunc is np.minimum else -np.inf
+        return np.where(np.isnan(self.values), fill, self.values)
+
+
+def _prefix(values):
+    '''Cumulative sum with a leading zero'''
+    dtype = np.int64 if values.dtype.kind in 'iu' else float
+    prefix = np.empty(len(values) + 1, dtype=dtype)
+    prefix[0] = 0
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+def _fixed_extreme(values, window, ufunc):
+    '''van Herk/Gil-Werman rolling ufunc over fixed `window` rows'''
+    n = len(values)
+    window = min(window, n)
+    if window <= 1:
+        return values.copy()
+    pad = (-n) % window
+    fill = np.inf if ufunc is np.minimum else -np.inf
+    blocks = np.concatenate([values, np.repeat(fill, pad)]).reshape(-1,
+                                                                    window)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    result = np.empty(n)
+    result[:window - 1] = prefix[:window - 1]
+    ufunc(suffix[:n - window + 1], prefix[window - 1:n],
+          out=result[window - 1:])
+    return result
+
+
+def _variable_extreme(values, starts, ufunc):
+    '''Sparse table rolling ufunc over windows of any length'''
+    ends = np.arange(1, len(values) + 1)
+    lengths = ends - starts
+    levels = np.floor(np.log2(lengths)).astype(int)
+    result = np.empty(len(values))
+    table = values
+    for level in range(levels.max() + 1):
+        if level:
+            width = 2 ** (level - 1)
+            table = ufunc(table[:-width], table[width:])
+        rows = np.flatnonzero(levels == level)
+        result[rows] = ufunc(table[starts[rows]],
+                             table[ends[rows] - 2 ** level])
+    return result
+
+
+def _extreme(column, windows, ufunc):
+    '''Rolling minimum or maximum, skipping NaN values'''
+    filled = column.filled(ufunc)
+    if windows.fixed:
+        return _fixed_extreme(filled, windows.length, ufunc)
+    return _variable_extreme(filled, windows.starts, ufunc)
+
+
+def _aggregate(column, windows, how):
+    '''Rolling statistic `how` of a Column over Windows'''
+    if column.complete:
+        count = windows.sizes() if how in ('mean', 'std') else None
+    else:
+        count = windows.totals(column.counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if how == 'sum':
+            result = windows.totals(column.sums)
+        elif how == 'mean':
+            result = windows.totals(column.sums) / count
+        elif how == 'std':
+            total = windows.totals(column.sums)
+            spread = windows.totals(column.squares) - total ** 2 / count
+            result = np.sqrt(np.maximum(spread, 0) / (count - 1))
+            result[count < 2] = np.nan
+        elif how == 'min':
+            result = _extreme(column, windows, np.minimum)
+        elif how == 'max':
+            result = _extreme(column, windows, np.maximum)
+        else:
+            raise ValueError('how must be one of: ' + ', '.join(STATISTICS))
+    if column.complete:
+        return result
+    return np.where(count > 0, result, np.nan)
+
+
+def aggregate(values, starts, how='sum'):
+    '''Rolling statistic `how` of `values` over the windows beginning at
+    `starts`, see `window_starts`'''
+    if how not in STATISTICS:
+        raise ValueError('how must be one of: ' + ', '.join(STATISTICS))
+    if not len(values):
+        return np.asarray(values, dtype=float)
+    return _aggregate(Column(values), Windows(starts), how)
+
+
+def rolling(df, windows, how='sum'):
+    '''Rolling statistics of every column of a DataFrame for several
+    windows, in one pass per window and statistic.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame with a DatetimeIndex
+    windows: list of ints or strings
+        Windows in rows, or time spans such as '1H', '24H', '7D'
+    how: string or list of strings, default 'sum'
+        Statistics from STATISTICS
+
+    Returns
+    -------
+    DataFrame with a column per input column, statistic and window, named
+    '{column}_{how}_{window}'
+
+    Example
+    -------
+    >>>rolling(hourly, windows=['24H', '7D'], how=['mean', 'max'])
+
+    '''
+    statistics = list(how) if isinstance(how, (list, tuple)) else [how]
+    for statistic in statistics:
+        if statistic not in STATISTICS:
+            raise ValueError('how must be one of: ' + ', '.join(STATISTICS))
+    columns = dict((x, Column(df[x].values)) for x in df.columns)
+    results = {}
+    names = []
+    for window in windows:
+        spans = Windows.over(df.index, window)
+        for statistic in statistics:
+            for column in df.columns:
+                name = '{0}_{1}_{2}'.format(column, statistic, window)
+                results[name] = _aggregate(columns[column], spans, statistic) \
+                    if len(df) else np.zeros(0)
+                names.append(name)
+    return pd.DataFrame(results, index=df.index, columns=names)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+'''
+Series
+------
+
+Named event series that accept appended events and keep running bucket
+counts, so transformations are answered from the aggregates instead of
+regrouping every raw timestamp.
+
+'''
+import threading
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+import pandas.tseries.offsets as offsets
+import rolling
+import transformations as tr
+
+
+class Buckets(object):
+    '''Growable array of event counts in fixed-width time buckets.
+
+    Parameters
+    ----------
+    width: int
+        Bucket width in nanoseconds
+    max_buckets: int, default transformations.MAX_BUCKETS
+        Most buckets that the first to last event may span. Adding events
+        beyond it raises ValueError, so the counts array stays bounded.
+
+    '''
+
+    def __init__(self, width, max_buckets=tr.MAX_BUCKETS):
+        self.width = width
+        self.max_buckets = max_buckets
+        self.origin = None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.first = None
+        self.last = None
+
+    def add(self, stamps):
+        '''Count int64 nanosecond `stamps` into their buckets.
+
+        Returns
+        -------
+        Array of the bucket codes that were empty before this call. Raises
+        ValueError, and counts nothing, if the events would span more than
+        `max_buckets`.
+
+        '''
+        codes, counts = np.unique(stamps // self.width, return_counts=True)
+        if not len(codes):
+            return codes
+        low, high = codes[0], codes[-1]
+        if self.first is not None:
+            low, high = min(low, self.first), max(high, self.last)
+        tr.check_span(high - low + 1, self.max_buckets)
+        self._reserve(codes[0], codes[-1])
+        slots = codes - self.origin
+        added = codes[self.counts[slots] == 0]
+        self.counts[slots] += counts
+        self.first = codes[0] if self.first is None \
+            else min(self.first, codes[0])
+        self.last = codes[-1] if self.last is None \
+            else max(self.last, codes[-1])
+        return added
+
+    def _reserve(self, low, high):
+        '''Grow the counts array to cover bucket codes `low` to `high`,
+        doubling it up to `max_buckets`'''
+        if self.origin is None:
+            self.origin = low
+            self.counts = np.zeros(max(high - low + 1, 64), dtype=np.int64)
+            return
+        size = len(self.counts)
+        if low < self.origin:
+            pad = max(self.origin - low, min(size, self.max_buckets - size))
+            self.counts = np.concatenate([np.zeros(pad, dtype=np.int64),
+                                          self.counts])
+            self.origin -= pad
+            size += pad
+        if high >= self.origin + size:
+            grow = max(high - self.origin - size + 1,
+                       min(size, self.max_buckets - size))
+            self.counts = np.concatenate([self.counts,
+                                          np.zeros(grow, dtype=np.int64)])
+
+    def frame(self):
+        '''Events DataFrame of counts from the first to the last non-empty
+        bucket, with NaN for empty buckets'''
+        values = self.counts[self.first - self.origin:
+                             self.last - self.origin + 1].astype(float)
+        values[values == 0] = np.nan
+        stamps = np.arange(self.first, self.last + 1) * self.width
+        return pd.DataFrame({'Events': values},
+                            index=pd.DatetimeIndex(stamps.view('M8[ns]')))
+
+
+class EventSeries(object):
+    '''Running aggregates of a growing stream of events.
+
+    Keeps minute, hour and day bucket counts, the 7x24 weekday by hour
+    count matrix, and the number of non-empty hourly and daily bins per
+    weekday and hour for the mean statistics. Each `append` costs
+    O(batch), and the query methods match the results of the
+    `transformations` functions over all of the appended events.
+
+    Memory is bounded by the span of the events, which may cover at most
+    `max_buckets` minutes.
+
+    Parameters
+    ----------
+    max_buckets: int, default transformations.MAX_BUCKETS
+        Most minutes that the first to last event may span. Appending
+        events beyond it raises ValueError.
+
+    Example
+    -------
+    >>>series = EventSeries()
+    >>>series.append(index)
+    >>>series.daily_hours(how='mean')
+
+    '''
+
+    def __init__(self, max_buckets=tr.MAX_BUCKETS):
+        self.events = 0
+        self.minutes = Buckets(tr.MINUTE, max_buckets)
+        self.hours = Buckets(tr.HOUR, max_buckets)
+        self.days = Buckets(tr.DAY, max_buckets)
+        self.matrix = np.zeros((7, 24), dtype=np.int64)
+        self.hour_bins = np.zeros((7, 24), dtype=np.int64)
+        self.day_bins = np.zeros(7, dtype=np.int64)
+        self._lock = threading.RLock()
+
+    def append(self, index):
+        '''Add a DatetimeIndex of events to the aggregates'''
+        stamps = index.asi8
+        stamps = stamps[stamps != tr.NAT]
+        if not len(stamps):
+            return
+        days, hours = tr.day_hour_codes(stamps)
+        with self._lock:
+            self.minutes.add(stamps)
+            self.events += len(stamps)
+            self.matrix += np.bincount(days * 24 + hours,
+                                       minlength=168).reshape(7, 24)
+            days, hours = tr.day_hour_codes(self.hours.add(stamps) * tr.HOUR)
+            self.hour_bins += np.bincount(days * 24 + hours,
+                                          minlength=168).reshape(7, 24)
+            days, _ = tr.day_hour_codes(self.days.add(stamps) * tr.DAY)
+            self.day_bins += np.bincount(days, minlength=7)
+
+    def _buckets(self, key):
+        '''Coarsest buckets that resampling to `key` can be built from'''
+        offset = to_offset(key)
+        if not isinstance(offset, offsets.Tick):
+            return self.days
+        for buckets in (self.days, self.hours, self.minutes):
+            if offset.nanos % buckets.width == 0:
+                return buckets
+        raise ValueError('Series are aggregated to the minute, cannot '
+                         'resample to ' + key)
+
+    def resample(self, freq=None):
+        '''Resample the series, as `transformations.resample`'''
+        key, value = list(freq.items())[0]
+        with self._lock:
+            sampled = self._buckets(key).frame()
+        return sampled.resample(key, how='sum').rename(
+            columns={'Events': value})
+
+    def combined_resample(self, freq=None, fill='pad'):
+        '''Resample to several frequencies, as
+        `transformations.combined_resample`'''
+        resampled = {}
+        levels = []
+        for key, value in tr.freq_specs(freq):
+            resampled[value] = self.resample(freq={key: value})
+            levels.append(resampled[value])
+        resampled['Combined'] = tr.combine_levels(levels, fill=fill)
+        return resampled
+
+    def rolling_sum(self, window=None, freq=None):
+        '''Rolling sum of the resampled series, as
+        `transformations.rolling_sum`'''
+        sampled = self.resample(freq=freq)
+        starts = rolling.window_starts(sampled.index, window)
+        return pd.DataFrame(rolling.aggregate(sampled.values[:, 0], starts),
+                            index=sampled.index, columns=sampled.columns)
+
+    def rolling_stats(self, freq=None, windows=None, how='sum'):
+        '''Rolling statistics of the resampled series, as
+        `transformations.rolling_stats`'''
+        if not isinstance(windows, (list, tuple)):
+            windows = [windows]
+        return rolling.rolling(self.resample(freq=freq), windows, how)
+
+    def _mean_bins(self, sums, bins, first, last, width):
+        '''Mean over non-empty bins, and the codes present in the span of
+        bins from `first` to `last`'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(bins > 0, sums / bins.astype(float), np.nan)
+        days, hours = tr.span_codes(first * width // tr.HOUR,
+                                    last * width // tr.HOUR)
+        present = np.zeros((7, 24), dtype=bool)
+        present[days, hours] = True
+        return means, present
+
+    def hourly(self, how=None):
+        '''Hour of day statistics, as `transformations.hourly`'''
+        with self._lock:
+            if how == 'mean':
+                means, present = self._mean_bins(
+                    self.matrix.sum(axis=0), self.hour_bins.sum(axis=0),
+                    self.hours.first, self.hours.last, tr.HOUR)
+                return tr.hour_table(means, present.any(axis=0))
+            sums = self.matrix.sum(axis=0)
+            return tr.hour_table(sums, sums > 0)
+
+    def daily(self, how=None):
+        '''Day of week statistics, as `transformations.daily`'''
+        with self._lock:
+            if how == 'mean':
+                means, present = self._mean_bins(
+                    self.matrix.sum(axis=1), self.day_bins,
+                    self.days.first, self.days.last, tr.DAY)
+                return tr.weekday_table(means, present.any(axis=1))
+            sums = self.matrix.sum(axis=1)
+            return tr.weekday_table(sums, sums > 0)
+
+    def daily_hours(self, how=None):
+        '''Weekday by hour statistics, as `transformations.daily_hours`'''
+        with self._lock:
+            if how == 'mean':
+                means, present = self._mean_bins(
+                    self.matrix, self.hour_bins,
+                    self.hours.first, self.hours.last, tr.HOUR)
+                return tr.weekday_hour_table(means, present)
+            return tr.weekday_hour_table(self.matrix, self.matrix > 0)
+
+    def forward(self, periods=180):
+        '''Hourly projection of the next `periods`, as
+        `transformations.forward`'''
+        with self._lock:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                dist = np.where(self.hour_bins > 0,
+                                self.matrix / self.hour_bins.astype(float),
+                                np.nan)
+            start = (self.hours.last + 1) * tr.HOUR
+        return tr.project(dist, start, periods)
+
+    def batch(self, operations=None):
+        '''Run several operations over the series, as
+        `transformations.batch`'''
+        results = []
+        for operation in operations:
+            params = dict(operation)
+            name = params.pop('op', None)
+            if name not in OPERATIONS:
+                raise ValueError('Unknown operation: {0}'.format(name))
+            results.append(getattr(self, name)(**params))
+        return results
+
+
+OPERATIONS = ('resample', 'combined_resample', 'rolling_sum',
+              'rolling_stats', 'hourly', 'daily', 'daily_hours', 'forward')
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+'''
+Sketch
+------
+
+Approximate transformations of event streams too large to process exactly,
+in memory that does not grow with the number of events.
+
+A `Reservoir` keeps a uniform sample of all events. Resample, hourly,
+daily and weekday by hour sums are counted over the sample and scaled by
+the events each sampled event stands for. For per-series breakdowns, a
+`CountMin` sketch counts the events of each series per hour.
+
+Every estimate comes with bounds, as `<column>_low` and `<column>_high`
+columns next to each estimated column. Sample estimates give a 95%
+binomial confidence interval. Count-min estimates never undercount, and
+overcount each hour by at most e / width of all events with probability
+1 - e^-depth.
+
+'''
+import numpy as np
+import pandas as pd
+import transformations as tr
+
+Z = 1.96
+OPERATIONS = ('resample', 'hourly', 'daily', 'daily_hours')
+
+
+class Reservoir(object):
+    '''Uniform sample of at most `size` int64 stamps from a stream
+    (Algorithm R, applied a batch at a time).
+
+    Parameters
+    ----------
+    size: int, default 65536
+        Sample size
+    seed: int, default None
+        Random seed
+
+    '''
+
+    def __init__(self, size=2**16, seed=None):
+        self.size = size
+        self.seen = 0
+        self._sample = np.empty(size, dtype=np.int64)
+        self._random = np.random.RandomState(seed)
+
+    def __len__(self):
+        return min(self.seen, self.size)
+
+    def add(self, stamps):
+        '''Offer an array of stamps to the sample'''
+        filled = len(self)
+        fill = min(self.size - filled, len(stamps))
+        self._sample[filled:filled + fill] = stamps[:fill]
+        rest = stamps[fill:]
+        if len(rest):
+            seen = self.seen + fill + np.arange(1, len(rest) + 1)
+            slots = (self._random.random_sample(len(rest)) * seen) \
+                .astype(np.int64)
+            keep = slots < self.size
+            self._sample[slots[keep]] = rest[keep]
+        self.seen += len(stamps)
+
+    def sample(self):
+        '''Sorted DatetimeIndex of the sampled events'''
+        return pd.DatetimeIndex(np.sort(self._sample[:len(self)])
+                                .view('M8[ns]'))
+
+    def bounds(self, counts):
+        '''Estimated totals of sample `counts`, and their 95% confidence
+        bounds'''
+        sampled, seen = len(self), self.seen
+        share = counts / float(sampled)
+        correction = (seen - sampled) / float(max(seen - 1, 1))
+        error = Z * seen * np.sqrt(share * (1 - share) / sampled *
+                                   correction)
+        estimate = share * seen
+        low = np.maximum(estimate - error, counts)
+        high = np.minimum(estimate + error, seen - (sampled - counts))
+        return estimate, low, high
+
+
+class CountMin(object):
+    '''Count-min sketch of int64 items, with `depth` rows of `width`
+    counters.
+
+    Parameters
+    ----------
+    width: int, default 65536
+        Counters per row, a power of 2
+    depth: int, default 4
+        Number of rows
+    seed: int, default None
+        Random seed of the row hashes
+
+    '''
+
+    def __init__(self, width=2**16, depth=4, seed=None):
+        bits = int(np.log2(width))
+        if width < 2 or 2**bits != width:
+            raise ValueError('width must be a power of 2')
+        random = np.random.RandomState(seed)
+        self.width = width
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self._shift = np.uint64(64 - bits)
+        self._multipliers = random.randint(0, 2**62, depth) \
+            .astype(np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def _slots(self, items):
+        '''Counter of each item in each row, by multiply-shift hashing'''
+        items = np.asarray(items, dtype=np.int64).view(np.uint64)
+        return [((items * a) >> self._shift).astype(np.intp)
+                for a in self._multipliers]
+
+    def add(self, items):
+        '''Count an array of int64 items'''
+        items, counts = np.unique(items, return_counts=True)
+        for row, slots in zip(self.table, self._slots(items)):
+            np.add.at(row, slots, counts)
+        self.total += counts.sum()
+
+    def estimate(self, items):
+        '''Estimated counts of an array of int64 items'''
+        return np.min([row[slots] for row, slots in
+                       zip(self.table, self._slots(items))], axis=0)
+
+    @property
+    def error(self):
+        '''Overcount bound of a single item estimate'''
+        return np.e / self.width * self.total
+
+
+def _bounded(estimate, low, high):
+    '''DataFrame of the `estimate` columns, each followed by its `_low` and
+    `_high` bound columns'''
+    columns = []
+    for name in estimate.columns:
+        columns.extend([estimate[name].rename(name),
+                        low[name].rename(name + '_low'),
+                        high[name].rename(name + '_high')])
+    return pd.concat(columns, axis=1)
+
+
+class Sketch(object):
+    '''Fixed-memory approximate aggregates of a stream of events.
+
+    Appends cost O(batch) and memory stays at the reservoir and counter
+    sizes, plus a table of at most `max_labels` series labels, however
+    many events are appended. The events may span at most `max_buckets`
+    minutes, and keyed estimates, which cover every hour of the span for
+    each series, at most `max_buckets` series hours, so the work and
+    memory of a query are bounded too. The query methods take the
+    parameters of the `transformations` functions of the same name, and
+    return their estimates with bounds. Keyed events are answered per
+    series from hourly count-min counters, others from the sample. Only
+    sums are estimated.
+
+    Parameters
+    ----------
+    size: int, default 65536
+        Reservoir sample size
+    width: int, default 65536
+        Count-min counters per row
+    depth: int, default 4
+        Count-min rows
+    seed: int, default None
+        Random seed
+    max_labels: int, default 10000
+        Most series that keyed events may hold. Appending events of more
+        series raises ValueError.
+    max_buckets: int, default transformations.MAX_BUCKETS
+        Most minutes the events may span, and most hours times series that
+        keyed events may span. Appending events beyond it raises
+        ValueError.
+
+    Example
+    -------
+    >>>sketch = Sketch(size=10000)
+    >>>for index in batches:
+    ...    sketch.append(index)
+    >>>sketch.hourly(how='sum')
+
+    '''
+
+    def __init__(self, size=2**16, width=2**16, depth=4, seed=None,
+                 max_labels=10000, max_buckets=tr.MAX_BUCKETS):
+        self.max_labels = max_labels
+        self.max_buckets = max_buckets
+        self.events = 0
+        self.reservoir = Reservoir(size, seed=seed)
+        self.counters = CountMin(width, depth, seed=seed)
+        self.labels = []
+        self.first = None
+        self.last = None
+        self._keys = {}
+
+    def append(self, index):
+        '''Add a DatetimeIndex or Keyed batch of events'''
+        keyed = isinstance(index, tr.Keyed)
+        stamps = index.index.asi8 if keyed else index.asi8
+        valid = stamps != tr.NAT
+        stamps = stamps[valid]
+        if keyed:
+            new = [x for x in index.labels if x not in self._keys]
+            if len(self.labels) + len(new) > self.max_labels:
+                raise ValueError('Sketches hold at most {0} series'
+                                 .format(self.max_labels))
+        if not len(stamps):
+            return
+        first, last = stamps.min() // tr.MINUTE, stamps.max() // tr.MINUTE
+        if self.first is not None:
+            first, last = min(first, self.first), max(last, self.last)
+        tr.check_span(last - first + 1, self.max_buckets)
+        if keyed:
+            tr.check_span((len(self.labels) + len(new)) *
+                          (last // 60 - first // 60 + 1), self.max_buckets)
+            keys = np.array([self._key(x) for x in index.labels],
+                            dtype=np.int64)[index.codes[valid]]
+            self.counters.add(keys * 2**32 + stamps // tr.HOUR)
+        self.first, self.last = first, last
+        self.reservoir.add(stamps)
+        self.events += len(stamps)
+
+    def _key(self, label):
+        '''Integer key of series `label`'''
+        if label not in self._keys:
+            self._keys[label] = len(self.labels)
+            self.labels.append(label)
+        return self._keys[label]
+
+    def _estimate(self, operation, how):
+        '''Run `operation` over the sketch: a function of an events
+        DataFrame or DatetimeIndex that returns a DataFrame of sums'''
+        if how not in (None, 'sum'):
+            raise ValueError('Approximate results are sums only')
+        if not self.events:
+            raise ValueError('No events')
+        if not self.labels:
+            counts = operation(self.reservoir.sample())
+            estimate, low, high = self.reservoir.bounds(counts)
+            return _bounded(estimate, low, high)
+        hours = np.arange(self.first // 60, self.last // 60 + 1,
+                          dtype=np.int64)
+        stamps = pd.DatetimeIndex((hours * tr.HOUR).view('M8[ns]'))
+        error = self.counters.error
+        results = {}
+        for key, label in enumerate(self.labels):
+            counts = self.counters.estimate(key * 2**32 + hours)
+            present = counts > 0
+            frames = [pd.DataFrame({'Events': values[present]},
+                                   index=stamps[present])
+                      for values in (counts, np.maximum(counts - error, 0),
+                                     counts)]
+            results[label] = _bounded(*[operation(x) for x in frames])
+        return results
+
+    def resample(self, freq=None):
+        '''Estimate `transformations.resample`. Keyed events are counted by
+        the hour, so their frequency must be whole hours.'''
+        key = list(freq.keys())[0]
+        if self.labels and tr.freq_nanos(key) % tr.HOUR:
+            raise ValueError('Keyed events are sketched by the hour, cannot '
+                             'resample to ' + key)
+        return self._estimate(lambda df: tr.resample.frame(df=df, freq=freq),
+                              None)
+
+    def hourly(self, how=None):
+        '''Estimate `transformations.hourly` sums'''
+        return self._estimate(lambda df: tr.hourly.frame(df=df), how)
+
+    def daily(self, how=None):
+        '''Estimate `transformations.daily` sums'''
+        return self._estimate(lambda df: tr.daily.frame(df=df), how)
+
+    def daily_hours(self, how=None):
+        '''Estimate `transformations.daily_hours` sums'''
+        return self._estimate(lambda df: tr.daily_hours(df=df), how)
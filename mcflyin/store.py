@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+'''
+Store
+-----
+
+Server-side storage of parsed event timestamps, keyed by content hash, so
+clients can upload a dataset once and refer to it by ID afterwards.
+
+'''
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from cache import events_key
+
+
+class DatasetStore(object):
+    '''In-memory LRU store of int64 timestamp arrays.
+
+    When the arrays held in memory exceed `max_bytes`, the least recently
+    used are evicted. If `spill_dir` is set, evicted arrays are written to
+    .npy files there and served from memory-mapped reads instead of being
+    dropped, and `on_evict` is called with the ID of each dropped dataset.
+    All methods are safe to call from concurrent threads.
+
+    Parameters
+    ----------
+    max_bytes: int, default 256MB
+        Memory budget for in-memory arrays
+    spill_dir: string, default None
+        Directory for spilled .npy files. Evicted datasets are discarded
+        if None.
+    on_evict: function, default None
+        Called with the ID of each discarded dataset, after the store
+        lock is released, to drop what was derived from it
+
+    Example
+    -------
+    >>>store = DatasetStore(max_bytes=2**30, spill_dir='/tmp/mcflyin')
+    >>>dataset_id = store.put(index)
+    >>>index = store.get(dataset_id)
+
+    '''
+
+    def __init__(self, max_bytes=256 * 2**20, spill_dir=None,
+                 on_evict=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self._memory = OrderedDict()
+        self._spilled = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, dataset_id):
+        with self._lock:
+            return dataset_id in self._memory or dataset_id in self._spilled
+
+    def __len__(self):
+        with self._lock:
+            return len(self._memory) + len(self._spilled)
+
+    key = staticmethod(events_key)
+
+    def put(self, index):
+        '''Store a DatetimeIndex and return its dataset ID'''
+        dataset_id = self.key(index)
+        dropped = []
+        with self._lock:
+            if dataset_id in self._memory:
+                self._memory[dataset_id] = self._memory.pop(dataset_id)
+            elif dataset_id not in self._spilled:
+                stamps = np.array(index.asi8, dtype=np.int64)
+                self._memory[dataset_id] = stamps
+                self.nbytes += stamps.nbytes
+                dropped = self._evict()
+        if self.on_evict is not None:
+            for evicted in dropped:
+                self.on_evict(evicted)
+        return dataset_id
+
+    def get(self, dataset_id):
+        '''Return the DatetimeIndex for `dataset_id`, or raise KeyError'''
+        with self._lock:
+            if dataset_id in self._memory:
+                stamps = self._memory.pop(dataset_id)
+                self._memory[dataset_id] = stamps
+            elif dataset_id in self._spilled:
+                stamps = np.load(self._spilled[dataset_id], mmap_mode='r')
+            else:
+                raise KeyError(dataset_id)
+        return pd.DatetimeIndex(stamps.view('M8[ns]'))
+
+    def delete(self, dataset_id):
+        '''Remove a dataset from memory and disk'''
+        with self._lock:
+            if dataset_id in self._memory:
+                self.nbytes -= self._memory.pop(dataset_id).nbytes
+            elif dataset_id in self._spilled:
+                os.remove(self._spilled.pop(dataset_id))
+            else:
+                raise KeyError(dataset_id)
+
+    def _evict(self):
+        '''Evict least recently used arrays until within the budget. Called
+        with the lock held.
+
+        Returns
+        -------
+        List of the IDs of the datasets discarded rather than spilled
+
+        '''
+        dropped = []
+        while self.nbytes > self.max_bytes and self._memory:
+            dataset_id, stamps = self._memory.popitem(last=False)
+            self.nbytes -= stamps.nbytes
+            if self.spill_dir is not None:
+                if not os.path.isdir(self.spill_dir):
+                    os.makedirs(self.spill_dir)
+                path = os.path.join(self.spill_dir, dataset_id + '.npy')
+                np.save(path, stamps)
+                self._spilled[dataset_id] = path
+            else:
+                dropped.append(dataset_id)
+        return dropped
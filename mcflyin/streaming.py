@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming
+---------
+
+Incremental encoding of transformation results, so long outputs such as a
+year of minutes or a long forward projection can be sent as a chunked
+response while they are being encoded, instead of after one large
+`json.dumps`.
+
+The JSON is identical to `transformations.jsonified`, emitted in slices of
+`slice_size` rows, and optionally compressed on the fly with gzip or, if
+the `zstandard` package is installed, zstd.
+
+Request bodies sent with `Content-Encoding: gzip` are inflated as they are
+read, by the `InflateRequests` WSGI middleware.
+
+'''
+import json
+import zlib
+import pandas as pd
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+import formats
+import transformations as tr
+
+SLICE_SIZE = 10000
+CHUNK_SIZE = 2**16
+
+
+def _zstd():
+    '''The zstandard module, or None if it is not installed'''
+    try:
+        return formats._import('zstandard')
+    except formats.UnsupportedFormat:
+        return None
+
+
+def encodings():
+    '''Content encodings available for streamed responses, preferred
+    first'''
+    return ['zstd', 'gzip'] if _zstd() is not None else ['gzip']
+
+
+def negotiate(accept_encodings):
+    '''Pick a content encoding from a werkzeug Accept, or None for the
+    identity encoding'''
+    return accept_encodings.best_match(encodings(), default=None)
+
+
+def _array(values, size, convert):
+    '''Yield a JSON array of `values` in slices of `size`'''
+    yield '['
+    for start in range(0, len(values), size):
+        part = json.dumps(convert(values[start:start + size]),
+                          separators=(',', ':'))[1:-1]
+        yield part if start == 0 else ',' + part
+    yield ']'
+
+
+def _frame(df, time_format, size):
+    '''Yield the `to_dict` JSON of a DataFrame. The ISO precision is chosen
+    once for the whole index, so every slice is formatted alike.'''
+    unit = None
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is None and \
+            time_format == 'iso':
+        unit = tr.iso_unit(df.index.asi8)
+    yield '{'
+    for i, name in enumerate(df.columns):
+        yield '{0}{1}:{{"time":'.format(',' if i else '', json.dumps(name))
+        for part in _array(df.index, size,
+                           lambda x: tr.format_times(x, time_format, unit)):
+            yield part
+        yield ',"data":'
+        for part in _array(df[name].values, size, tr.format_values):
+            yield part
+        yield '}'
+    yield '}'
+
+
+def _result(result, time_format, size):
+    '''Yield the `jsonified` JSON of a result'''
+    if not isinstance(result, dict):
+        for part in _frame(result, time_format, size):
+            yield part
+        return
+    yield '{'
+    for i, (label, df) in enumerate(result.items()):
+        yield '{0}{1}:'.format(',' if i else '', json.dumps(label))
+        for part in _frame(df, time_format, size):
+            yield part
+    yield '}'
+
+
+def iter_json(result, time_format='iso', slice_size=SLICE_SIZE):
+    '''Encode a transformation result as JSON, incrementally.
+
+    Parameters
+    ----------
+    result: DataFrame, or dict of DataFrames for keyed input
+    time_format: string, default 'iso'
+        'iso' for ISO 8601 strings, 'epoch' for epoch milliseconds
+    slice_size: int, default 10000
+        Rows encoded per chunk
+
+    Returns
+    -------
+    Iterator of UTF-8 encoded chunks that join to the JSON of
+    `transformations.jsonified(result)`
+
+    '''
+    if time_format not in ('iso', 'epoch'):
+        raise ValueError('time_format must be one of: iso, epoch')
+    return _chunks(_result(result, time_format, slice_size))
+
+
+def _chunks(parts):
+    '''Join string parts into UTF-8 chunks of about CHUNK_SIZE bytes'''
+    pending, size = [], 0
+    for part in parts:
+        pending.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+    if pending:
+        yield ''.join(pending).encode('utf-8')
+
+
+def compress(chunks, encoding, level=None):
+    '''Compress an iterator of byte chunks with 'gzip' or 'zstd', yielding
+    compressed output as it becomes available.
+
+    The default levels, 1 for gzip and 3 for zstd, favour keeping up with
+    the encoder over the compression ratio.
+
+    '''
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(1 if level is None else level,
+                                      zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == 'zstd' and _zstd() is not None:
+        compressor = _zstd().ZstdCompressor(
+            level=3 if level is None else level).compressobj()
+    else:
+        raise formats.UnsupportedFormat('Cannot compress with ' + encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Inflate(object):
+    '''Read-only file-like that inflates a gzip `stream` as it is read,
+    raising BadRequest for a corrupt body and RequestEntityTooLarge past
+    `max_size` inflated bytes'''
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = b''
+        self._done = False
+
+    def _fill(self, size):
+        '''Inflate until `size` bytes are buffered, or all if negative'''
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            chunk = self._inflater.unconsumed_tail or \
+                self.stream.read(CHUNK_SIZE)
+            try:
+                if chunk:
+                    data = self._inflater.decompress(chunk, CHUNK_SIZE)
+                else:
+                    data = self._inflater.flush()
+                    self._done = True
+            except zlib.error:
+                raise BadRequest('Invalid gzip request body')
+            self.size += len(data)
+            if self.size > self.max_size:
+                raise RequestEntityTooLarge()
+            self._buffer += data
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while b'\n' not in self._buffer and not self._done:
+            self._fill(len(self._buffer) + CHUNK_SIZE)
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+class InflateRequests(object):
+    '''WSGI middleware that inflates `Content-Encoding: gzip` request
+    bodies, up to `max_size` inflated bytes.
+
+    Example
+    -------
+    >>>app.wsgi_app = InflateRequests(app.wsgi_app)
+
+    '''
+
+    def __init__(self, app, max_size=2**31):
+        self.app = app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            environ['wsgi.input'] = Inflate(get_input_stream(environ),
+                                            self.max_size)
+            environ['wsgi.input_terminated'] = True
+            environ.pop('CONTENT_LENGTH', None)
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
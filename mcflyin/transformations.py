@@ -7,50 +7,253 @@ Pandas Data Transformations
 
 '''
 import json
+import fractions
 import functools
+import warnings
+from collections import namedtuple
 import pandas as pd
-import pandas.tseries.offsets as offsets
 import numpy as np
-import statsmodels.api as sm
+from pandas.tseries.frequencies import to_offset
+import pandas.tseries.offsets as offsets
+import metrics
+import rolling
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+NAT = np.iinfo(np.int64).min
+MINUTE = 60 * 10**9
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+#: Default limit on the minute buckets spanned by events kept as dense
+#: counts, about 16 years
+MAX_BUCKETS = 2**23
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+            'Saturday', 'Sunday']
+
+
+def _typeit(obj):
+    '''Convert a single scalar into a JSON-serializable type'''
+    if isinstance(obj, string_types):
+        return obj
+    elif pd.isnull(obj):
+        return str(obj)
+    elif hasattr(obj, 'timetuple'):
+        return obj.isoformat()
+    elif hasattr(obj, 'item'):
+        return obj.item()
+    elif hasattr(obj, '__float__'):
+        return float(obj)
+    elif hasattr(obj, '__int__'):
+        return int(obj)
+    else:
+        raise TypeError('cannot serialize index of type '
+                        + type(obj).__name__)
+
+
+def check_span(buckets, max_buckets):
+    '''Raise ValueError if events spanning `buckets` time buckets exceed
+    the limit of `max_buckets`'''
+    if buckets > max_buckets:
+        raise ValueError('Events span {0} buckets, more than the limit of {1}'
+                         .format(buckets, max_buckets))
+
+
+def iso_unit(stamps):
+    '''Coarsest of 's', 'us' and 'ns' that represents every non-null int64
+    nanosecond stamp exactly, the precision of ISO 8601 `format_times`'''
+    valid = stamps[stamps != NAT]
+    if not (valid % 10**9).any():
+        return 's'
+    elif not (valid % 10**3).any():
+        return 'us'
+    return 'ns'
+
+
+def format_times(index, time_format='iso', unit=None):
+    '''Convert an index to a list of JSON-serializable values in bulk.
+
+    Datetime indexes are converted straight from the int64 buffer, either
+    to ISO 8601 strings or to epoch milliseconds.
+
+    Parameters
+    ----------
+    index: Pandas Index
+    time_format: string, default 'iso'
+        'iso' for ISO 8601 strings, 'epoch' for epoch milliseconds
+    unit: string, default None
+        ISO 8601 precision, 's', 'us' or 'ns'. Defaults to the `iso_unit`
+        of `index`; pass the unit of a whole index to format slices of it
+        alike.
+
+    '''
+    if not isinstance(index, pd.DatetimeIndex):
+        return [_typeit(x) for x in index] if index.dtype == object \
+            else index.tolist()
+    if index.tz is not None:
+        return [_typeit(x) for x in index]
+
+    stamps = index.asi8
+    nat = stamps == NAT
+    if time_format == 'epoch':
+        if nat.any():
+            epoch = (stamps // 10**6).astype(object)
+            epoch[nat] = 'NaT'
+            return epoch.tolist()
+        return (stamps // 10**6).tolist()
+    elif time_format != 'iso':
+        raise ValueError('time_format must be one of: iso, epoch')
+
+    if unit is None:
+        unit = iso_unit(stamps)
+    as_unit = stamps.view('M8[ns]').astype('M8[{0}]'.format(unit))
+    return np.datetime_as_string(as_unit).tolist()
+
+
+def format_values(values):
+    '''Convert an array of values to a list of JSON-serializable values in
+    bulk, with nulls converted to strings via a mask'''
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return format_times(pd.DatetimeIndex(values))
+    if values.dtype.kind not in 'biuf':
+        return [_typeit(x) for x in values]
+    if values.dtype.kind == 'f':
+        mask = np.isnan(values)
+        if mask.any():
+            converted = values.astype(object)
+            converted[mask] = 'nan'
+            return converted.tolist()
+    return values.tolist()
+
+
+def to_dict(df, time_format='iso'):
+    '''Convert a DataFrame to a dict of {column: {'time': [], 'data': []}}.
+
+    The index is converted once and shared by all of the columns.
+
+    '''
+    times = format_times(df.index, time_format=time_format)
+    jsonified = {}
+    for name in df.columns:
+        jsonified[name] = {'time': times,
+                           'data': format_values(df[name].values)}
+    return jsonified
+
+
+@metrics.timed('jsonify')
+def jsonified(result, time_format='iso'):
+    '''`to_dict` of a DataFrame, or of each DataFrame in a dict of
+    per-series results'''
+    if isinstance(result, dict):
+        return dict((label, to_dict(frame, time_format=time_format))
+                    for label, frame in result.items())
+    return to_dict(result, time_format=time_format)
 
 
 def jsonify(func):
-    '''Type checking kludge until Pandas 11.1 ships with JSON support'''
+    '''Convert the DataFrame returned by `func` to a JSON-serializable dict.
+
+    Accepts an optional `time_format` keyword, passed to `to_dict`. The
+    undecorated function is available as `wrapper.frame`. Per-series
+    results of keyed input are converted to a dict of {series: dict}.
+
+    '''
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        time_format = kwargs.pop('time_format', 'iso')
+        return jsonified(func(*args, **kwargs), time_format=time_format)
 
-        df = func(*args, **kwargs)
-
-        def typeit(obj):
-            if isinstance(obj, str):
-                return obj
-            elif pd.isnull(obj):
-                return str(obj)
-            elif hasattr(obj, 'timetuple'):
-                return obj.isoformat()
-            elif hasattr(obj, 'item'):
-                return obj.item()
-            elif hasattr(obj, '__float__'):
-                return float(obj)
-            elif hasattr(obj, '__int__'):
-                return int(obj)
-            else:
-                raise TypeError('cannot serialize index of type '
-                                + type(obj).__name__)
-
-        jsonified = {}
-        for x in df.iterkv():
-            jsonified[x[0]] = {'time': [], 'data': []}
-            for y in x[1].iteritems():
-                jsonified[x[0]]['time'].append(typeit(y[0]))
-                jsonified[x[0]]['data'].append(typeit(y[1]))
-
-        return jsonified
-
+    wrapper.frame = func
     return wrapper
 
 
-def to_df(data):
+EPOCH_UNITS = {'s': 10**9, 'ms': 10**6, 'us': 10**3, 'ns': 1}
+
+
+def _float_stamps(values, unit):
+    '''int64 nanosecond stamps of float epoch offsets in `unit`, rounded,
+    with NaT for NaN'''
+    scaled = np.round(values.astype(np.float64) * EPOCH_UNITS[unit])
+    nan = np.isnan(scaled)
+    if not (np.abs(scaled[~nan]) < 2.0**63).all():
+        raise ValueError('Epoch offsets out of range')
+    stamps = np.where(nan, 0, scaled).astype(np.int64)
+    stamps[nan] = NAT
+    return stamps
+
+
+@metrics.timed('to_index')
+def to_index(data, fmt=None, unit='ms'):
+    '''Parse timestamps into a DatetimeIndex.
+
+    Numeric input is treated as epoch offsets in `unit`. Floats are rounded
+    to the nearest nanosecond, and NaN and None become NaT. Uniform ISO 8601
+    strings are parsed in bulk by the NumPy datetime64 parser, falling back
+    to Pandas format inference for anything else.
+
+    Parameters
+    ----------
+    data: list or array, default None
+        Timestamp strings, epoch integers, or datetime64 values
+    fmt: string, default None
+        strftime format of the timestamp strings. Skips format detection.
+    unit: string, default 'ms'
+        Epoch unit for numeric input: 's', 'ms', 'us' or 'ns'
+
+    Raises ValueError for infinite or out of range epoch offsets.
+
+    '''
+    if isinstance(data, pd.DatetimeIndex):
+        return data
+    values = np.asarray(data)
+    if values.dtype.kind == 'M':
+        return pd.DatetimeIndex(values.astype('M8[ns]'))
+    if values.dtype.kind == 'O' and values.ndim == 1:
+        missing = np.array([x is None for x in values], dtype=bool)
+        present = np.asarray(values[~missing].tolist()) if missing.any() \
+            else values
+        if present.dtype.kind in 'iuf':
+            stamps = np.empty(len(values), dtype=np.int64)
+            stamps.fill(NAT)
+            stamps[~missing] = to_index(present, unit=unit).asi8
+            return pd.DatetimeIndex(stamps.view('M8[ns]'))
+    if values.dtype.kind in 'iuf':
+        if unit not in EPOCH_UNITS:
+            raise ValueError('unit must be one of: s, ms, us, ns')
+        if values.dtype.kind == 'f':
+            return pd.DatetimeIndex(_float_stamps(values, unit)
+                                    .view('M8[ns]'))
+        stamps = values.astype(np.int64) * EPOCH_UNITS[unit]
+        return pd.DatetimeIndex(stamps.view('M8[ns]'))
+    if fmt is not None:
+        return pd.to_datetime(values, format=fmt)
+    if values.dtype.kind in 'SU':
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                return pd.DatetimeIndex(values.astype('M8[ns]'))
+            except (ValueError, DeprecationWarning):
+                pass
+    return pd.to_datetime(data)
+
+
+def to_frame(index):
+    '''Build the single-count `Events` DataFrame for a DatetimeIndex'''
+    return pd.DataFrame({'Events': np.ones(len(index))}, index=index)
+
+
+def as_frame(df):
+    '''Return `df` as an Events DataFrame, building the Events column only
+    if `df` is a bare DatetimeIndex'''
+    if isinstance(df, pd.DatetimeIndex):
+        return to_frame(df)
+    return df
+
+
+def to_df(data, fmt=None, unit='ms', start=None, end=None, presorted=None):
     '''Import JSON into Pandas DataFrame.
 
     Assumes JSON is an array of timestamps.
@@ -58,144 +261,694 @@ def to_df(data):
     Parameters
     ----------
     data: list, default None
-        List of timestamp strings
+        List of timestamp strings or epoch integers
+    fmt: string, default None
+        strftime format of the timestamp strings
+    unit: string, default 'ms'
+        Epoch unit for integer input
+    start, end: Timestamp, string or int64 nanoseconds, default None
+        Keep only events in [start, end), see `prune`
+    presorted: boolean, default None
+        Whether the timestamps are in time order, see `prune`
 
     '''
+    index = to_index(data, fmt=fmt, unit=unit)
+    if start is not None or end is not None or presorted is not None:
+        index = prune(index, start=start, end=end, presorted=presorted)
+    return to_frame(index)
 
-    df = pd.DataFrame({'Events': np.ones(len(data))},
-                      index=pd.to_datetime(data))
 
-    return df
+def is_sorted(df):
+    '''Whether the events of a DatetimeIndex, DataFrame or Keyed are in
+    time order'''
+    index = df if isinstance(df, pd.DatetimeIndex) else df.index
+    return index.is_monotonic_increasing
+
+
+def prune(df, start=None, end=None, presorted=None):
+    '''Events of `df` in [start, end), in time order.
+
+    Sorted events are sliced with a binary search, so nothing outside of
+    the range is touched again.
+
+    Parameters
+    ----------
+    df: DatetimeIndex, DataFrame or Keyed
+        Events
+    start, end: Timestamp, string or int64 nanoseconds, default None
+        Start (inclusive) and end (exclusive) of the range. Unbounded if
+        None.
+    presorted: boolean, default None
+        True if the events are known to be in time order, False if they
+        are known not to be. Checked if None.
+
+    '''
+    if presorted is None:
+        presorted = is_sorted(df)
+    if not presorted:
+        if isinstance(df, Keyed):
+            order = np.argsort(df.index.asi8, kind='mergesort')
+            df = Keyed(df.index[order], df.codes[order], df.labels)
+        elif isinstance(df, pd.DatetimeIndex):
+            df = pd.DatetimeIndex(np.sort(df.asi8).view('M8[ns]'))
+        else:
+            df = df.sort_index(kind='mergesort')
+    if start is None and end is None:
+        return df
+    index = df if isinstance(df, pd.DatetimeIndex) else df.index
+    stamps = index.asi8
+    low = 0 if start is None else \
+        stamps.searchsorted(pd.Timestamp(start).value)
+    high = len(stamps) if end is None else \
+        stamps.searchsorted(pd.Timestamp(end).value)
+    if isinstance(df, Keyed):
+        return Keyed(df.index[low:high], df.codes[low:high], df.labels)
+    return df[low:high]
+
+
+class Keyed(namedtuple('Keyed', ['index', 'codes', 'labels'])):
+    '''Events of many series: a DatetimeIndex of all events, the integer
+    code of the series of each event, and the series labels'''
+    __slots__ = ()
+
+
+def is_keyed(data):
+    '''Whether decoded JSON `data` holds keyed rather than plain events'''
+    return isinstance(data, dict) or (
+        isinstance(data, list) and len(data) > 0 and
+        isinstance(data[0], (list, tuple)))
+
+
+def to_keyed(data, fmt=None, unit='ms'):
+    '''Import keyed timestamps of many series.
+
+    Parameters
+    ----------
+    data: dict or list, default None
+        Dict of {series: list of timestamps}, or list of [timestamp,
+        series] pairs
+    fmt: string, default None
+        strftime format of the timestamp strings
+    unit: string, default 'ms'
+        Epoch unit for integer input
+
+    Returns
+    -------
+    Keyed events, with labels sorted and series without events dropped
+
+    '''
+    if isinstance(data, dict):
+        labels = sorted(x for x in data if len(data[x]))
+        stamps = [stamp for x in labels for stamp in data[x]]
+        codes = np.repeat(np.arange(len(labels)),
+                          [len(data[x]) for x in labels])
+    else:
+        stamps, keys = zip(*data)
+        labels, codes = np.unique(np.asarray(keys), return_inverse=True)
+        labels = labels.tolist()
+    index = to_index(list(stamps), fmt=fmt, unit=unit)
+    valid = index.asi8 != NAT
+    if not valid.all():
+        index, codes = index[valid], codes[valid]
+    return Keyed(index, codes.astype(np.int64), labels)
+
+
+def day_hour_codes(stamps):
+    '''Weekday (Monday is 0) and hour of day codes for int64 nanosecond
+    epoch stamps'''
+    hours = np.asarray(stamps, dtype=np.int64) // HOUR
+    return (hours // 24 + 3) % 7, hours % 24
+
+
+def span_codes(first, last):
+    '''Weekday and hour codes of every hourly bin from hour `first` to hour
+    `last`, inclusive. Codes repeat weekly, so at most 168 are returned.'''
+    hours = np.arange(first, min(last, first + 167) + 1, dtype=np.int64)
+    return day_hour_codes(hours * HOUR)
+
+
+def hour_table(values, present):
+    '''DataFrame of 24 hour of day `values`, keeping `present` hours'''
+    hours = np.flatnonzero(present)
+    return pd.DataFrame({'Events': np.asarray(values, dtype=float)[hours]},
+                        index=hours)
+
+
+def weekday_table(values, present):
+    '''DataFrame of 7 weekday `values`, keeping `present` weekdays'''
+    days = np.flatnonzero(present)
+    return pd.DataFrame({'Events': np.asarray(values, dtype=float)[days]},
+                        index=[WEEKDAYS[x] for x in days])
+
+
+def weekday_hour_table(values, present):
+    '''DataFrame of 7x24 weekday by hour `values`, with NaN outside of
+    `present` and absent weekdays and hours dropped'''
+    values = np.where(present, values, np.nan).T
+    hours = np.flatnonzero(present.any(axis=0))
+    days = np.flatnonzero(present.any(axis=1))
+    weekly = pd.DataFrame(values[hours][:, days], index=hours,
+                          columns=[WEEKDAYS[x] for x in days])
+    weekly.index.name = 'Hour'
+    return weekly
 
 
 @jsonify
 def resample(df=None, freq=None):
     '''Pandas resampling convenience function'''
     key, value = freq.keys()[0], freq.values()[0]
+    if isinstance(df, Keyed):
+        return dict((label, pd.DataFrame({value: sums}))
+                    for label, sums in _keyed_resample(df, key).items())
+    offset = to_offset(key)
+    if isinstance(offset, offsets.Tick) and _rolls_up(offset) and \
+            len(events(df)[0]):
+        starts, sums = bins(df, offset.nanos)
+        index = pd.DatetimeIndex(starts.view('M8[ns]'), freq=offset)
+        return pd.DataFrame({value: sums}, index=index)
+    df = as_frame(df)
     return df.resample(key, how='sum').rename(columns={'Events': value})
 
 
 @jsonify
 def rolling_sum(df=None, window=None, freq=None):
-    '''Pandas rolling_sum convenience function'''
-    key, value = freq.keys()[0], freq.values()[0]
+    '''Rolling sum over `window` resampled rows'''
+    key, value = list(freq.items())[0]
+    if isinstance(df, Keyed):
+        return dict((label, pd.DataFrame(
+            {value: rolling.aggregate(sums.values, rolling.window_starts(
+                sums.index, window))}, index=sums.index))
+            for label, sums in _keyed_resample(df, key).items())
+    df = as_frame(df)
     sampled = df.resample(key, how='sum').rename(columns={'Events': value})
-    rolling = pd.rolling_sum(sampled, window, min_periods=0)
-    return rolling
+    starts = rolling.window_starts(sampled.index, window)
+    return pd.DataFrame({value: rolling.aggregate(sampled[value].values,
+                                                  starts)},
+                        index=sampled.index)
+
+
+@jsonify
+def rolling_stats(df=None, freq=None, windows=None, how='sum'):
+    '''Rolling statistics of resampled events for several windows.
+
+    The events are resampled once, and each window and statistic is one
+    vectorized pass over the resampled counts, see `rolling.rolling`.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame or DatetimeIndex, default None
+        Events to transform
+    freq: dict, default None
+        Frequency to resample by. Ex: {'H': 'Hourly'}
+    windows: list, default None
+        Windows in rows, or time spans. Ex: ['1H', '24H', '7D']
+    how: string or list of strings, default 'sum'
+        Any of sum, mean, min, max, std
+
+    Returns
+    -------
+    DataFrame with a '{name}_{how}_{window}' column per statistic and
+    window, or a dict of them per series for keyed input
+
+    Example
+    -------
+    >>>rolling_stats(df=index, freq={'H': 'Hourly'}, windows=['24H', '7D'],
+    ...              how=['mean', 'max'])
+
+    '''
+    key, value = list(freq.items())[0]
+    if not isinstance(windows, (list, tuple)):
+        windows = [windows]
+    if isinstance(df, Keyed):
+        return dict((label, rolling.rolling(pd.DataFrame({value: sums}),
+                                            windows, how))
+                    for label, sums in _keyed_resample(df, key).items())
+    sampled = as_frame(df).resample(key, how='sum').rename(
+        columns={'Events': value})
+    return rolling.rolling(sampled, windows, how)
+
+
+def events(df):
+    '''Non-null int64 nanosecond stamps of the events in `df`, and their
+    Events weights, or None when every event counts once'''
+    if isinstance(df, pd.DatetimeIndex):
+        stamps, weights = df.asi8, None
+    else:
+        stamps, weights = df.index.asi8, df['Events'].values
+    valid = stamps != NAT
+    if not valid.all():
+        stamps = stamps[valid]
+        weights = None if weights is None else weights[valid]
+    return stamps, weights
+
+
+def bins(df, width):
+    '''Sum events into `width` nanosecond bins spanning the events.
+
+    Returns
+    -------
+    Tuple of bin start stamps and bin sums, with NaN for empty bins, as
+    `DataFrame.resample(how='sum')` gives
+
+    '''
+    stamps, weights = events(df)
+    if weights is None and len(stamps) and is_sorted(df):
+        return sorted_bins(stamps, width)
+    codes = stamps // width
+    first = codes.min()
+    codes -= first
+    sums = np.bincount(codes, weights=weights).astype(float)
+    if weights is None:
+        sums[sums == 0] = np.nan
+    else:
+        sums[np.bincount(codes, minlength=len(sums)) == 0] = np.nan
+    return (np.arange(len(sums), dtype=np.int64) + first) * width, sums
+
+
+def sorted_runs(stamps, width):
+    '''Codes and event counts of the non-empty `width` nanosecond bins of
+    sorted int64 nanosecond `stamps`.
+
+    With many events per bin, the bin edges are found by binary search,
+    in O(bins log events). Otherwise the events are run-length counted.
+
+    '''
+    first = stamps[0] // width
+    size = stamps[-1] // width - first + 1
+    if size * np.log2(max(len(stamps), 2)) < len(stamps):
+        edges = (np.arange(size + 1, dtype=np.int64) + first) * width
+        counts = np.diff(stamps.searchsorted(edges))
+        full = np.flatnonzero(counts)
+        return full + first, counts[full]
+    codes = stamps // width
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+    return codes[starts], np.diff(np.append(starts, len(codes)))
+
+
+def sorted_bins(stamps, width):
+    '''`bins` of sorted int64 nanosecond `stamps`'''
+    codes, counts = sorted_runs(stamps, width)
+    first = codes[0]
+    sums = np.empty(codes[-1] - first + 1)
+    sums.fill(np.nan)
+    sums[codes - first] = counts
+    return (np.arange(len(sums), dtype=np.int64) + first) * width, sums
+
+
+def table_sums(df, size, code):
+    '''Sum of events per `code(stamps)` for codes in range(size), and
+    whether each code has any events'''
+    stamps, weights = events(df)
+    if weights is None and len(stamps) and is_sorted(df):
+        hours, weights = sorted_runs(stamps, HOUR)
+        stamps = hours * HOUR
+    codes = code(stamps)
+    sums = np.bincount(codes, weights=weights, minlength=size)
+    return sums, np.bincount(codes, minlength=size) > 0
+
+
+def table_means(stamps, sums, size, code):
+    '''Mean of non-empty bin `sums` per `code(stamps)` for codes in
+    range(size), and whether each code is spanned by any bin'''
+    codes = code(stamps)
+    full = ~np.isnan(sums)
+    totals = np.bincount(codes[full], weights=sums[full], minlength=size)
+    counts = np.bincount(codes[full], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, totals / counts.astype(float), np.nan)
+    return means, np.bincount(codes, minlength=size) > 0
+
+
+def weekday_code(stamps):
+    '''Weekday codes, Monday is 0'''
+    return day_hour_codes(stamps)[0]
+
+
+def hour_code(stamps):
+    '''Hour of day codes'''
+    return day_hour_codes(stamps)[1]
+
+
+def weekday_hour_code(stamps):
+    '''Combined weekday by hour codes, weekday * 24 + hour'''
+    days, hours = day_hour_codes(stamps)
+    return days * 24 + hours
 
 
 def day_hours(df):
     '''Get Hourly and Daily columns from DataFrame timestamps'''
-    df['DoW'] = df['Hour'] = df.index
-    weekdays = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
-                5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
-    order = [y for x, y in weekdays.iteritems()]
-    df['DoW'] = df['DoW'].apply(lambda x: (x.hour, weekdays[x.isoweekday()]))
-    df['Hour'] = df['Hour'].apply(lambda x: x.hour)
-    return df, order
+    days, hours = day_hour_codes(df.index.asi8)
+    names = np.array(WEEKDAYS, dtype=object)[days]
+    df['DoW'] = list(zip(hours.tolist(), names))
+    df['Hour'] = hours
+    return df, list(WEEKDAYS)
 
 
 @jsonify
 def daily(df=None, how=None):
     '''Calculate daily summed statistics'''
-    key = lambda x: x.isoweekday()
-    weekdays = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
-                5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
+    if isinstance(df, Keyed):
+        return _keyed_table(df, how, DAY, 7, weekday_code, weekday_table)
     if how == 'mean':
-        sampled = df.resample('D', how='sum')
-        daily = sampled.groupby(key).mean()
+        stamps, sums = bins(df, DAY)
+        daily, present = table_means(stamps, sums, 7, weekday_code)
     else:
-        daily = df.groupby(key).sum()
-    daily = daily.rename(weekdays)
-    return daily
+        daily, present = table_sums(df, 7, weekday_code)
+    return weekday_table(daily, present)
+
+
+def hourly_sample(df):
+    '''Hourly summed resample of the events. Pass it as `sampled` to share
+    it between `hourly`, `daily_hours` and `forward`.'''
+    stamps, sums = bins(df, HOUR)
+    index = pd.DatetimeIndex(stamps.view('M8[ns]'), freq='H')
+    return pd.DataFrame({'Events': sums}, index=index)
+
+
+def _sampled_bins(df, sampled):
+    '''Hourly bin stamps and sums, from `sampled` if it is given'''
+    if sampled is None:
+        return bins(df, HOUR)
+    return sampled.index.asi8, sampled['Events'].values
 
 
 @jsonify
-def hourly(df=None, how=None):
+def hourly(df=None, how=None, sampled=None):
     '''Calculate hourly sum statistics'''
-    key = lambda x: x.hour
+    if isinstance(df, Keyed):
+        return _keyed_table(df, how, HOUR, 24, hour_code, hour_table)
     if how == 'mean':
-        sampled = df.resample('H', how='sum')
-        hourly = sampled.groupby(key).mean()
+        stamps, sums = _sampled_bins(df, sampled)
+        hourly, present = table_means(stamps, sums, 24, hour_code)
     else:
-        hourly = df.groupby(key).sum()
-    return hourly
+        hourly, present = table_sums(df, 24, hour_code)
+    return hour_table(hourly, present)
 
 
-def daily_hours(df=None, to_json=False, how=None):
+def daily_hours(df=None, to_json=False, how=None, sampled=None):
     '''Hourly summed distribution by day of week'''
-    weekdays = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
-                5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
-    key1 = lambda x: x.isoweekday()
-    key2 = lambda x: x.hour
+    if isinstance(df, Keyed):
+        weekly = _keyed_table(df, how, HOUR, 168, weekday_hour_code,
+                              _weekday_hour_table)
+        return jsonified(weekly) if to_json else weekly
     if how == 'mean':
-        resample = df.resample('H', how='sum')
-        weekly = resample.groupby([key1, key2]).mean().unstack(0)['Events']
+        stamps, sums = _sampled_bins(df, sampled)
+        weekly, present = table_means(stamps, sums, 168, weekday_hour_code)
     else:
-        weekly = df.groupby([key1, key2]).sum().unstack(0)['Events']
-    weekly.index.name = 'Hour'
-    weekly = weekly.rename(columns=weekdays)
+        weekly, present = table_sums(df, 168, weekday_hour_code)
+    weekly = weekday_hour_table(weekly.reshape(7, 24),
+                                present.reshape(7, 24))
     if to_json:
-        jsonified = jsonify(lambda frame: frame)
-        weekly_hours = {}
-        for day in weekly.iterkv():
-            weekly_hours.update(jsonified(pd.DataFrame(day[1])))
-        return weekly_hours
+        return to_dict(weekly)
     else:
         return weekly
 
 
+def project(dist, start, periods):
+    '''Hourly DataFrame of `periods` values from `start`, gathered from a
+    168 value weekday by hour distribution `dist`.
+
+    Parameters
+    ----------
+    dist: array
+        Values indexed by `weekday_hour_code`
+    start: int
+        First hour as an int64 nanosecond epoch stamp
+    periods: int
+        Number of hours to project
+
+    '''
+    stamps = start + np.arange(periods, dtype=np.int64) * HOUR
+    index = pd.DatetimeIndex(stamps.view('M8[ns]'), freq='H')
+    return pd.DataFrame({'Events': np.asarray(dist).ravel()[
+        weekday_hour_code(stamps)]}, index=index)
+
+
 @jsonify
-def forward(df=None, periods=180):
+def forward(df=None, periods=180, sampled=None):
     '''Generate hourly prediction of events for the next `periods`'''
-    weekdays = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
-                5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
-    dist = daily_hours(df, to_json=False, how='mean')
-    hourly = df.resample('H', how='sum')
-    h_range = pd.date_range(hourly.index[-1] + offsets.Hour(),
-                            periods=periods, freq='H')
-    forward = pd.DataFrame({'Events': h_range}, index=h_range)
-    to_tuple = lambda x: (x.hour, weekdays[x.isoweekday()])
-    forward['Events'] = forward['Events'].apply(to_tuple)
-    index_dist = lambda x: dist[x[1]][x[0]]
-    forward['Events'] = forward['Events'].apply(index_dist)
-    return forward
+    if isinstance(df, Keyed):
+        dist, _, last = _keyed_means(df, HOUR, 168, weekday_hour_code)
+        return dict((label, project(dist[i], (last[i] + 1) * HOUR,
+                                   periods))
+                    for i, label in enumerate(df.labels))
+    stamps, sums = _sampled_bins(df, sampled)
+    dist, _ = table_means(stamps, sums, 168, weekday_hour_code)
+    return project(dist, stamps[-1] + HOUR, periods)
+
+
+def _keyed_runs(keyed, width):
+    '''Sparse per-series bin counts: the series code, bin code and number
+    of events of every non-empty (series, `width` nanosecond bin) pair,
+    sorted by series then bin, and the first and last bin code of each
+    series. Memory is O(events), whatever the span of the series.'''
+    codes = keyed.index.asi8 // width
+    origin = codes.min() if len(codes) else 0
+    span = int(codes.max() - origin + 1) if len(codes) else 1
+    if len(keyed.labels) * span < 2**62:
+        pairs = np.sort(keyed.codes * span + (codes - origin))
+        series, codes = pairs // span, pairs % span + origin
+    else:
+        order = np.lexsort((codes, keyed.codes))
+        series, codes = keyed.codes[order], codes[order]
+    starts = np.flatnonzero(np.concatenate(
+        [[True], (np.diff(series) != 0) | (np.diff(codes) != 0)]))
+    counts = np.diff(np.append(starts, len(codes)))
+    series, codes = series[starts], codes[starts]
+    labels = np.arange(len(keyed.labels))
+    low = series.searchsorted(labels)
+    high = series.searchsorted(labels, side='right')
+    empty = high == low
+    first = np.where(empty, 0, codes[np.minimum(low, len(codes) - 1)])
+    last = np.where(empty, -1, codes[np.maximum(high - 1, 0)])
+    return series, codes, counts, first, last
+
+
+def _keyed_resample(keyed, key):
+    '''Resample every series over its own span.
+
+    Ticks that divide a day are binned for all series at once from sparse
+    (series, bin) counts, laid end to end in O(sum of the series spans).
+    Other frequencies are resampled series by series.
+
+    Returns
+    -------
+    Dict of a Series of sums per series label, with NaN for empty bins
+
+    '''
+    offset = to_offset(key)
+    if not (isinstance(offset, offsets.Tick) and _rolls_up(offset)):
+        order = np.argsort(keyed.codes, kind='mergesort')
+        bounds = np.searchsorted(keyed.codes[order],
+                                 np.arange(len(keyed.labels) + 1))
+        return dict((label, resample.frame(
+            df=keyed.index[order[bounds[i]:bounds[i + 1]]],
+            freq={key: 'Events'})['Events'])
+            for i, label in enumerate(keyed.labels))
+    width = offset.nanos
+    series, codes, counts, first, last = _keyed_runs(keyed, width)
+    spans = last - first + 1
+    ends = np.cumsum(spans)
+    sums = np.empty(ends[-1] if len(ends) else 0)
+    sums.fill(np.nan)
+    sums[ends[series] - spans[series] + codes - first[series]] = counts
+    results = {}
+    for i, label in enumerate(keyed.labels):
+        stamps = (np.arange(first[i], last[i] + 1, dtype=np.int64) *
+                  width).view('M8[ns]')
+        results[label] = pd.Series(sums[ends[i] - spans[i]:ends[i]],
+                                   index=pd.DatetimeIndex(stamps,
+                                                          freq=offset))
+    return results
+
+
+def _keyed_means(keyed, width, size, code):
+    '''`table_means` of every series, over its own span, from sparse
+    (series, bin) counts. `code` must repeat every `size` bins, so the first
+    `size` bins of a series span every code it spans.
+
+    Returns
+    -------
+    Tuple of series by `size` matrices of means and of spanned codes, and
+    the last bin code of each series
+
+    '''
+    series, codes, counts, first, last = _keyed_runs(keyed, width)
+    total = len(keyed.labels) * size
+    combined = series * size + code(codes * width)
+    sums = np.bincount(combined, weights=counts, minlength=total)
+    full = np.bincount(combined, minlength=total)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(full > 0, sums / full.astype(float), np.nan)
+    reach = np.minimum(last - first + 1, size)
+    owner = np.repeat(np.arange(len(keyed.labels)), reach)
+    step = np.arange(reach.sum()) - np.repeat(np.cumsum(reach) - reach,
+                                              reach)
+    spanned = owner * size + code((first[owner] + step) * width)
+    present = np.bincount(spanned, minlength=total) > 0
+    return means.reshape(-1, size), present.reshape(-1, size), last
+
+
+def _weekday_hour_table(values, present):
+    '''`weekday_hour_table` of flat 168 value arrays'''
+    return weekday_hour_table(values.reshape(7, 24), present.reshape(7, 24))
+
+
+def _keyed_table(keyed, how, width, size, code, table):
+    '''Per-series tables of sums or bin means by `code`, for `daily`,
+    `hourly` and `daily_hours`'''
+    series = len(keyed.labels)
+    if how == 'mean':
+        values, present, _ = _keyed_means(keyed, width, size, code)
+    else:
+        combined = keyed.codes * size + code(keyed.index.asi8)
+        values = np.bincount(combined, minlength=series * size)
+        values = values.reshape(series, size).astype(float)
+        present = values > 0
+    return dict((label, table(values[i], present[i]))
+                for i, label in enumerate(keyed.labels))
+
+
+def freq_nanos(key):
+    '''Nominal length of frequency `key` in nanoseconds, to order
+    frequencies from finest to coarsest'''
+    offset = to_offset(key)
+    if isinstance(offset, offsets.Tick):
+        return offset.nanos
+    start = pd.Timestamp('2000-01-01')
+    return ((start + 2 * offset) - (start + offset)).value
+
+
+def freq_specs(freq):
+    '''(key, name) pairs of a list of frequency dicts, or a single dict,
+    ordered finest first'''
+    if isinstance(freq, dict):
+        freq = [freq]
+    return sorted((list(x.items())[0] for x in freq),
+                  key=lambda spec: freq_nanos(spec[0]))
+
+
+def _rolls_up(offset):
+    '''Whether resampling to `offset` can be rolled up from bins that
+    divide a day. Pandas anchors Ticks that do not divide a day at the
+    events themselves, so those are resampled from the raw events.'''
+    return not isinstance(offset, offsets.Tick) or DAY % offset.nanos == 0
+
+
+def _rollup_width(keys):
+    '''Width in nanoseconds of the bins every frequency in `keys` that
+    `_rolls_up` can be rolled up from: the greatest common divisor of their
+    Tick lengths and a day'''
+    width = DAY
+    for key in keys:
+        offset = to_offset(key)
+        if isinstance(offset, offsets.Tick) and _rolls_up(offset):
+            width = fractions.gcd(width, offset.nanos)
+    return width
+
+
+def combine_levels(levels, fill='pad'):
+    '''Align resampled levels, finest first, on the index of the finest
+    level, padding each coarser level forward from its bin labels'''
+    index = levels[0].index
+    return pd.concat([levels[0]] + [x.reindex(index, method=fill)
+                                    for x in levels[1:]], axis=1)
 
 
+@jsonify
 def combined_resample(df=None, freq=None, fill='pad'):
-    '''Generate dict of Pandas DataFrames with multiple time series
-    averaging schemes
+    '''Resample to several frequencies in one pass over the events.
+
+    The events are binned once, at the greatest common divisor of a day
+    and the requested Tick frequencies that divide a day, usually the
+    finest requested frequency. Every level is rolled up from those bins
+    rather than from the raw events, except Ticks that do not divide a
+    day, which Pandas anchors at the first event.
 
     Parameters
     ----------
-    df: Pandas DataFrame, default None
-        Pandas DataFrame with DateTimeIndex and single column of
-        relevant data
-    freq: iter of tuples, default None
+    df: Pandas DataFrame or DatetimeIndex, default None
+        Events to resample
+    freq: list of dicts, or dict, default None
         Frequency(ies) to resample by. Ex: [{'D': 'Daily'}] for daily,
         [{'D': 'Daily'}, {'W': 'Weekly'}] for daily and weekly, etc.
     fill: string, default 'pad'
-        Fill method for padding.
+        Fill method used to align the coarser levels in the combined frame
 
     Returns
     -------
     Dict of DataFrames resampled for each passed freq, plus a combined
-    DataFrame with a DateTimeIndex that defaults to the first freq passed
+    DataFrame on the index of the finest freq
 
     Example
     -------
-    >>>resampled = resample(df=myframe, freq=[{'H': 'Hourly'}, {'D': 'Daily'}])
+    >>>resampled = combined_resample(df=myframe,
+    ...                              freq=[{'H': 'Hourly'}, {'D': 'Daily'}])
     '''
+    if isinstance(df, Keyed):
+        raise ValueError('combined_resample does not take keyed series')
+    specs = freq_specs(freq)
+    width = _rollup_width([key for key, _ in specs])
+    starts, sums = bins(df, width)
+    binned = pd.DataFrame({'Events': sums},
+                          index=pd.DatetimeIndex(starts.view('M8[ns]')))
 
     resampled = {}
-    concat_list = []
-    for astype in freq:
-        key, value = astype.keys()[0], astype.values()[0]
-        resampled[value] = (df.resample(key, how='sum')
-                            .rename(columns={'Events': value}))
-        concat_list.append(resampled[value]
-                           .resample(freq[0][0], fill_method=fill, closed='right'))
+    levels = []
+    for key, value in specs:
+        offset = to_offset(key)
+        if not _rolls_up(offset):
+            level = as_frame(df).resample(key, how='sum')
+        elif isinstance(offset, offsets.Tick) and offset.nanos == width:
+            level = binned
+        else:
+            level = binned.resample(key, how='sum')
+        resampled[value] = level.rename(columns={'Events': value})
+        levels.append(resampled[value])
+    resampled['Combined'] = combine_levels(levels, fill=fill)
+    return resampled
 
-    resampled['Combined'] = pd.concat(concat_list, axis=1)
 
-    return resampled
+OPERATIONS = {'resample': resample.frame, 'rolling_sum': rolling_sum.frame,
+              'rolling_stats': rolling_stats.frame,
+              'daily': daily.frame, 'hourly': hourly.frame,
+              'daily_hours': daily_hours, 'forward': forward.frame,
+              'combined_resample': combined_resample.frame}
+SHARES_SAMPLED = ('hourly', 'daily_hours', 'forward')
+
+
+def batch(df=None, operations=None):
+    '''Run several transformations over one set of events.
+
+    Every operation gets the events as given, so a bare DatetimeIndex keeps
+    the unweighted fast paths of `bins` and `table_sums`. The hourly
+    resample is computed at most once and shared by `hourly`, `daily_hours`
+    and `forward`.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame or DatetimeIndex, default None
+        Events to transform
+    operations: list of dicts, default None
+        Each dict names an operation in OPERATIONS under 'op', with the
+        rest of its keys passed as parameters. Ex: [{'op': 'resample',
+        'freq': {'H': 'Hourly'}}, {'op': 'forward', 'periods': 180}]
+
+    Returns
+    -------
+    List of result DataFrames, in the order of `operations`
+
+    '''
+    shared = {}
+    results = []
+    for operation in operations:
+        params = dict(operation)
+        name = params.pop('op', None)
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation: {0}'.format(name))
+        if name in SHARES_SAMPLED and not isinstance(df, Keyed):
+            if 'sampled' not in shared:
+                shared['sampled'] = hourly_sample(df)
+            params['sampled'] = shared['sampled']
+        results.append(OPERATIONS[name](df=df, **params))
+    return results
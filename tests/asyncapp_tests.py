@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Async App Tests
+
+'''
+from __future__ import print_function, division
+import gzip
+import io
+import json
+import unittest
+import pandas as pd
+try:
+    from tornado import gen
+    from tornado.testing import AsyncHTTPTestCase
+    from tornado.httputil import url_concat
+except ImportError:
+    raise unittest.SkipTest('tornado is not installed')
+try:
+    from urllib import urlencode
+except ImportError:
+    from urllib.parse import urlencode
+import mcflyin.application
+from mcflyin import asyncapp, formats, ingest, metrics
+
+
+class testAsyncApp(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return asyncapp.make_app()
+
+    def setUp(self):
+        super(testAsyncApp, self).setUp()
+        rng = pd.date_range('6/16/2013', periods=10080, freq='T')
+        self.data = [x.isoformat() for x in rng]
+        self.flask = mcflyin.application.app.test_client()
+
+    def post(self, route, send, **kwargs):
+        return self.fetch('/' + route, method='POST', body=urlencode(send),
+                          **kwargs)
+
+    def test_matches_flask(self):
+        '''Test responses match the Flask app'''
+        data = json.dumps(self.data)
+        for route, send in [('resample', {'freq': '{"H": "Hourly"}'}),
+                            ('rolling_sum', {'freq': '{"H": "Hourly"}',
+                                             'window': '3'}),
+                            ('daily_hours', {}),
+                            ('forward', {'periods': '180'})]:
+            send['data'] = data
+            response = self.post(route, send)
+            assert response.code == 200
+            assert json.loads(response.body) == \
+                json.loads(self.flask.post(route, data=send).data)
+
+    def test_binary(self):
+        '''Test raw int64 epoch upload with an npz response'''
+        epoch = pd.to_datetime(self.data).asi8 // 10**6
+        response = self.fetch(
+            url_concat('/resample', {'freq': '{"D": "Daily"}'}),
+            method='POST', body=epoch.astype('<i8').tostring(),
+            headers={'Content-Type': formats.OCTET, 'Accept': formats.NPZ})
+        df = formats.decode_frame(response.body, formats.NPZ)
+        assert (df['Daily'] == 1440).all()
+
+    def test_ndjson(self):
+        '''Test NDJSON bodies are streamed as by the Flask app'''
+        body = '\n'.join(json.dumps(x) for x in self.data).encode('utf-8')
+        for route in ['daily_hours', 'hourly']:
+            response = self.fetch('/' + route, method='POST', body=body,
+                                  headers={'Content-Type': ingest.NDJSON})
+            assert response.code == 200
+            assert json.loads(response.body) == json.loads(self.flask.post(
+                route, data=body, content_type=ingest.NDJSON).data)
+        response = self.fetch('/datasets', method='POST', body=body,
+                              headers={'Content-Type': ingest.NDJSON})
+        assert json.loads(response.body)['events'] == 10080
+        response = self.fetch('/daily', method='POST', body=b'\n',
+                              headers={'Content-Type': ingest.NDJSON})
+        assert response.code == 400
+
+    def test_streamed_chunks(self):
+        '''Test NDJSON bodies are parsed chunk by chunk as they arrive'''
+        lines = [json.dumps(x).encode('utf-8') + b'\n' for x in self.data]
+        fed = []
+        feed = ingest.Ingest.feed
+
+        def counted(reader, chunk):
+            fed.append(len(chunk))
+            return feed(reader, chunk)
+
+        @gen.coroutine
+        def producer(write):
+            for start in range(0, len(lines), 1000):
+                yield write(b''.join(lines[start:start + 1000]))
+
+        ingest.Ingest.feed = counted
+        try:
+            response = self.fetch('/hourly', method='POST',
+                                  body_producer=producer,
+                                  headers={'Content-Type': ingest.NDJSON})
+        finally:
+            ingest.Ingest.feed = feed
+        assert response.code == 200
+        assert len(fed) > 1 and max(fed) < len(b''.join(lines))
+        assert json.loads(response.body) == json.loads(self.flask.post(
+            'hourly', data=b''.join(lines), content_type=ingest.NDJSON).data)
+        response = self.fetch(url_concat('/hourly', {'start': '"bad'}),
+                              method='POST', body=b''.join(lines),
+                              headers={'Content-Type': ingest.NDJSON})
+        assert response.code == 400
+
+    def test_streamed_response(self):
+        '''Test stream=true chunked, compressed JSON matches Flask'''
+        send = {'data': json.dumps(self.data),
+                'freq': json.dumps({'T': 'Minutely'})}
+        buffered = self.flask.post('resample', data=send)
+        send['stream'] = 'true'
+        response = self.post('resample', send)
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.body) == json.loads(buffered.data)
+        response = self.post('resample', send, decompress_response=False,
+                             headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        body = gzip.GzipFile(fileobj=io.BytesIO(response.body)).read()
+        assert json.loads(body.decode('utf-8')) == json.loads(buffered.data)
+        send['time_format'] = json.dumps('unix')
+        assert self.post('resample', send).code == 400
+
+    def test_server_timing(self):
+        '''Test Server-Timing headers are sent when metrics are enabled'''
+        send = {'data': json.dumps(self.data)}
+        assert 'Server-Timing' not in self.post('daily', send).headers
+        metrics.enable()
+        try:
+            response = self.post('daily', send)
+        finally:
+            metrics.enable(False)
+        stages = [x.split(';')[0]
+                  for x in response.headers['Server-Timing'].split(', ')]
+        assert 'total' in stages and 'transform' in stages
+
+    def test_errors(self):
+        '''Test error statuses match the Flask app'''
+        response = self.post('daily', {'dataset': 'missing'})
+        assert response.code == 404
+        response = self.post('batch', {'data': json.dumps(self.data),
+                                       'operations': '[{"op": "nope"}]'})
+        assert response.code == 400
+
+    def test_stateful_routes(self):
+        '''Test datasets, series and cache routes are served as by Flask'''
+        response = self.post('datasets', {'data': json.dumps(self.data)})
+        assert response.code == 200
+        dataset_id = json.loads(response.body)['id']
+        response = self.post('daily_hours', {'dataset': dataset_id})
+        assert response.code == 200
+        assert json.loads(response.body) == json.loads(self.flask.post(
+            'daily_hours', data={'data': json.dumps(self.data)}).data)
+        response = self.fetch('/datasets/' + dataset_id)
+        assert json.loads(response.body)['events'] == 10080
+        response = self.fetch(url_concat('/datasets/{0}/counts'
+                                         .format(dataset_id),
+                                         {'level': '"day"'}))
+        assert response.code == 200
+        assert json.loads(response.body)['day']['data'] == [1440] * 7
+        response = self.fetch('/datasets/' + dataset_id, method='DELETE')
+        assert response.code == 200
+        assert self.fetch('/datasets/' + dataset_id).code == 404
+
+        name = 'async-{0}'.format(id(self))
+        response = self.post('series/' + name,
+                             {'data': json.dumps(self.data)})
+        assert json.loads(response.body)['events'] == 10080
+        response = self.fetch('/series/{0}/daily'.format(name))
+        assert response.code == 200
+        assert self.fetch('/cache').code == 200
+        assert self.fetch('/metrics').code == 200
+
+    def test_request_values(self):
+        '''Test body arguments are merged into a copy of the query'''
+        query = {'unit': [b'"s"']}
+        values = asyncapp.request_values(
+            query, 'application/x-www-form-urlencoded', b'unit=%22ms%22')
+        assert values == {'unit': u'"ms"'}
+        assert query == {'unit': [b'"s"']}
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Result Cache Tests
+
+'''
+from __future__ import print_function, division
+import os
+import shutil
+import tempfile
+import threading
+import time
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import transformations as tr
+from mcflyin.cache import FileCache, MemoryCache, events_key, memoize
+
+
+class testCache(object):
+
+    def setup(self):
+        '''Setup cache directory and events'''
+        self.directory = tempfile.mkdtemp()
+        self.index = pd.date_range('6/16/2013', periods=10080, freq='T')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_lru(self):
+        '''Test MemoryCache evicts least recently used entries'''
+        cache = MemoryCache(max_items=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2,
+                                 'bytes': cache.nbytes}
+
+    def test_memory_ttl(self):
+        '''Test MemoryCache entries expire'''
+        cache = MemoryCache(ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+
+    def test_file_shared(self):
+        '''Test FileCache results are shared between instances'''
+        writer = FileCache(self.directory, max_items=2)
+        reader = FileCache(self.directory, max_items=2)
+        writer.set('a', {'x': 1})
+        assert reader.get('a') == {'x': 1}
+        writer.set('b', 2)
+        os.utime(writer._path('a'), (0, 0))
+        writer.set('c', 3)
+        assert reader.get('a') is None
+        assert len(reader) == 2
+
+    def test_bytes(self):
+        '''Test both caches are bounded by the bytes of their results'''
+        frame = tr.hourly.frame(df=self.index)
+        nbytes = frame.memory_usage(index=True, deep=True).sum()
+        cache = MemoryCache(max_bytes=int(nbytes * 2.5))
+        for key in 'abc':
+            cache.set(key, frame.copy())
+        assert len(cache) == 2 and cache.get('a') is None
+        assert cache.nbytes == 2 * nbytes
+        cache.set('d', {'x': frame, 'y': frame, 'z': frame})
+        assert cache.get('d') is None and len(cache) == 2
+
+        files = FileCache(self.directory, max_bytes=1000)
+        files.set('a', 1)
+        files.set('b', frame)
+        assert files.get('a') == 1 and files.get('b') is None
+        assert 0 < files.nbytes <= 1000
+
+    def test_threads(self):
+        '''Test concurrent sets and gets keep the counters and bounds'''
+        cache = MemoryCache(max_items=4)
+
+        def work(offset):
+            for i in range(2000):
+                cache.set(str((offset + i) % 8), i)
+                cache.get(str(i % 8))
+
+        threads = [threading.Thread(target=work, args=(x,)) for x in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(cache) == 4
+        assert cache.hits + cache.misses == 16000
+        assert cache.nbytes == sum(x[2] for x in cache._items.values())
+
+    def test_memoize(self):
+        '''Test memoized transformations reuse results'''
+        cache = MemoryCache()
+        hourly = memoize(cache, name='hourly')(tr.hourly.frame)
+        first = hourly(df=self.index, how='mean')
+        second = hourly(df=self.index, how='mean',
+                        dataset_key=events_key(self.index))
+        pdtest.assert_frame_equal(first, second)
+        hourly(df=self.index, how='sum')
+        assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Client Tests, against the Flask app on a local port
+
+'''
+from __future__ import print_function, division
+import threading
+import zlib
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from werkzeug.serving import make_server
+from mcflyin import application
+from mcflyin import formats
+from mcflyin import transformations as tr
+from mcflyin.client import Client
+
+
+class testClient(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Serve the app in a thread, and setup a client and events'''
+        cls.server = make_server('127.0.0.1', 0, application.app,
+                                 threaded=True)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.client = Client('http://127.0.0.1:{0}'.format(
+            cls.server.server_port), workers=4)
+        np.random.seed(0)
+        start = pd.Timestamp('6/16/2013').value // 10**6
+        cls.epoch = start + np.random.exponential(60000, 20000).cumsum()\
+            .astype(np.int64)
+        cls.index = tr.to_index(cls.epoch)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.client.close()
+        cls.server.shutdown()
+
+    def test_transforms(self):
+        '''Test columnar results match the transformations'''
+        pdtest.assert_frame_equal(
+            self.client.resample(self.epoch, freq={'H': 'Hourly'}),
+            tr.resample.frame(df=self.index, freq={'H': 'Hourly'}),
+            check_names=False)
+        pdtest.assert_frame_equal(self.client.hourly(self.epoch, how='mean'),
+                                  tr.hourly.frame(df=self.index, how='mean'))
+        weekly = self.client.daily_hours(self.index)
+        pdtest.assert_frame_equal(weekly, tr.daily_hours(df=self.index),
+                                  check_names=False)
+        combined = self.client.combined_resample(
+            self.epoch, freq=[{'H': 'Hourly'}, {'D': 'Daily'}])
+        assert sorted(combined) == ['Combined', 'Daily', 'Hourly']
+        assert combined['Daily']['Daily'].sum() == 20000
+
+    def test_map(self):
+        '''Test parallel calls over events encoded once'''
+        calls = [('daily', {'how': 'sum'}), ('hourly', {'how': 'sum'}),
+                 ('forward', {'periods': 24}),
+                 ('rolling_sum', {'window': 3, 'freq': {'D': 'Daily'}})]
+        results = self.client.map(self.epoch, calls)
+        assert results[0]['Events'].sum() == 20000
+        assert results[1]['Events'].sum() == 20000
+        assert len(results[2]) == 24
+        pdtest.assert_frame_equal(
+            results[3], tr.rolling_sum.frame(df=self.index, window=3,
+                                             freq={'D': 'Daily'}),
+            check_names=False)
+        batched = self.client.batch(self.epoch, [{'op': 'daily'},
+                                                 {'op': 'hourly'}])
+        assert batched[1]['Events'].sum() == 20000
+
+    def test_datasets_and_keyed(self):
+        '''Test stored datasets, keyed events and uncompressed bodies'''
+        dataset = self.client.upload(self.epoch)
+        daily = self.client.daily(dataset=dataset, how='sum')
+        assert daily['Events'].sum() == 20000
+        keyed = self.client.hourly({'a': self.epoch[:5000].tolist(),
+                                    'b': self.epoch[5000:].tolist()})
+        assert keyed['b']['Events'].sum() == 15000
+        plain = Client(self.client.url, compress=None,
+                       response_type=formats.JSON)
+        pdtest.assert_frame_equal(plain.daily(self.epoch),
+                                  daily, check_dtype=False)
+        plain.close()
+
+    def test_gzip_requests(self):
+        '''Test the server inflates gzip bodies and rejects corrupt ones'''
+        body = self.client.encode(self.epoch)
+        assert len(body.data) < len(self.epoch) * 8
+        session = self.client.session
+        r = session.post(self.client.url + '/hourly', data=b'not gzip',
+                         headers={'Content-Type': formats.OCTET,
+                                  'Content-Encoding': 'gzip'})
+        assert r.status_code == 400
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        data = compressor.compress(b'data=["2013-06-16T00:00:00"]') + \
+            compressor.flush()
+        r = session.post(self.client.url + '/hourly', data=data, headers={
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Content-Encoding': 'gzip'})
+        assert r.json() == {'Events': {'time': [0], 'data': [1.0]}}
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Event Log Tests
+
+'''
+from __future__ import print_function, division
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import transformations as tr
+from mcflyin.eventlog import EventLog
+from helpers import bursty
+
+
+class testEventLog(object):
+
+    def setup(self):
+        '''Setup bursty events over a few months, and an empty log'''
+        np.random.seed(0)
+        self.index = bursty(600, 20000)
+        self.directory = tempfile.mkdtemp()
+        self.log = EventLog(self.directory + '/events')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append(self):
+        '''Test out of order appends are stored sorted, one file per
+        partition'''
+        for chunk in [self.index[10000:], self.index[:5000],
+                      self.index[5000:10000]]:
+            self.log.append('views', chunk)
+        assert self.log.names() == ['views']
+        pdtest.assert_index_equal(self.log.index('views'), self.index)
+        months = sorted(os.listdir(self.directory + '/events/views'))
+        assert months[0] == '2013-06.i64' and len(months) == 5
+
+        daily = EventLog(self.directory + '/daily', partition='day')
+        daily.append('views', self.index)
+        assert len(os.listdir(self.directory + '/daily/views')) > 100
+        assert EventLog(self.directory + '/daily').partition == 'day'
+
+    def test_range(self):
+        '''Test range reads are half open and map single partitions without
+        copying'''
+        self.log.append('views', self.index)
+        start, end = pd.Timestamp('2013-07-03'), pd.Timestamp('2013-07-10')
+        expected = self.index[(self.index >= start) & (self.index < end)]
+        pdtest.assert_index_equal(self.log.index('views', start, end),
+                                  expected)
+        views = self.log.stamps('views', start, end)
+        assert len(views) == 1 and isinstance(views[0].base, np.memmap)
+        spanning = self.log.index('views', '2013-06-20', '2013-08-20')
+        assert spanning[0] >= pd.Timestamp('2013-06-20')
+        assert spanning[-1] < pd.Timestamp('2013-08-20')
+        assert not len(self.log.index('views', '2020-01-01'))
+
+    def test_query(self):
+        '''Test queries match the transformations over the same events'''
+        self.log.append('views', self.index)
+        start, end = '2013-07-01', '2013-09-01'
+        events = self.index[(self.index >= pd.Timestamp(start)) &
+                            (self.index < pd.Timestamp(end))]
+        for operation, params in [('resample', {'freq': {'D': 'Daily'}}),
+                                  ('daily', {'how': 'mean'}),
+                                  ('hourly', {'how': 'sum'}),
+                                  ('daily_hours', {'how': 'mean'})]:
+            pdtest.assert_frame_equal(
+                self.log.query('views', operation, start, end, **params),
+                tr.OPERATIONS[operation](df=events, **params))
+
+    def test_errors(self):
+        '''Test unknown series, names and operations'''
+        for call in [lambda: self.log.index('nope'),
+                     lambda: self.log.delete('nope')]:
+            try:
+                call()
+                raise AssertionError('KeyError not raised')
+            except KeyError:
+                pass
+        self.log.append('views', self.index)
+        for call in [lambda: self.log.append('../views', self.index),
+                     lambda: self.log.append('eventlog.json', self.index),
+                     lambda: self.log.query('views', 'nope'),
+                     lambda: self.log.query('views', 'daily', '2020-01-01'),
+                     lambda: EventLog(self.directory, partition='year')]:
+            try:
+                call()
+                raise AssertionError('ValueError not raised')
+            except ValueError:
+                pass
+        assert 'eventlog.json' not in self.log
+        assert EventLog(self.directory).partition == self.log.partition
+        self.log.delete('views')
+        assert 'views' not in self.log
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Executor Tests
+
+'''
+from __future__ import print_function, division
+import os
+import time
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import transformations as tr
+from mcflyin.executor import Busy, Executor, Timeout
+
+
+class testExecutor(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup events and a process pool'''
+        cls.index = pd.date_range('6/16/2013', periods=10080, freq='T')
+        cls.keyed = tr.to_keyed({'a': cls.index[:5000].tolist(),
+                                 'b': cls.index[5000:].tolist()})
+        cls.executor = Executor(kind='process', workers=2)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.executor.close()
+
+    def test_process(self):
+        '''Test process pool results match inline results'''
+        inline = Executor(kind='inline')
+        for name, params in [('daily_hours', {'how': 'mean'}),
+                             ('forward', {'periods': 180}),
+                             ('resample', {'freq': {'H': 'Hourly'}})]:
+            pdtest.assert_frame_equal(
+                self.executor.run(name, self.index, **params),
+                inline.run(name, self.index, **params))
+        keyed = self.executor.run('hourly', self.keyed, how='sum')
+        assert sorted(keyed) == ['a', 'b']
+
+    def test_weights(self):
+        '''Test weighted Events frames keep their weights in workers'''
+        df = pd.DataFrame({'Events': np.arange(len(self.index)) % 5 + 1.0},
+                          index=self.index)
+        for name, params in [('daily', {'how': 'sum'}),
+                             ('resample', {'freq': {'H': 'Hourly'}})]:
+            pdtest.assert_frame_equal(
+                self.executor.run(name, df, **params),
+                Executor(kind='inline').run(name, df, **params))
+
+    def test_shared_files_removed(self):
+        '''Test shared event files are cleaned up'''
+        before = set(os.listdir(self.executor.shared_dir))
+        self.executor.run('daily', self.index, how='sum')
+        assert set(os.listdir(self.executor.shared_dir)) == before
+
+    def test_thread(self):
+        '''Test thread pool execution'''
+        executor = Executor(kind='thread', workers=1)
+        result = executor.run('hourly', self.index, how='sum')
+        executor.close()
+        assert (result['Events'] == 420).all()
+
+    def test_limits(self):
+        '''Test bounded pending jobs and job timeouts'''
+        try:
+            Executor(kind='inline', max_pending=0).run('daily', self.index)
+            raise AssertionError('Busy not raised')
+        except Busy:
+            pass
+        executor = Executor(kind='process', workers=1, timeout=1e-6)
+        try:
+            executor.run('forward', self.index, periods=10**6)
+            raise AssertionError('Timeout not raised')
+        except Timeout:
+            pass
+        finally:
+            executor.close()
+
+    def test_timed_out_slots(self):
+        '''Test timed out jobs keep their slot and shared arrays until they
+        finish'''
+        def wait(df=None, seconds=0):
+            time.sleep(seconds)
+            return len(df)
+        tr.OPERATIONS['wait'] = wait
+        try:
+            for kind in ['thread', 'process']:
+                executor = Executor(kind=kind, workers=1, max_pending=1,
+                                    timeout=0.05)
+                before = set(os.listdir(executor.shared_dir))
+                try:
+                    executor.run('wait', self.index, seconds=0.5)
+                    raise AssertionError('Timeout not raised')
+                except Timeout:
+                    pass
+                try:
+                    executor.run('wait', self.index)
+                    raise AssertionError('Busy not raised')
+                except Busy as error:
+                    assert str(error) == '1 jobs already pending'
+                if kind == 'process':
+                    assert set(os.listdir(executor.shared_dir)) != before
+                time.sleep(1)
+                assert executor.run('wait', self.index) == len(self.index)
+                assert set(os.listdir(executor.shared_dir)) == before
+                try:
+                    executor.run('wait', self.index, seconds='x')
+                    raise AssertionError('TypeError not raised')
+                except TypeError:
+                    pass
+                assert executor.run('wait', self.index) == len(self.index)
+                executor.close()
+        finally:
+            del tr.OPERATIONS['wait']
+
+    def test_start(self):
+        '''Test workers preload modules and can be started up front'''
+        executor = Executor(kind='process', workers=1,
+                            preload=('json', 'mcflyin.rolling')).start()
+        assert executor._pool is not None
+        result = executor.run('hourly', self.index, how='sum')
+        executor.close()
+        assert (result['Events'] == 420).all()
+        try:
+            Executor(start_method='no-such-method')
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
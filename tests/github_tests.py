@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin GitHub Fetcher Tests, against a local stub of the events API
+
+'''
+from __future__ import print_function, division
+import json
+import threading
+import time
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+import pandas as pd
+from mcflyin.github import GithubFetcher, RateLimited, Unavailable
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    '''Events API stub serving `pages` of events per user, and a 500 to
+    the users in `failing`'''
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.pages = {}
+        self.requests = []
+        self.failing = set()
+        self.remaining = 5000
+        self.reset = int(time.time()) + 60
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        user = url.path.split('/')[2] if url.path.startswith('/users/') \
+            else 'public'
+        page = int(parse_qs(url.query).get('page', ['1'])[0])
+        events = self.server.pages.get(user, {}).get(page, [])
+        etag = '"{0}"'.format(hash(json.dumps(events)))
+        self.server.requests.append((user, page,
+                                     self.headers.get('If-None-Match')))
+        self.server.remaining -= 1
+        if user in self.server.failing:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            body = b''
+        else:
+            self.send_response(200)
+            body = json.dumps(events).encode('utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('X-RateLimit-Remaining', str(self.server.remaining))
+        self.send_header('X-RateLimit-Reset', str(self.server.reset))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def events(start, count):
+    '''Events with sequential IDs, one minute apart'''
+    return [{'id': str(start + i),
+             'created_at': (pd.Timestamp('2013-06-16') +
+                            pd.Timedelta(minutes=start + i))
+             .strftime('%Y-%m-%dT%H:%M:%SZ')}
+            for i in range(count)]
+
+
+class testGithub(object):
+
+    def setup(self):
+        '''Start the stub server'''
+        self.server = StubServer()
+        self.server.pages = {'public': {1: events(200, 100),
+                                        2: events(100, 100),
+                                        3: events(0, 100)},
+                             'wrobstory': {1: events(0, 30)}}
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.fetcher = GithubFetcher(
+            base_url='http://127.0.0.1:{0}'.format(self.server.server_port),
+            pages=3, workers=4)
+
+    def teardown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_pages(self):
+        '''Test every page is fetched and merged'''
+        index = self.fetcher.fetch()
+        assert len(index) == 300
+        assert index.is_monotonic_increasing
+        assert index[0] == pd.Timestamp('2013-06-16')
+        assert sorted(x[1] for x in self.server.requests) == [1, 2, 3]
+
+    def test_conditional(self):
+        '''Test unchanged pages are revalidated and new events merged'''
+        self.fetcher.fetch()
+        del self.server.requests[:]
+        assert len(self.fetcher.fetch()) == 300
+        assert all(x[2] is not None for x in self.server.requests)
+
+        self.server.pages['public'][1] = events(250, 100)
+        index = self.fetcher.fetch()
+        assert len(index) == 300
+        assert index[0] == pd.Timestamp('2013-06-16') + \
+            pd.Timedelta(minutes=50)
+        assert index[-1] == pd.Timestamp('2013-06-16') + \
+            pd.Timedelta(minutes=349)
+
+    def test_bounded_cache(self):
+        '''Test the cache keeps parsed stamps of the most recent events'''
+        feed = self.fetcher._feed('public')
+        feed.max_events = 150
+        self.fetcher.fetch()
+        assert len(feed.ids) == 150 and len(feed.stamps) == 150
+        assert feed.stamps.dtype == 'int64'
+        assert feed.merge(events(250, 50)) == 0
+        assert feed.merge(events(300, 10)) == 10
+        assert feed.index()[0] == pd.Timestamp('2013-06-16') + \
+            pd.Timedelta(minutes=160)
+
+    def test_many_and_rate_limit(self):
+        '''Test fetching several users, then serving the cache once the
+        rate limit is exhausted'''
+        indexes = self.fetcher.fetch_many(['public', 'wrobstory'])
+        assert len(indexes['public']) == 300
+        assert len(indexes['wrobstory']) == 30
+
+        self.server.remaining = 3
+        self.fetcher.fetch('wrobstory')
+        assert self.fetcher.remaining == 0
+        count = len(self.server.requests)
+        assert len(self.fetcher.fetch('wrobstory')) == 30
+        assert len(self.server.requests) == count
+        try:
+            self.fetcher.fetch('nobody')
+            raise AssertionError('RateLimited not raised')
+        except RateLimited:
+            pass
+
+    def test_upstream_failure(self):
+        '''Test failed requests serve the cached feed, or raise Unavailable'''
+        assert len(self.fetcher.fetch('wrobstory')) == 30
+        self.server.failing.update(['wrobstory', 'nobody'])
+        assert len(self.fetcher.fetch('wrobstory')) == 30
+        try:
+            self.fetcher.fetch('nobody')
+            raise AssertionError('Unavailable not raised')
+        except Unavailable:
+            pass
+
+    def test_max_feeds(self):
+        '''Test only the most recently fetched feeds are kept'''
+        self.fetcher.max_feeds = 2
+        self.fetcher.fetch('public')
+        self.fetcher.fetch('wrobstory')
+        self.fetcher.fetch('public')
+        self.fetcher.fetch('nobody')
+        assert list(self.fetcher.feeds) == ['public', 'nobody']
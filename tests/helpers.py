@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Test Helpers
+
+'''
+import numpy as np
+import pandas as pd
+
+
+def bursty(scale, size, start='6/16/2013'):
+    '''DatetimeIndex of `size` sorted events from `start`, with exponential
+    gaps of mean `scale` seconds. Seed numpy.random first.'''
+    offsets = np.random.exponential(scale, size).cumsum() * 10**9
+    stamps = pd.Timestamp(start).value + offsets.astype(np.int64)
+    return pd.DatetimeIndex(stamps.view('M8[ns]'))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Import Tests
+
+'''
+from __future__ import print_function, division
+import json
+import subprocess
+import sys
+
+#: Imports a module in a fresh interpreter and lists the loaded modules
+CHILD = '''
+import json, sys
+import {0}
+json.dump(sorted(m for m in sys.modules if sys.modules[m]), sys.stdout)
+'''
+
+
+def loaded(statement):
+    '''Modules loaded by `statement` in a fresh interpreter'''
+    output = subprocess.check_output([sys.executable, '-c',
+                                      CHILD.format(statement)])
+    return set(json.loads(output.decode('utf-8')))
+
+
+class testImports(object):
+
+    def test_package(self):
+        '''Test importing the package loads no submodules'''
+        modules = loaded('mcflyin')
+        assert 'pandas' not in modules
+        assert 'mcflyin.transformations' not in modules
+
+    def test_transformations(self):
+        '''Test the transformations do not pull in the web stack'''
+        modules = loaded('mcflyin.transformations')
+        for name in ('flask', 'requests', 'tornado', 'statsmodels'):
+            assert name not in modules, name
+        assert 'mcflyin.application' not in modules
+
+    def test_lazy_submodules(self):
+        '''Test submodules are imported on attribute access'''
+        import mcflyin
+        assert mcflyin.transformations.MINUTE == 60 * 10**9
+        assert 'application' in dir(mcflyin)
+        try:
+            mcflyin.no_such_module
+            raise AssertionError('AttributeError not raised')
+        except AttributeError:
+            pass
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Streaming Ingest Tests
+
+'''
+from __future__ import print_function, division
+import io
+import json
+import struct
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import application
+from mcflyin import ingest
+from mcflyin import transformations as tr
+
+
+def frames(stamps, size):
+    '''Length-prefixed int64 frames of `size` stamps each'''
+    body = b''
+    for start in range(0, len(stamps), size):
+        chunk = stamps[start:start + size].astype('<i8').tostring()
+        body += struct.pack('<I', len(chunk)) + chunk
+    return body
+
+
+class testIngest(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup bursty events and their epoch milliseconds'''
+        np.random.seed(0)
+        start = pd.Timestamp('6/16/2013').value // 10**6
+        cls.epoch = start + np.random.exponential(90000, 20000).cumsum()\
+            .astype(np.int64)
+        cls.index = tr.to_index(cls.epoch)
+
+    def test_ndjson(self):
+        '''Test NDJSON split across small chunks matches the whole upload'''
+        lines = '\n'.join(json.dumps(x.isoformat()) for x in self.index)
+        stream = ingest.read(io.BytesIO(lines.encode('utf-8')),
+                             ingest.NDJSON, chunk_size=1000)
+        assert stream.events == 20000
+        pdtest.assert_frame_equal(
+            stream.resample(freq={'H': 'Hourly'}),
+            tr.resample.frame(df=self.index, freq={'H': 'Hourly'}))
+        pdtest.assert_frame_equal(stream.daily(how='mean'),
+                                  tr.daily.frame(df=self.index, how='mean'))
+
+    def test_frames(self):
+        '''Test length-prefixed frames split across small chunks'''
+        body = frames(self.epoch, 3000)
+        stream = ingest.read(io.BytesIO(body), ingest.FRAMES, chunk_size=777)
+        assert stream.events == 20000
+        pdtest.assert_frame_equal(stream.hourly(how='sum'),
+                                  tr.hourly.frame(df=self.index, how='sum'))
+        pdtest.assert_frame_equal(
+            stream.rolling_sum(window=3, freq={'D': 'Daily'}),
+            tr.rolling_sum.frame(df=self.index, window=3,
+                                 freq={'D': 'Daily'}))
+
+    def test_truncated(self):
+        '''Test truncated frames and unknown mimetypes are rejected'''
+        body = frames(self.epoch[:10], 10)[:-4]
+        for attempt in [lambda: ingest.read(io.BytesIO(body), ingest.FRAMES),
+                        lambda: ingest.Ingest('text/csv')]:
+            try:
+                attempt()
+                raise AssertionError('ValueError not raised')
+            except ValueError:
+                pass
+
+    def test_routes(self):
+        '''Test streamed bodies through the transformation routes'''
+        app = application.app.test_client()
+        body = '\n'.join(str(x) for x in self.epoch).encode('utf-8')
+        rv = app.post('/daily_hours', data=body, content_type=ingest.NDJSON)
+        expected = tr.jsonified(tr.daily_hours(df=self.index))
+        assert json.loads(rv.data) == json.loads(json.dumps(expected))
+
+        rv = app.post('/resample?freq={"D": "Daily"}',
+                      data=frames(self.epoch, 5000),
+                      content_type=ingest.FRAMES)
+        expected = tr.resample(df=self.index, freq={'D': 'Daily'})
+        assert json.loads(rv.data) == json.loads(json.dumps(expected))
+
+        rv = app.post('/resample?freq={"S": "Secondly"}', data=body,
+                      content_type=ingest.NDJSON)
+        assert rv.status_code == 400
+        rv = app.post('/hourly', data=frames(self.epoch, 10)[:-4],
+                      content_type=ingest.FRAMES)
+        assert rv.status_code == 400
+        rv = app.post('/hourly', data=b'0\n9000000000000\n',
+                      content_type=ingest.NDJSON)
+        assert rv.status_code == 400
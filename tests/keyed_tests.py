@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Keyed Multi-Series Tests
+
+'''
+from __future__ import print_function, division
+import numpy as np
+import pandas.util.testing as pdtest
+from mcflyin import transformations as tr
+from helpers import bursty
+
+
+class testKeyed(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup three series of bursty events over different spans'''
+        np.random.seed(2)
+        cls.series = {}
+        for label, start, count in [('alice', '6/16/2013', 4000),
+                                    ('bob', '6/18/2013 05:00', 9000),
+                                    ('carol', '6/20/2013 13:30', 3000)]:
+            cls.series[label] = bursty(200, count, start)
+        cls.data = dict((k, [x.isoformat() for x in v])
+                        for k, v in cls.series.items())
+        cls.keyed = tr.to_keyed(cls.data)
+
+    def check(self, results, func):
+        '''Compare per-series results with `func` of each series'''
+        assert sorted(results) == sorted(self.series)
+        for label, index in self.series.items():
+            pdtest.assert_frame_equal(results[label], func(index))
+
+    def test_to_keyed(self):
+        '''Test dict and pair input give the same Keyed events'''
+        pairs = [[stamp, label] for label, stamps in self.data.items()
+                 for stamp in stamps]
+        from_pairs = tr.to_keyed(pairs)
+        assert from_pairs.labels == self.keyed.labels == \
+            ['alice', 'bob', 'carol']
+        order = np.lexsort([from_pairs.index.asi8, from_pairs.codes])
+        assert (from_pairs.index.asi8[order] == self.keyed.index.asi8).all()
+        assert (from_pairs.codes[order] == self.keyed.codes).all()
+
+    def test_resample(self):
+        '''Test per-series resampling and rolling sums'''
+        for freq in [{'H': 'Hourly'}, {'D': 'Daily'}, {'W': 'Weekly'}]:
+            self.check(tr.resample.frame(df=self.keyed, freq=freq),
+                       lambda x: tr.resample.frame(df=x, freq=freq))
+        freq = {'H': 'Hourly'}
+        self.check(tr.rolling_sum.frame(df=self.keyed, window=6, freq=freq),
+                   lambda x: tr.rolling_sum.frame(df=x, window=6, freq=freq))
+
+    def test_tables(self):
+        '''Test per-series daily, hourly and daily_hours tables'''
+        for how in ['sum', 'mean']:
+            self.check(tr.daily.frame(df=self.keyed, how=how),
+                       lambda x: tr.daily.frame(df=x, how=how))
+            self.check(tr.hourly.frame(df=self.keyed, how=how),
+                       lambda x: tr.hourly.frame(df=x, how=how))
+            self.check(tr.daily_hours(df=self.keyed, how=how),
+                       lambda x: tr.daily_hours(df=x, how=how))
+
+    def test_forward(self):
+        '''Test per-series forward projection'''
+        self.check(tr.forward.frame(df=self.keyed, periods=200),
+                   lambda x: tr.forward.frame(df=x, periods=200))
+
+    def test_jsonify(self):
+        '''Test keyed results are jsonified per series'''
+        result = tr.hourly(df=self.keyed, how='sum')
+        assert sorted(result) == ['alice', 'bob', 'carol']
+        assert result['bob'] == tr.hourly(df=self.series['bob'], how='sum')
+
+    def test_sparse_spans(self):
+        '''Test series far apart are binned over their own spans only'''
+        keyed = tr.to_keyed({'early': ['2013-01-01T00:00:00',
+                                       '2013-01-01T00:09:00'],
+                             'late': ['2014-06-01T12:00:00',
+                                      '2014-06-01T12:02:30']})
+        series, codes, counts, first, last = tr._keyed_runs(keyed,
+                                                            tr.MINUTE)
+        assert len(codes) == 4 and (counts == 1).all()
+        results = tr.resample.frame(df=keyed, freq={'T': 'Minutely'})
+        assert len(results['early']) == 10 and len(results['late']) == 3
+        assert results['late']['Minutely'].sum() == 2
+        self.check(tr.resample.frame(df=self.keyed, freq={'7H': 'Bins'}),
+                   lambda x: tr.resample.frame(df=x, freq={'7H': 'Bins'}))
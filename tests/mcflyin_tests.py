@@ -4,11 +4,17 @@ McFlyin Tests
 
 '''
 from __future__ import print_function, division
+import io
 import json
+import os
+import shutil
+import tempfile
+import unittest
 import numpy as np
 import pandas as pd
 import pandas.util.testing as pdtest
 import mcflyin
+import mcflyin.formats
 
 
 def to_df(data):
@@ -86,6 +92,20 @@ class testMcflyin(object):
 
         pdtest.assert_frame_equal(df, rolling)
 
+    def test_rolling_stats(self):
+        '''Test several rolling windows and statistics in one request'''
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'windows': json.dumps(['3H', 24]),
+                'how': json.dumps(['sum', 'std']),
+                'data': json.dumps(self.data)}
+        response = json.loads(self.app.post('rolling_stats', data=send).data)
+        assert sorted(response) == ['Hourly_std_24', 'Hourly_std_3H',
+                                    'Hourly_sum_24', 'Hourly_sum_3H']
+        assert response['Hourly_sum_3H']['data'][:4] == [60, 120, 180, 180]
+        assert response['Hourly_std_24']['data'][5] == 0
+        send['how'] = json.dumps('median')
+        assert self.app.post('rolling_stats', data=send).status_code == 400
+
     def test_daily(self):
         '''Test daily summing'''
         send = {'data': json.dumps(self.data), 'how': json.dumps('sum')}
@@ -139,3 +159,433 @@ class testMcflyin(object):
 
 
 
+
+    def test_required_params(self):
+        '''Test missing or non-integer window and periods get a 400'''
+        data = json.dumps(self.data)
+        freq = json.dumps({'H': 'Hourly'})
+        for route, send in [('rolling_sum', {'freq': freq}),
+                            ('rolling_sum', {'freq': freq, 'window': '"3"'}),
+                            ('rolling_sum', {'freq': freq, 'window': 'x'}),
+                            ('rolling_sum', {'freq': freq, 'window': '2.5'}),
+                            ('forward', {}),
+                            ('forward', {'periods': 'null'}),
+                            ('forward', {'periods': 'true'})]:
+            send['data'] = data
+            assert self.app.post(route, data=send).status_code == 400
+
+    def test_resample_epoch(self):
+        '''Test Resampling with epoch millisecond timestamps'''
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'data': json.dumps(self.data),
+                'time_format': json.dumps('epoch')}
+        rv = self.app.post('resample', data=send)
+        response = json.loads(rv.data)
+        index = pd.to_datetime(response['Hourly']['time'], unit='ms')
+        truthy = pd.date_range('6/16/2013', periods=168, freq='H')
+        assert (index == truthy).all()
+        assert response['Hourly']['data'] == [60.0] * 168
+
+    def test_to_index(self):
+        '''Test bulk timestamp parsing paths'''
+        truthy = pd.to_datetime(self.data)
+        pdtest.assert_index_equal(mcflyin.transformations.to_index(self.data),
+                                  truthy)
+        epoch = (truthy.asi8 // 10**6).tolist()
+        pdtest.assert_index_equal(mcflyin.transformations.to_index(epoch),
+                                  truthy)
+        declared = [x.strftime('%m/%d/%Y %H:%M') for x in truthy]
+        parsed = mcflyin.transformations.to_index(declared,
+                                                  fmt='%m/%d/%Y %H:%M')
+        pdtest.assert_index_equal(parsed, truthy)
+        mixed = ['6/16/2013 00:00', '2013-06-16T00:01:00']
+        pdtest.assert_index_equal(mcflyin.transformations.to_index(mixed),
+                                  truthy[:2])
+
+    def test_to_index_floats(self):
+        '''Test float epoch offsets are rounded, with NaN as NaT'''
+        parsed = mcflyin.transformations.to_index(
+            [1371340799.9999999, float('nan')], unit='s')
+        assert parsed[0] == pd.Timestamp('2013-06-16')
+        assert parsed[1] is pd.NaT
+        parsed = mcflyin.transformations.to_index([1.9999999e-6], unit='ms')
+        assert parsed.asi8.tolist() == [2]
+        for data in [[float('inf')], [1e20]]:
+            try:
+                mcflyin.transformations.to_index(data, unit='s')
+                raise AssertionError('ValueError not raised')
+            except ValueError:
+                pass
+        rv = self.app.post('daily', data={'data': '[1e20]'})
+        assert rv.status_code == 400
+
+    def test_to_index_nulls(self):
+        '''Test null epoch offsets become NaT, in the given unit'''
+        tr = mcflyin.transformations
+        parsed = tr.to_index(json.loads('[1371340800000, null, 1.5]'))
+        assert parsed[0] == pd.Timestamp('2013-06-16')
+        assert parsed[1] is pd.NaT
+        assert parsed[2].value == 1500000
+        parsed = tr.to_index([None, 1371340800], unit='s')
+        assert parsed[0] is pd.NaT
+        assert parsed[1] == pd.Timestamp('2013-06-16')
+        assert tr.to_index([None, '2013-06-16'])[1] == \
+            pd.Timestamp('2013-06-16')
+        epoch = (pd.to_datetime(self.data).asi8 // 10**6).tolist()
+        rv = self.app.post('resample', data={
+            'data': json.dumps(epoch + [None]),
+            'freq': json.dumps({'D': 'Daily'})})
+        assert (single_df(json.loads(rv.data))['Daily'] == 1440).all()
+
+    def test_resample_epoch_input(self):
+        '''Test Resampling of epoch second timestamps'''
+        epoch = (pd.to_datetime(self.data).asi8 // 10**9).tolist()
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'data': json.dumps(epoch),
+                'unit': json.dumps('s')}
+        rv = self.app.post('resample', data=send)
+        df = single_df(json.loads(rv.data))
+        assert (df['Hourly'] == 60).all()
+
+    def test_binary_octet_npz(self):
+        '''Test raw int64 epoch upload with an npz response'''
+        formats = mcflyin.formats
+        epoch = pd.to_datetime(self.data).asi8 // 10**6
+        rv = self.app.post('resample?freq={"H": "Hourly"}',
+                           data=epoch.astype('<i8').tostring(),
+                           content_type=formats.OCTET,
+                           headers={'Accept': formats.NPZ})
+        assert rv.mimetype == formats.NPZ
+        df = formats.decode_frame(rv.data, formats.NPZ)
+        assert (df['Hourly'] == 60).all()
+        assert df.index[0] == pd.Timestamp('6/16/2013')
+
+    def test_binary_npy_msgpack(self):
+        '''Test .npy upload with a msgpack response'''
+        try:
+            import msgpack
+        except ImportError:
+            raise unittest.SkipTest('msgpack is not installed')
+        formats = mcflyin.formats
+        buf = io.BytesIO()
+        np.save(buf, pd.to_datetime(self.data).values)
+        rv = self.app.post('daily_hours', data=buf.getvalue(),
+                           content_type=formats.NPY,
+                           headers={'Accept': formats.MSGPACK})
+        df = formats.decode_frame(rv.data, formats.MSGPACK)
+        assert (df == 60).all().all()
+        assert sorted(df.index) == list(range(24))
+
+    def test_binary_arrow(self):
+        '''Test Arrow IPC upload and response'''
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise unittest.SkipTest('pyarrow is not installed')
+        formats = mcflyin.formats
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(pd.to_datetime(self.data).values)], ['time'])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchStreamWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        rv = self.app.post('forward?periods=180',
+                           data=sink.getvalue().to_pybytes(),
+                           content_type=formats.ARROW,
+                           headers={'Accept': formats.ARROW})
+        df = formats.decode_frame(rv.data, formats.ARROW)
+        rng = pd.date_range('6/23/2013', periods=180, freq='H')
+        assert (df.index == rng).all()
+        assert (df['Events'] == 60).all()
+
+    def test_batch(self):
+        '''Test batched operations against the single endpoints'''
+        operations = [{'op': 'resample', 'freq': {'H': 'Hourly'}},
+                      {'op': 'hourly', 'how': 'mean'},
+                      {'op': 'daily_hours', 'how': 'mean'},
+                      {'op': 'forward', 'periods': 180}]
+        send = {'data': json.dumps(self.data),
+                'operations': json.dumps(operations)}
+        rv = self.app.post('batch', data=send)
+        results = json.loads(rv.data)
+        assert len(results) == 4
+
+        singles = [('resample', {'freq': json.dumps({'H': 'Hourly'})}),
+                   ('hourly', {'how': json.dumps('mean')}),
+                   ('forward', {'periods': json.dumps(180)})]
+        for result, (route, params) in zip([results[0], results[1],
+                                            results[3]], singles):
+            params['data'] = json.dumps(self.data)
+            single = json.loads(self.app.post(route, data=params).data)
+            assert result == single
+        assert sorted(results[2].keys()) == sorted(
+            ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+             'Saturday', 'Sunday'])
+
+        send['operations'] = json.dumps([{'op': 'nope'}])
+        assert self.app.post('batch', data=send).status_code == 400
+
+    def test_batch_index(self):
+        '''Test batches of a bare DatetimeIndex match batches of its frame'''
+        tr = mcflyin.transformations
+        index = pd.to_datetime(self.data)
+        operations = [{'op': name} for name in ['daily', 'hourly',
+                                                'daily_hours']]
+        operations += [{'op': 'resample', 'freq': {'H': 'Hourly'}},
+                       {'op': 'rolling_sum', 'freq': {'H': 'Hourly'},
+                        'window': 3},
+                       {'op': 'forward', 'periods': 24}]
+        for indexed, framed in zip(tr.batch(df=index, operations=operations),
+                                   tr.batch(df=tr.as_frame(index),
+                                            operations=operations)):
+            pdtest.assert_frame_equal(indexed, framed)
+
+    def test_datasets(self):
+        '''Test uploading a dataset and transforming it by ID'''
+        rv = self.app.post('datasets', data={'data': json.dumps(self.data)})
+        upload = json.loads(rv.data)
+        assert upload['events'] == 10080
+
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'dataset': upload['id']}
+        df = single_df(json.loads(self.app.post('resample', data=send).data))
+        assert (df['Hourly'] == 60).all()
+
+        rv = self.app.get('datasets/' + upload['id'])
+        assert json.loads(rv.data) == upload
+
+        url = 'datasets/{0}/counts?level="minute"&start="2013-06-17"&end={1}'
+        end = pd.Timestamp('2013-06-17 06:00').value // 10**6
+        df = single_df(json.loads(self.app.get(url.format(upload['id'],
+                                                          end)).data))
+        assert len(df) == 361 and (df['minute'] == 1).all()
+        rv = self.app.get(url.format(upload['id'], end) + '&window=3')
+        assert single_df(json.loads(rv.data))['minute'][-1] == 3
+        rv = self.app.get(url.replace('minute', 'year').format(upload['id'],
+                                                               end))
+        assert rv.status_code == 400
+
+        assert self.app.delete('datasets/' + upload['id']).status_code == 200
+        assert self.app.post('resample', data=send).status_code == 404
+
+    def test_event_log(self):
+        '''Test appending to an on-disk event log and querying a range'''
+        self.app.delete('logs/test')
+        for chunk in [self.data[5000:], self.data[:5000]]:
+            rv = self.app.post('logs/test', data={'data': json.dumps(chunk)})
+            assert rv.status_code == 200
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'start': json.dumps('2013-06-17'),
+                'end': json.dumps('2013-06-18')}
+        df = single_df(json.loads(self.app.post('logs/test/resample',
+                                                data=send).data))
+        assert len(df) == 24 and (df['Hourly'] == 60).all()
+        assert self.app.get('logs/test/nope').status_code == 404
+        assert self.app.get('logs/nope/daily').status_code == 404
+        rv = self.app.post('logs/eventlog.json',
+                           data={'data': json.dumps(chunk)})
+        assert rv.status_code == 400
+        assert self.app.delete('logs/test').status_code == 200
+        assert self.app.delete('logs/test').status_code == 404
+
+    def test_results_cache(self):
+        '''Test repeated requests are answered from the results cache'''
+        self.app.delete('cache')
+        send = {'data': json.dumps(self.data), 'how': json.dumps('mean')}
+        first = self.app.post('hourly', data=send).data
+        second = self.app.post('hourly', data=send).data
+        assert first == second
+        stats = json.loads(self.app.get('cache').data)
+        assert stats['hits'] >= 1
+
+    def test_series(self):
+        '''Test appending to a named series and querying its aggregates'''
+        for chunk in [self.data[:5000], self.data[5000:]]:
+            rv = self.app.post('series/test', data={'data': json.dumps(chunk)})
+        assert json.loads(rv.data)['events'] == 10080
+
+        rv = self.app.get('series/test/resample?freq={"H": "Hourly"}')
+        df = single_df(json.loads(rv.data))
+        assert (df['Hourly'] == 60).all()
+
+        rv = self.app.post('series/test/forward',
+                           data={'periods': json.dumps(180)})
+        df = single_df(json.loads(rv.data))
+        assert (df['Events'] == 60).all()
+        assert self.app.get('series/nope/hourly').status_code == 404
+
+    def test_bincount_tables(self):
+        '''Test the bincount kernels against lambda groupbys'''
+        np.random.seed(1)
+        index = pd.to_datetime(self.data)[np.random.rand(10080) < 0.3]
+        df = to_df(index)
+        tr = mcflyin.transformations
+        hour = lambda x: x.hour
+        weekday = lambda x: tr.WEEKDAYS[x.weekday()]
+
+        pdtest.assert_frame_equal(tr.hourly.frame(df=index),
+                                  df.groupby(hour).sum())
+        sampled = df.resample('H', how='sum')
+        pdtest.assert_frame_equal(tr.hourly.frame(df=index, how='mean'),
+                                  sampled.groupby(hour).mean())
+        weekly = tr.daily_hours(df=index, how='mean')
+        assert weekly['Monday'][3] == sampled[sampled.index.weekday == 0]\
+            .groupby(hour).mean()['Events'][3]
+        daily = tr.daily.frame(df=index)
+        assert daily['Events']['Tuesday'] == \
+            df.groupby(weekday).sum()['Events']['Tuesday']
+
+    def test_sorted_kernels(self):
+        '''Test the sorted-array kernels match unsorted and Pandas results'''
+        tr = mcflyin.transformations
+        np.random.seed(2)
+        start = pd.Timestamp('6/16/2013').value
+        for scale in [1, 600, 86400]:
+            stamps = start + (np.random.exponential(scale, 20000).cumsum() *
+                              10**9).astype(np.int64)
+            index = pd.DatetimeIndex(stamps.view('M8[ns]'))
+            shuffled = pd.DatetimeIndex(np.random.permutation(stamps)
+                                        .view('M8[ns]'))
+            assert tr.is_sorted(index) and not tr.is_sorted(shuffled)
+            for key in ['T', '15T', 'H', 'D']:
+                pdtest.assert_frame_equal(
+                    tr.resample.frame(df=index, freq={key: 'X'}),
+                    to_df(index).resample(key, how='sum')
+                    .rename(columns={'Events': 'X'}))
+            for func in [tr.hourly.frame, tr.daily.frame]:
+                pdtest.assert_frame_equal(func(df=index, how='sum'),
+                                          func(df=shuffled, how='sum'))
+            pdtest.assert_frame_equal(tr.daily_hours(df=index),
+                                      tr.daily_hours(df=shuffled))
+
+    def test_prune(self):
+        '''Test pruning to a time range, sorted or not'''
+        tr = mcflyin.transformations
+        index = pd.to_datetime(self.data)
+        shuffled = index[np.random.permutation(len(index))]
+        start, end = pd.Timestamp('6/17/2013'), pd.Timestamp('6/18/2013')
+        expected = index[(index >= start) & (index < end)]
+        pdtest.assert_index_equal(tr.prune(shuffled, start, end), expected)
+        pdtest.assert_index_equal(tr.prune(index, start, end, True),
+                                  expected)
+        assert len(tr.prune(index, end=start)) == 1440
+        keyed = tr.to_keyed({'a': self.data[:5000], 'b': self.data[5000:]})
+        pruned = tr.prune(keyed, start='6/19/2013')
+        assert pruned.labels == ['a', 'b']
+        assert len(pruned.index) == len(pruned.codes) == 10080 - 4320
+        assert len(tr.to_df(self.data, start=start, end=end)) == 1440
+
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'data': json.dumps(self.data[::-1]),
+                'start': json.dumps('2013-06-17'),
+                'end': json.dumps(end.value // 10**6)}
+        df = single_df(json.loads(self.app.post('resample', data=send).data))
+        assert len(df) == 24 and (df['Hourly'] == 60).all()
+        send['start'] = json.dumps('not a time')
+        assert self.app.post('resample', data=send).status_code == 400
+
+    def test_forward_long(self):
+        '''Test forward projection over a long horizon'''
+        tr = mcflyin.transformations
+        index = pd.to_datetime(self.data)
+        sampled = tr.hourly_sample(index)
+        df = tr.forward.frame(df=index, periods=87360, sampled=sampled)
+        assert len(df) == 87360
+        assert df.index[0] == pd.Timestamp('6/23/2013')
+        assert df.index[-1] == pd.Timestamp('6/23/2013') + \
+            pd.Timedelta(hours=87359)
+        assert (df['Events'] == 60).all()
+
+    def test_keyed(self):
+        '''Test per-series results for keyed input'''
+        data = {'first': self.data[:5000], 'second': self.data[5000:]}
+        send = {'freq': json.dumps({'H': 'Hourly'}),
+                'data': json.dumps(data)}
+        response = json.loads(self.app.post('resample', data=send).data)
+        assert sorted(response) == ['first', 'second']
+        df = single_df(response['second'])
+        assert df.index[0] == pd.Timestamp(self.data[5000]).floor('H')
+        assert df['Hourly'].sum() == 5080
+
+    def test_combined_resample(self):
+        '''Test every level of a combined resample in one request'''
+        freq = [{'D': 'Daily'}, {'15T': 'Quarterly'}, {'H': 'Hourly'},
+                {'W': 'Weekly'}]
+        send = {'freq': json.dumps(freq), 'data': json.dumps(self.data)}
+        response = json.loads(self.app.post('combined_resample',
+                                            data=send).data)
+        assert sorted(response) == ['Combined', 'Daily', 'Hourly',
+                                    'Quarterly', 'Weekly']
+        assert (single_df(response['Quarterly'])['Quarterly'] == 15).all()
+        assert (single_df(response['Daily'])['Daily'] == 1440).all()
+        combined = response['Combined']
+        assert len(combined['Hourly']['data']) == 10080 // 15
+        assert combined['Daily']['data'][:96] == [1440.0] * 96
+
+        index = pd.to_datetime(self.data)
+        np.random.seed(2)
+        index = index[np.random.rand(10080) < 0.1]
+        tr = mcflyin.transformations
+        resampled = tr.combined_resample.frame(
+            df=index, freq=freq + [{'7T': 'Sevenly'}, {'M': 'Monthly'}])
+        for spec in freq + [{'7T': 'Sevenly'}, {'M': 'Monthly'}]:
+            name = list(spec.values())[0]
+            pdtest.assert_frame_equal(resampled[name],
+                                      tr.resample.frame(df=index, freq=spec))
+        send['freq'] = json.dumps([{'H': 'Hourly'}, {'Q3': 'Bad'}])
+        assert self.app.post('combined_resample',
+                             data=send).status_code == 400
+
+    def test_settings(self):
+        '''Test settings come from MCFLYIN_ variables, and the executor is
+        bounded by default'''
+        setting = mcflyin.application.setting
+        os.environ['MCFLYIN_MAX_PENDING'] = '8'
+        try:
+            assert setting('max_pending', 64, int) == 8
+        finally:
+            del os.environ['MCFLYIN_MAX_PENDING']
+        assert setting('max_pending', 64, int) == 64
+        assert setting('workers', None, int) is None
+        executor = mcflyin.application.executor
+        assert executor._slots is not None
+        assert executor.timeout == 60
+
+    def test_dataset_settings(self):
+        '''Test the dataset store budget and spill directory are
+        configurable'''
+        store = mcflyin.application.make_datasets()
+        assert store.max_bytes == 256 * 2**20 and store.spill_dir is None
+        directory = tempfile.mkdtemp()
+        os.environ.update({'MCFLYIN_DATASET_BYTES': '8000',
+                           'MCFLYIN_DATASET_SPILL': directory})
+        try:
+            store = mcflyin.application.make_datasets()
+            assert store.max_bytes == 8000 and store.spill_dir == directory
+            ids = [store.put(pd.date_range(day, periods=1000, freq='T'))
+                   for day in ('6/16/2013', '6/17/2013')]
+            assert os.listdir(directory) == [ids[0] + '.npy']
+            assert len(store.get(ids[0])) == 1000
+        finally:
+            for name in ('MCFLYIN_DATASET_BYTES', 'MCFLYIN_DATASET_SPILL'):
+                del os.environ[name]
+            shutil.rmtree(directory)
+
+    def test_cache_settings(self):
+        '''Test the results cache backend and limits are configurable'''
+        cache = mcflyin.application.make_cache()
+        assert isinstance(cache, mcflyin.cache.MemoryCache)
+        assert cache.max_bytes == 64 * 2**20
+        directory = tempfile.mkdtemp()
+        os.environ.update({'MCFLYIN_CACHE': 'file',
+                           'MCFLYIN_CACHE_DIR': directory,
+                           'MCFLYIN_CACHE_BYTES': '1000'})
+        try:
+            cache = mcflyin.application.make_cache()
+            assert isinstance(cache, mcflyin.cache.FileCache)
+            assert cache.directory == directory and cache.max_bytes == 1000
+        finally:
+            for name in ('MCFLYIN_CACHE', 'MCFLYIN_CACHE_DIR',
+                         'MCFLYIN_CACHE_BYTES'):
+                del os.environ[name]
+            shutil.rmtree(directory)
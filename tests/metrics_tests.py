@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Metrics Tests
+
+'''
+from __future__ import print_function, division
+import json
+import pandas as pd
+from mcflyin import application
+from mcflyin import metrics
+
+
+class testMetrics(object):
+
+    def setup(self):
+        '''Setup App for testing, with metrics enabled'''
+        rng = pd.date_range('6/16/2013', periods=2000, freq='7T')
+        self.send = {'data': json.dumps([x.isoformat() for x in rng]),
+                     'how': json.dumps('mean')}
+        self.app = application.app.test_client()
+        metrics.clear()
+        metrics.enable()
+
+    def teardown(self):
+        metrics.enable(False)
+
+    def test_histogram(self):
+        '''Test cumulative bucket counts'''
+        histogram = metrics.Histogram('test_seconds', 'Test', (1, 2, 4))
+        for value in [0.5, 1.5, 3, 10]:
+            histogram.observe(value, 'spam')
+        lines = histogram.render()
+        assert 'test_seconds_bucket{stage="spam",le="2"} 2' in lines
+        assert 'test_seconds_bucket{stage="spam",le="+Inf"} 4' in lines
+        assert 'test_seconds_sum{stage="spam"} 15.0' in lines
+
+    def test_server_timing(self):
+        '''Test the stages of a request are reported'''
+        application.results.clear()
+        rv = self.app.post('/daily_hours', data=self.send)
+        stages = [x.split(';')[0]
+                  for x in rv.headers['Server-Timing'].split(', ')]
+        for name in ['parse', 'to_index', 'transform', 'jsonify', 'dumps',
+                     'total']:
+            assert name in stages
+
+        text = self.app.get('/metrics').data.decode('utf-8')
+        assert 'mcflyin_stage_seconds_count{stage="transform"} 1' in text
+        assert 'mcflyin_request_seconds_count{route="daily_hours"} 1' in text
+        assert 'mcflyin_response_bytes_count{route="daily_hours"} 1' in text
+        assert 'mcflyin_peak_rss_bytes' in text
+        assert '# TYPE mcflyin_cache_hits_total counter' in text
+        assert '# TYPE mcflyin_cache_misses_total counter' in text
+        assert '# TYPE mcflyin_cache_size gauge' in text
+
+    def test_disabled(self):
+        '''Test nothing is recorded while disabled'''
+        metrics.enable(False)
+        rv = self.app.post('/hourly', data=self.send)
+        assert 'Server-Timing' not in rv.headers
+        assert 'mcflyin_stage_seconds_count' not in metrics.render()
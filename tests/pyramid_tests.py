@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Rollup Pyramid Tests
+
+'''
+from __future__ import print_function, division
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import application
+from mcflyin import transformations as tr
+from mcflyin.pyramid import LEVELS, Pyramid, PyramidStore
+from mcflyin.store import DatasetStore
+from helpers import bursty
+
+
+class testPyramid(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup bursty events over a few months, and their pyramid'''
+        np.random.seed(0)
+        cls.index = bursty(600, 20000)
+        cls.directory = tempfile.mkdtemp()
+        cls.pyramid = Pyramid.build(cls.index, cls.directory + '/abc')
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_levels(self):
+        '''Test every level matches resample over the whole range'''
+        for level, key in LEVELS:
+            pdtest.assert_frame_equal(
+                self.pyramid.query(level),
+                tr.resample.frame(df=self.index, freq={key: level}))
+            assert self.pyramid.counts[level].sum() == 20000
+
+    def test_ranges(self):
+        '''Test range queries slice the resampled levels'''
+        for level, key in LEVELS:
+            expected = tr.resample.frame(df=self.index, freq={key: 'Events'})
+            for start, end in [('2013-07-03 10:30', '2013-08-20'),
+                               ('2013-01-01', '2013-06-30'),
+                               ('2013-07-15 00:00', '2013-07-15 00:00'),
+                               ('2014-01-01', '2014-02-01')]:
+                pdtest.assert_frame_equal(
+                    self.pyramid.query(level, start, end, name='Events'),
+                    expected[pd.Timestamp(start):pd.Timestamp(end)])
+
+    def test_rolling(self):
+        '''Test rolling sums over a range match rolling_sum'''
+        for level, window in [('minute', 90), ('hour', 5), ('day', 3)]:
+            key = dict(LEVELS)[level]
+            expected = tr.rolling_sum.frame(df=self.index, window=window,
+                                            freq={key: level})
+            start, end = '2013-07-03 10:30', '2013-07-20'
+            pdtest.assert_frame_equal(
+                self.pyramid.query(level, start, end, window=window),
+                expected[pd.Timestamp(start):pd.Timestamp(end)])
+            pdtest.assert_frame_equal(
+                self.pyramid.query(level, window=window), expected)
+
+    def test_store(self):
+        '''Test pyramids are built once and reopened from disk'''
+        store = PyramidStore(self.directory)
+        pyramid = store.get('abc', None)
+        assert pyramid.origins == self.pyramid.origins
+        assert store.get('abc', None) is pyramid
+        store.delete('abc')
+        try:
+            store.get('abc', pd.DatetimeIndex([]))
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
+        self.__class__.pyramid = store.get('abc', self.index)
+
+    def test_dataset_eviction(self):
+        '''Test pyramids are dropped with the datasets the store evicts'''
+        store = PyramidStore(self.directory)
+        datasets = DatasetStore(max_bytes=self.index.nbytes,
+                                on_evict=store.delete)
+        first = datasets.put(self.index)
+        store.get(first, datasets.get(first))
+        assert os.path.isdir(os.path.join(self.directory, first))
+        datasets.put(self.index[:100])
+        assert first not in datasets
+        assert not os.path.exists(os.path.join(self.directory, first))
+        assert application.datasets.on_evict == application.pyramids.delete
+
+    def test_max_buckets(self):
+        '''Test datasets spanning more than max_buckets minutes are refused
+        before anything is written'''
+        store = PyramidStore(self.directory, max_buckets=60 * 24)
+        try:
+            store.get('wide', self.index)
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
+        assert not os.path.exists(os.path.join(self.directory, 'wide'))
+        assert not [x for x in os.listdir(self.directory)
+                    if x.startswith('.build-')]
+
+    def test_concurrent_build(self):
+        '''Test concurrent first queries share one complete build'''
+        store = PyramidStore(self.directory)
+        pyramids = []
+        threads = [threading.Thread(
+            target=lambda: pyramids.append(store.get('concurrent',
+                                                     self.index)))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(pyramids) == 8
+        assert all(x is pyramids[0] for x in pyramids)
+        assert pyramids[0].counts['minute'].sum() == 20000
+        other = Pyramid.build(self.index, self.directory + '/concurrent')
+        assert other.origins == pyramids[0].origins
+        assert not [x for x in os.listdir(self.directory)
+                    if x.startswith('.build-')]
+        store.delete('concurrent')
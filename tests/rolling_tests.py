@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Rolling Window Tests
+
+'''
+from __future__ import print_function, division
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import rolling
+from mcflyin import transformations as tr
+from helpers import bursty
+
+
+class testRolling(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup hourly counts with gaps, and an irregular index'''
+        np.random.seed(0)
+        cls.index = bursty(900, 5000)
+        cls.hourly = tr.resample.frame(df=cls.index, freq={'H': 'Hourly'})
+        values = np.random.poisson(3, 500).astype(float)
+        values[np.random.rand(500) < 0.2] = np.nan
+        stamps = np.sort(np.random.choice(2000, 500, replace=False))
+        start = pd.Timestamp('6/16/2013').value
+        cls.irregular = pd.Series(values, index=pd.DatetimeIndex(
+            (start + stamps * 10**9 * 3600).view('M8[ns]')))
+
+    def test_count_windows(self):
+        '''Test row windows against the Pandas rolling functions'''
+        series = self.hourly['Hourly']
+        for window in [1, 2, 5, 24, 167, 10**5]:
+            starts = rolling.window_starts(series.index, window)
+            for how in rolling.STATISTICS:
+                expected = getattr(pd, 'rolling_' + how)(series, window,
+                                                         min_periods=1)
+                np.testing.assert_allclose(
+                    rolling.aggregate(series.values, starts, how),
+                    expected.values)
+
+    def test_time_windows(self):
+        '''Test time span windows over an irregular index. Pandas mishandles
+        NaN in variable window min and max, so those are checked against a
+        direct scan of each window.'''
+        values = self.irregular.values
+        for window in ['1H', '5H', '24H', '7D']:
+            starts = rolling.window_starts(self.irregular.index, window)
+            for how in ['sum', 'mean', 'std']:
+                expected = getattr(self.irregular.rolling(window), how)()
+                np.testing.assert_allclose(
+                    rolling.aggregate(values, starts, how), expected.values,
+                    atol=1e-6)
+            for how, func in [('min', np.min), ('max', np.max)]:
+                expected = []
+                for end, start in enumerate(starts):
+                    window_values = values[start:end + 1]
+                    window_values = window_values[~np.isnan(window_values)]
+                    expected.append(func(window_values)
+                                    if len(window_values) else np.nan)
+                np.testing.assert_allclose(
+                    rolling.aggregate(values, starts, how), expected)
+
+    def test_rolling_stats(self):
+        '''Test several windows and statistics in one transformation'''
+        result = tr.rolling_stats.frame(df=self.index, freq={'H': 'Hourly'},
+                                        windows=[24, '7D'],
+                                        how=['mean', 'max'])
+        assert list(result.columns) == ['Hourly_mean_24', 'Hourly_max_24',
+                                        'Hourly_mean_7D', 'Hourly_max_7D']
+        expected = pd.rolling_max(self.hourly['Hourly'], 168, min_periods=1)
+        np.testing.assert_allclose(result['Hourly_max_7D'].values,
+                                   expected.values)
+        pdtest.assert_frame_equal(
+            tr.rolling_sum.frame(df=self.index, window=24,
+                                 freq={'H': 'Hourly'}),
+            pd.rolling_sum(self.hourly, 24, min_periods=0))
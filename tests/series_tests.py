@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Event Series Tests
+
+'''
+from __future__ import print_function, division
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin import transformations as tr
+from mcflyin.series import EventSeries
+from helpers import bursty
+
+
+class testEventSeries(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup bursty events, appended in shuffled batches'''
+        np.random.seed(0)
+        cls.index = bursty(90, 20000)
+        cls.series = EventSeries()
+        shuffled = np.random.permutation(cls.index.asi8)
+        for batch in np.array_split(shuffled, 7):
+            cls.series.append(pd.DatetimeIndex(batch.view('M8[ns]')))
+
+    def test_events(self):
+        '''Test all events are counted'''
+        assert self.series.events == 20000
+        assert self.series.minutes.counts.sum() == 20000
+
+    def test_resample(self):
+        '''Test resampling from the bucket counts'''
+        for freq in [{'T': 'Minutely'}, {'15T': 'Quarterly'},
+                     {'H': 'Hourly'}, {'D': 'Daily'}, {'W': 'Weekly'}]:
+            pdtest.assert_frame_equal(
+                self.series.resample(freq=freq),
+                tr.resample.frame(df=self.index, freq=freq))
+
+    def test_combined_resample(self):
+        '''Test combined resampling from the bucket counts'''
+        freq = [{'H': 'Hourly'}, {'15T': 'Quarterly'}, {'W': 'Weekly'}]
+        resampled = self.series.combined_resample(freq=freq)
+        expected = tr.combined_resample.frame(df=self.index, freq=freq)
+        for name in ['Quarterly', 'Hourly', 'Weekly', 'Combined']:
+            pdtest.assert_frame_equal(resampled[name], expected[name])
+
+    def test_tables(self):
+        '''Test hourly, daily and daily_hours tables'''
+        for how in ['sum', 'mean']:
+            pdtest.assert_frame_equal(self.series.hourly(how=how),
+                                      tr.hourly.frame(df=self.index, how=how))
+            pdtest.assert_frame_equal(self.series.daily(how=how),
+                                      tr.daily.frame(df=self.index, how=how))
+            pdtest.assert_frame_equal(
+                self.series.daily_hours(how=how),
+                tr.daily_hours(df=self.index, how=how))
+
+    def test_forward(self):
+        '''Test projection from the aggregates'''
+        pdtest.assert_frame_equal(self.series.forward(periods=400),
+                                  tr.forward.frame(df=self.index,
+                                                   periods=400))
+
+    def test_max_buckets(self):
+        '''Test appends spanning more than max_buckets are refused'''
+        series = EventSeries(max_buckets=60 * 24)
+        series.append(self.index[:10])
+        for stamps in [[0, 10**12 * 9000], [self.index[0].value + tr.DAY]]:
+            try:
+                series.append(pd.DatetimeIndex(stamps))
+                raise AssertionError('ValueError not raised')
+            except ValueError:
+                pass
+        assert series.events == 10
+        assert series.minutes.counts.sum() == 10
+        assert len(series.minutes.counts) <= 60 * 24
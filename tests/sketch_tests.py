@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Sketch Tests
+
+'''
+from __future__ import print_function, division
+import io
+import json
+import struct
+import numpy as np
+import pandas as pd
+from mcflyin import application
+from mcflyin import ingest
+from mcflyin import transformations as tr
+from mcflyin.sketch import CountMin, Reservoir, Sketch
+from helpers import bursty
+
+
+def covered(exact, estimate, column):
+    '''Share of `exact` values within the bounds of an estimated column'''
+    return ((exact >= estimate[column + '_low']) &
+            (exact <= estimate[column + '_high'])).mean()
+
+
+class testSketch(object):
+
+    @classmethod
+    def setup_class(cls):
+        '''Setup half a million bursty events'''
+        np.random.seed(0)
+        cls.index = bursty(10, 500000)
+
+    def test_reservoir(self):
+        '''Test the sample is bounded, uniform and exact until full'''
+        reservoir = Reservoir(size=1000, seed=0)
+        reservoir.add(np.arange(500))
+        assert len(reservoir) == 500
+        assert (reservoir.sample().asi8 == np.arange(500)).all()
+        for start in range(500, 100000, 9999):
+            reservoir.add(np.arange(start, min(start + 9999, 100000)))
+        assert len(reservoir) == 1000 and reservoir.seen == 100000
+        sample = reservoir.sample().asi8
+        assert len(np.unique(sample)) == 1000
+        assert abs(np.median(sample) - 50000) < 5000
+
+    def test_count_min(self):
+        '''Test count-min estimates never undercount'''
+        counters = CountMin(width=2**8, depth=4, seed=0)
+        items = np.random.randint(0, 5000, 20000)
+        counters.add(items)
+        values, counts = np.unique(items, return_counts=True)
+        estimates = counters.estimate(values)
+        assert (estimates >= counts).all()
+        assert ((estimates - counts) <= counters.error).mean() > 0.95
+        try:
+            CountMin(width=1000)
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
+
+    def test_estimates(self):
+        '''Test sample estimates bound the exact sums'''
+        sketch = Sketch(size=20000, seed=0)
+        for start in range(0, len(self.index), 100000):
+            sketch.append(self.index[start:start + 100000])
+        assert sketch.events == 500000
+        assert sketch.reservoir._sample.nbytes == 20000 * 8
+        hourly = sketch.hourly(how='sum')
+        exact = tr.hourly.frame(df=self.index, how='sum')['Events']
+        assert covered(exact, hourly, 'Events') > 0.8
+        assert abs(hourly['Events'].sum() - 500000) < 1
+        daily = sketch.resample(freq={'D': 'Daily'})
+        exact = tr.resample.frame(df=self.index, freq={'D': 'Daily'})
+        assert covered(exact['Daily'], daily, 'Daily') > 0.8
+        weekly = sketch.daily_hours()
+        exact = tr.daily_hours(df=self.index, how='sum')
+        assert list(weekly.columns[:3]) == [exact.columns[0],
+                                            exact.columns[0] + '_low',
+                                            exact.columns[0] + '_high']
+        try:
+            sketch.daily(how='mean')
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
+
+    def test_keyed(self):
+        '''Test keyed estimates per series from the count-min counters'''
+        keyed = tr.to_keyed({'a': self.index[:30000].tolist(),
+                             'b': self.index[30000:50000].tolist()})
+        sketch = Sketch(width=2**10, seed=0)
+        sketch.append(keyed)
+        exact = tr.hourly.frame(df=keyed, how='sum')
+        estimate = sketch.hourly()
+        assert sorted(estimate) == ['a', 'b']
+        for label in ['a', 'b']:
+            assert (estimate[label]['Events'] >=
+                    exact[label]['Events']).all()
+            assert covered(exact[label]['Events'], estimate[label],
+                           'Events') == 1
+        try:
+            sketch.resample(freq={'T': 'Minutely'})
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
+
+    def test_max_labels(self):
+        '''Test the series label table is bounded'''
+        sketch = Sketch(size=100, width=2**8, max_labels=2)
+        sketch.append(tr.to_keyed({'a': self.index[:10].tolist(),
+                                   'b': self.index[10:20].tolist()}))
+        sketch.append(tr.to_keyed({'b': self.index[20:30].tolist()}))
+        try:
+            sketch.append(tr.to_keyed({'c': self.index[:10].tolist()}))
+            raise AssertionError('ValueError not raised')
+        except ValueError:
+            pass
+        assert sketch.labels == ['a', 'b'] and sketch.events == 30
+
+    def test_max_buckets(self):
+        '''Test the span of sketched events is bounded'''
+        sketch = Sketch(size=100, width=2**8, max_buckets=60 * 30)
+        day = self.index[self.index < self.index[0] + pd.Timedelta('1D')]
+        sketch.append(tr.to_keyed({'a': day.tolist()}))
+        many = dict(('s{0}'.format(i), day[:1].tolist()) for i in range(80))
+        for events in [tr.to_keyed(many), day + pd.Timedelta('5D')]:
+            try:
+                sketch.append(events)
+                raise AssertionError('ValueError not raised')
+            except ValueError:
+                pass
+        assert sketch.labels == ['a'] and sketch.events == len(day)
+        rv = application.app.test_client().post(
+            '/hourly?approximate=true', data=b'0\n9000000000000\n',
+            content_type=ingest.NDJSON)
+        assert rv.status_code == 400
+
+    def test_routes(self):
+        '''Test approximate mode through the transformation routes'''
+        app = application.app.test_client()
+        epoch = self.index.asi8[:50000] // 10**6
+        chunk = epoch.astype('<i8').tostring()
+        body = struct.pack('<I', len(chunk)) + chunk
+        rv = app.post('/hourly?approximate=true', data=body,
+                      content_type=ingest.FRAMES)
+        result = json.loads(rv.data)
+        assert sorted(result) == ['Events', 'Events_high', 'Events_low']
+        rv = app.post('/daily_hours', data={
+            'data': json.dumps(epoch[:1000].tolist()),
+            'approximate': 'true'})
+        assert rv.status_code == 200
+        rv = app.post('/forward', data={
+            'data': json.dumps(epoch[:1000].tolist()),
+            'approximate': 'true'})
+        assert rv.status_code == 400
+        stream = ingest.read(io.BytesIO(body), ingest.FRAMES,
+                             approximate=True)
+        assert isinstance(stream, Sketch) and stream.events == 50000
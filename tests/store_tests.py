@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Dataset Store Tests
+
+'''
+from __future__ import print_function, division
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdtest
+from mcflyin.store import DatasetStore
+
+
+class testDatasetStore(object):
+
+    def setup(self):
+        '''Setup spill directory and indexes'''
+        self.spill_dir = tempfile.mkdtemp()
+        self.indexes = [pd.date_range('6/16/2013', periods=1000, freq='T'),
+                        pd.date_range('6/17/2013', periods=1000, freq='T'),
+                        pd.date_range('6/18/2013', periods=1000, freq='T')]
+
+    def teardown(self):
+        shutil.rmtree(self.spill_dir)
+
+    def test_content_addressed(self):
+        '''Test that identical content maps to one ID'''
+        store = DatasetStore()
+        first = store.put(self.indexes[0])
+        second = store.put(pd.DatetimeIndex(self.indexes[0].values.copy()))
+        assert first == second
+        assert len(store) == 1
+        assert store.nbytes == 8000
+        pdtest.assert_index_equal(store.get(first), self.indexes[0])
+
+    def test_lru_eviction(self):
+        '''Test least recently used datasets are dropped over budget'''
+        store = DatasetStore(max_bytes=16000)
+        ids = [store.put(x) for x in self.indexes[:2]]
+        store.get(ids[0])
+        third = store.put(self.indexes[2])
+        assert ids[0] in store and third in store
+        assert ids[1] not in store
+        assert store.nbytes == 16000
+
+    def test_on_evict(self):
+        '''Test discarded datasets are reported, and spilled ones are not'''
+        evicted = []
+        store = DatasetStore(max_bytes=8000, on_evict=evicted.append)
+        ids = [store.put(x) for x in self.indexes]
+        assert evicted == ids[:2]
+        spilled = []
+        store = DatasetStore(max_bytes=8000, spill_dir=self.spill_dir,
+                             on_evict=spilled.append)
+        for index in self.indexes:
+            store.put(index)
+        assert spilled == []
+
+    def test_spill(self):
+        '''Test evicted datasets are served from memory-mapped files'''
+        store = DatasetStore(max_bytes=8000, spill_dir=self.spill_dir)
+        ids = [store.put(x) for x in self.indexes]
+        assert store.nbytes == 8000
+        for dataset_id, index in zip(ids, self.indexes):
+            pdtest.assert_index_equal(store.get(dataset_id), index)
+        assert isinstance(np.load(store._spilled[ids[0]], mmap_mode='r'),
+                          np.memmap)
+        store.delete(ids[0])
+        assert ids[0] not in store
+
+    def test_concurrent(self):
+        '''Test gets and puts from many threads never lose a dataset'''
+        store = DatasetStore(max_bytes=16000)
+        ids = [store.put(x) for x in self.indexes[:2]]
+        errors = []
+
+        def work():
+            for _ in range(500):
+                try:
+                    store.get(ids[0])
+                    store.put(self.indexes[1])
+                except KeyError as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert store.nbytes == 16000
+        assert len(store) == 2
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+'''
+McFlyin Streaming Response Tests
+
+'''
+from __future__ import print_function, division
+import gzip
+import io
+import json
+import numpy as np
+import pandas as pd
+from mcflyin import application
+from mcflyin import streaming
+from mcflyin import transformations as tr
+
+
+class testStreaming(object):
+
+    def setup(self):
+        '''Setup minute events with gaps, as epoch milliseconds'''
+        np.random.seed(0)
+        start = pd.Timestamp('6/16/2013').value // 10**6
+        self.epoch = start + np.random.randint(0, 14 * 86400000, 20000)
+        self.index = tr.to_index(self.epoch)
+        self.app = application.app.test_client()
+
+    def test_iter_json(self):
+        '''Test sliced JSON matches jsonified, for frames and keyed results'''
+        df = tr.resample.frame(df=self.index, freq={'T': 'Minutely'})
+        assert np.isnan(df['Minutely'].values).any()
+        keyed = tr.to_keyed({'a': self.epoch[:500], 'b': self.epoch[500:]})
+        by_key = tr.daily.frame(df=keyed, how='mean')
+        for result in [df, by_key]:
+            for time_format in ['iso', 'epoch']:
+                body = b''.join(streaming.iter_json(
+                    result, time_format=time_format, slice_size=777))
+                assert json.loads(body.decode('utf-8')) == json.loads(
+                    json.dumps(tr.jsonified(result, time_format)))
+
+    def test_mixed_precision(self):
+        '''Test slices share the ISO precision of the whole index'''
+        stamps = pd.date_range('6/16/2013', periods=100, freq='H').asi8
+        stamps[-1] += 500 * 10**6
+        df = pd.DataFrame({'Events': np.ones(100)},
+                          index=pd.DatetimeIndex(stamps.view('M8[ns]')))
+        body = b''.join(streaming.iter_json(df, slice_size=10))
+        parsed = json.loads(body.decode('utf-8'))
+        assert parsed == json.loads(json.dumps(tr.jsonified(df)))
+        assert parsed['Events']['time'][0] == '2013-06-16T00:00:00.000000'
+
+    def test_compress(self):
+        '''Test gzip compression of a chunk stream'''
+        chunks = [b'spam' * 1000] * 100
+        body = b''.join(streaming.compress(iter(chunks), 'gzip'))
+        assert len(body) < 10000
+        assert gzip.GzipFile(fileobj=io.BytesIO(body)).read() == \
+            b''.join(chunks)
+
+    def test_routes(self):
+        '''Test streamed and compressed responses match the buffered ones'''
+        data = {'data': json.dumps(self.epoch.tolist()),
+                'freq': json.dumps({'T': 'Minutely'})}
+        buffered = self.app.post('/resample', data=data)
+        data['stream'] = json.dumps(True)
+        rv = self.app.post('/resample', data=data)
+        assert 'Content-Encoding' not in rv.headers
+        assert json.loads(rv.data) == json.loads(buffered.data)
+
+        rv = self.app.post('/resample', data=data,
+                           headers={'Accept-Encoding': 'gzip'})
+        assert rv.headers['Content-Encoding'] == 'gzip'
+        body = gzip.GzipFile(fileobj=io.BytesIO(rv.data)).read()
+        assert json.loads(body.decode('utf-8')) == json.loads(buffered.data)
+
+        data['time_format'] = json.dumps('unix')
+        assert self.app.post('/resample', data=data).status_code == 400